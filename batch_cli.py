@@ -0,0 +1,223 @@
+# batch_cli.py
+#
+# Headless-Stapelverarbeitung: erzeugt für alle Events eines Manifests die Teilnehmerliste (PDF),
+# den Erfahrungsbericht (DOCX) und das Abrechnungs-ZIP, ohne die Streamlit-Oberfläche.
+# Unabhängige Events laufen parallel in einem Prozesspool (Standard: Anzahl CPU-Kerne).
+#
+# Ausführung aus dem Hauptverzeichnis:
+#   python batch_cli.py semester.json
+#   python batch_cli.py semester.json --workers 2 --output-dir output/semester
+#
+# Manifest (JSON):
+# {
+#   "output_dir": "output/semester",
+#   "events": [
+#     {
+#       "name": "Stammtisch Oktober",
+#       "date": "15.10.2026", "price": "5,00", "tutors": null,
+#       "participants_csv": "data/teilnehmer.csv",      (oder "sheet_url": "https://docs.google.com/...")
+#       "event_id": null,                                (Standard: sheet_id bzw. "default")
+#       "payments_csv": "zahlungen/paypal_oktober.csv",  (Bank-/PayPal-Export, wird abgeglichen;
+#                                                         alternativ "paid": [...] oder "unpaid": [...];
+#                                                         ohne Angabe: niemand bezahlt)
+#       "report_text": "Freitext ...",                   (oder "report_text_file": "berichte/oktober.txt")
+#       "invoices": ["belege/rechnung1.pdf"], "settlement_form": "belege/abrechnung.pdf",
+#       "zip": true
+#     }
+#   ]
+# }
+
+import os
+import sys
+import json
+import time
+import argparse
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_OUTPUT_DIR = os.path.join("output", "batch")
+REPORT_FILENAME = "batch_report.json"
+
+@dataclass
+class LocalFile:
+    """Lokale Datei in der Form, die create_submission_zip von Upload-Widgets erwartet (name + content_bytes)."""
+    name: str
+    content_bytes: bytes
+
+    @classmethod
+    def from_path(cls, path: str) -> "LocalFile":
+        with open(path, "rb") as f:
+            return cls(os.path.basename(path), f.read())
+
+def safe_event_dirname(event_name: str) -> str:
+    safe_name = "".join(x for x in event_name if x.isalnum() or x in " _-").strip().replace(" ", "_")
+    return safe_name or "Event"
+
+def event_output_dirname(index: int, event_name: str) -> str:
+    """Ordner eines Events: Position im Manifest + Name, damit gleichnamige Events sich nicht überschreiben."""
+    return f"{index + 1:03d}_{safe_event_dirname(event_name)}"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Erzeugt PDFs, Berichte und Abrechnungs-ZIPs für mehrere Events")
+    parser.add_argument("manifest", help="JSON-Manifest mit den Events")
+    parser.add_argument("--output-dir", help="Zielordner (überschreibt output_dir aus dem Manifest)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Parallel verarbeitete Events (Standard: Anzahl CPU-Kerne)")
+    parser.add_argument("--skip-reports", action="store_true", help="Keine Erfahrungsberichte (kein Ollama nötig)")
+    return parser.parse_args(argv)
+
+def load_manifest(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not isinstance(manifest.get("events"), list) or not manifest["events"]:
+        raise ValueError(f"Manifest '{path}' enthält keine Events.")
+    for i, event in enumerate(manifest["events"]):
+        if not event.get("name"):
+            raise ValueError(f"Event #{i + 1} im Manifest hat keinen Namen.")
+        if not event.get("participants_csv") and not event.get("sheet_url"):
+            raise ValueError(f"Event '{event['name']}': 'participants_csv' oder 'sheet_url' fehlt.")
+    return manifest
+
+def _load_participants(event: dict):
+    from modules.sheet_loader import ingest_participant_csv, process_dataframe_for_display
+    if event.get("participants_csv"):
+        with open(event["participants_csv"], "rb") as f:
+            df, _ = ingest_participant_csv(f.read())
+        return df
+    from modules.auth import get_credentials
+    from modules.google_sheets_reader import reload_participants
+    return process_dataframe_for_display(reload_participants(event["sheet_url"], credentials=get_credentials()))
+
+def _with_paid_column(event: dict, participants_df, result: dict):
+    """Teilnehmerliste mit 'Paid'-Spalte (Status pro Zeile) für generate_participant_pdf."""
+    from modules.payment_reconciliation import PAID_COLUMN, load_payment_csv, reconcile_payments
+    if event.get("payments_csv"):
+        with open(event["payments_csv"], "rb") as f:
+            reconciliation = reconcile_payments(participants_df, load_payment_csv(f.read()))
+        result["payments"] = reconciliation.stats
+        if reconciliation.stats["ambiguous"]:
+            result["warnings"].append(f"Zahlungen: {reconciliation.stats['ambiguous']} Teilnehmer mit mehrdeutiger Zahlung "
+                                    f"(nicht als bezahlt markiert): {', '.join(reconciliation.ambiguous_payments['candidates'])}")
+        return reconciliation.with_paid_column(participants_df)
+    # "paid"/"unpaid" aus dem Manifest sind Namenslisten und gelten für alle gleichnamigen Zeilen
+    normalized_names = participants_df["Name"].astype(str).str.strip().str.lower()
+    marked = participants_df.copy()
+    if "paid" in event:
+        marked[PAID_COLUMN] = normalized_names.isin({str(name).strip().lower() for name in event["paid"]}).to_numpy()
+    elif "unpaid" in event:
+        marked[PAID_COLUMN] = (~normalized_names.isin({str(name).strip().lower() for name in event["unpaid"]})).to_numpy()
+    else:
+        marked[PAID_COLUMN] = False
+    return marked
+
+def _report_text(event: dict) -> str:
+    if event.get("report_text_file"):
+        with open(event["report_text_file"], encoding="utf-8") as f:
+            return f.read()
+    return event.get("report_text", "")
+
+def run_event(event: dict, output_dir: str, skip_reports: bool = False, index: int = 0) -> dict:
+    """
+    Erzeugt alle Artefakte eines Events (index = Position im Manifest) in einem eigenen Ordner.
+    Läuft in einem eigenen Prozess; Fehler landen im Ergebnis.
+    """
+    from modules.deduplication import deduplicate_participants
+    from modules.pdf_generator import generate_participant_pdf
+    from modules.signature_store import event_id_for
+
+    start = time.perf_counter()
+    event_dir = os.path.join(output_dir, event_output_dirname(index, event["name"]))
+    os.makedirs(event_dir, exist_ok=True)
+    result = {"event": event["name"], "artifacts": {}, "errors": [], "warnings": [], "participants": 0}
+
+    try:
+        participants_df, _ = deduplicate_participants(_load_participants(event))
+        result["participants"] = len(participants_df)
+        marked_df = _with_paid_column(event, participants_df, result)
+        pdf_path = os.path.join(event_dir, f"Teilnehmerliste_{safe_event_dirname(event['name'])}.pdf")
+        generate_participant_pdf(
+            participants=marked_df.to_dict(orient="records"),
+            filename=pdf_path,
+            event_name=event["name"],
+            event_date=event.get("date"),
+            event_tutors=event.get("tutors"),
+            event_price=event.get("price"),
+            event_id=event.get("event_id") or event_id_for(participants_df),
+        )
+        result["artifacts"]["pdf"] = pdf_path
+    except Exception as e:
+        result["errors"].append(f"PDF: {type(e).__name__} - {e}")
+
+    report_bytes = None
+    report_text = _report_text(event)
+    if report_text and not skip_reports:
+        try:
+            from modules.report_ai_generator import generate_experience_report_docx
+            report_bytes = generate_experience_report_docx(report_text, event["name"])
+            if report_bytes:
+                report_path = os.path.join(event_dir, "Erfahrungsbericht.docx")
+                with open(report_path, "wb") as f:
+                    f.write(report_bytes)
+                result["artifacts"]["report"] = report_path
+            else:
+                result["errors"].append("Bericht: konnte nicht erzeugt werden (Ollama erreichbar?)")
+        except Exception as e:
+            result["errors"].append(f"Bericht: {type(e).__name__} - {e}")
+
+    if event.get("zip", True):
+        try:
+            from modules.submission_handler import create_submission_zip
+            pdf_path = result["artifacts"].get("pdf")
+            zip_path = create_submission_zip(
+                event_name=event["name"],
+                participant_list_file=LocalFile.from_path(pdf_path) if pdf_path else None,
+                invoice_files=[LocalFile.from_path(path) for path in event.get("invoices", [])],
+                settlement_form_file=LocalFile.from_path(event["settlement_form"]) if event.get("settlement_form") else None,
+                experience_report_content=report_bytes,
+                output_dir=event_dir,  # nicht über den gemeinsamen output/-Ordner: Worker würden kollidieren
+            )
+            if zip_path:
+                result["artifacts"]["zip"] = zip_path
+            else:
+                result["errors"].append("ZIP: konnte nicht erstellt werden")
+        except Exception as e:
+            result["errors"].append(f"ZIP: {type(e).__name__} - {e}")
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    manifest = load_manifest(args.manifest)
+    output_dir = args.output_dir or manifest.get("output_dir") or DEFAULT_OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    events = manifest["events"]
+    workers = max(1, min(args.workers, len(events)))
+    print(f"INFO (batch_cli): {len(events)} Event(s) mit {workers} Prozess(en) -> {output_dir}")
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_event, event, output_dir, args.skip_reports, i): i for i, event in enumerate(events)}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:  # z.B. abgestürzter Worker-Prozess
+                result = {"event": events[futures[future]]["name"], "artifacts": {}, "errors": [f"{type(e).__name__} - {e}"]}
+            results.append((futures[future], result))
+            status = "OK" if not result["errors"] else "FEHLER"
+            print(f"{status:6} {result['event']}: {', '.join(result['artifacts']) or 'keine Artefakte'}"
+                  + "".join(f"\n       - {error}" for error in result["errors"])
+                  + "".join(f"\n       ! {warning}" for warning in result.get("warnings", [])))
+
+    results = [result for _, result in sorted(results, key=lambda item: item[0])]
+    report = {"manifest": os.path.abspath(args.manifest), "seconds": time.perf_counter() - start, "events": results}
+    with open(os.path.join(output_dir, REPORT_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    failed = sum(1 for r in results if r["errors"])
+    print(f"INFO (batch_cli): fertig in {report['seconds']:.1f} s, {failed} Event(s) mit Fehlern. "
+          f"Bericht: {os.path.join(output_dir, REPORT_FILENAME)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
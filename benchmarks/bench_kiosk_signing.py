@@ -0,0 +1,130 @@
+# benchmarks/bench_kiosk_signing.py
+#
+# Simuliert N gleichzeitige Kiosk-Sessions (Handys auf derselben page=sign-URL): jede Session holt
+# die Liste der noch offenen Namen (get_unsigned_participants), wählt einen Namen und speichert
+# eine Unterschrift über denselben Pfad wie der Speichern-Button (save_signature).
+# Jede Session bedient ihre eigene Warteschlange (jeder N-te Name); mit --overlap wird gelegentlich
+# ein beliebiger offener Name gewählt, um dieselbe Person auf zwei Kiosks zu simulieren.
+# Gemessen werden Unterschriften (verschiedene Teilnehmer) pro Minute sowie p50/p95 der Zeit pro
+# Unterzeichner; Konflikt-Überschreibungen werden getrennt ausgewiesen.
+#
+# Ausführung aus dem Hauptverzeichnis, z.B.:
+#   python benchmarks/bench_kiosk_signing.py --sessions 8 --participants 300 --backend sqlite
+#   python benchmarks/bench_kiosk_signing.py --backend files --sync   (synchron, ohne Hintergrund-Writer)
+
+import io
+import os
+import sys
+import time
+import contextlib
+import random
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Durchsatz-Benchmark für die Unterschriftenerfassung")
+    parser.add_argument("--sessions", type=int, default=8, help="Anzahl gleichzeitiger Kiosk-Sessions")
+    parser.add_argument("--participants", type=int, default=300, help="Teilnehmer auf der Liste")
+    parser.add_argument("--backend", choices=["files", "sqlite"], default="files")
+    parser.add_argument("--format", choices=["png", "strokes", "bitmap"], default="png")
+    parser.add_argument("--sync", action="store_true", help="Synchron speichern (ohne Hintergrund-Writer)")
+    parser.add_argument("--overlap", type=float, default=0.0,
+                        help="Anteil der Unterzeichner, die eine beliebige offene Person wählen (simulierte Konflikte)")
+    return parser.parse_args()
+
+def make_canvas(rng: np.random.Generator):
+    """Synthetische Unterschrift (RGBA-Array + Fabric.js-Pfad) auf einem 550x250-Canvas."""
+    from PIL import Image, ImageDraw
+    xs = np.linspace(40, 500, 80)
+    phase = rng.uniform(0, 6)
+    path = [["M", 40.0, 150.0]] + [["L", float(x), float(150 + 40 * np.sin(x / 30 + phase))] for x in xs]
+    canvas = Image.new("RGBA", (550, 250), (0, 0, 0, 0))
+    ImageDraw.Draw(canvas).line([(p[1], p[2]) for p in path], fill=(0, 0, 0, 255), width=3, joint="curve")
+    return np.asarray(canvas), {"objects": [{"type": "path", "path": path}]}
+
+def run_session(session_id: int, own_names: set, participants_df, canvases, latencies, lock, overlap: float,
+                save_signature, get_unsigned_participants):
+    rng = random.Random(session_id)
+    submitted = set()  # im Hintergrund-Modus bleiben eingereichte Namen bis zum Schreiben "offen"
+    while True:
+        start = time.perf_counter()
+        unsigned = [name for name in get_unsigned_participants(participants_df) if name not in submitted]
+        own_unsigned = [name for name in unsigned if name in own_names]
+        if not own_unsigned:
+            break
+        if overlap and rng.random() < overlap:
+            name = unsigned[rng.randrange(len(unsigned))]
+        else:
+            name = own_unsigned[0]
+        submitted.add(name)
+        image_data, json_data = canvases[rng.randrange(len(canvases))]
+        save_signature(participants_df, name, image_data, json_data, stroke_width=3, expected_version=None)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+def main():
+    args = parse_args()
+    tmp_dir = tempfile.mkdtemp(prefix="bench_kiosk_")
+    # Store und Writer lesen ihre Konfiguration beim Import; Unterschriften landen im Temp-Ordner
+    os.environ["SIGNATURE_STORE_BACKEND"] = args.backend
+    os.environ["SIGNATURE_DB_PATH"] = os.path.join(tmp_dir, "signatures", "signatures.sqlite3")
+    os.environ["SIGNATURE_FORMAT"] = args.format
+    os.chdir(tmp_dir)
+    sys.path.insert(0, REPO_ROOT)
+    from modules import signature_capture
+    from modules.signature_capture import get_unsigned_participants, save_signature
+    from modules.signature_codec import encode_signature
+    from modules.signature_store import get_signature_store
+    from modules.signature_writer import get_signature_writer
+
+    sync_conflicts = []
+    if args.sync:
+        def save_signature(participants_df, name, image_data, json_data=None, stroke_width=3, expected_version=None):
+            blob = encode_signature(image_data, json_data, stroke_width=stroke_width)
+            sync_conflicts.extend(get_signature_store().save(signature_capture.event_id_for(participants_df), name,
+                                                             blob, expected_version=expected_version))
+
+    participants_df = pd.DataFrame({"Name": [f"Teilnehmer {i:04d}" for i in range(args.participants)]})
+    participants_df.attrs["sheet_id"] = "bench-event"
+    rng = np.random.default_rng(0)
+    canvases = [make_canvas(rng) for _ in range(16)]
+
+    names = participants_df["Name"].tolist()
+    latencies, lock = [], threading.Lock()
+    threads = [threading.Thread(target=run_session, args=(i, set(names[i::args.sessions]), participants_df, canvases,
+                                                          latencies, lock, args.overlap,
+                                                          save_signature, get_unsigned_participants))
+               for i in range(args.sessions)]
+    # Konflikt-Meldungen von Store/Writer nicht in die Benchmark-Ausgabe mischen (gezählt wird über health())
+    store_output = io.StringIO()
+    with contextlib.redirect_stdout(store_output):
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        acknowledged_seconds = time.perf_counter() - start
+        get_signature_writer().flush()
+        durable_seconds = time.perf_counter() - start
+
+    signed = len(get_signature_store().signed_keys("bench-event"))
+    conflicts = len(sync_conflicts) if args.sync else get_signature_writer().health()["conflicts"]
+    lat_ms = np.array(latencies) * 1000
+    mode = "synchron" if args.sync else "Hintergrund-Writer"
+    print(f"Backend: {args.backend} | Format: {args.format} | {mode} | Sessions: {args.sessions} | Teilnehmer: {args.participants}")
+    print(f"Speichervorgänge: {len(latencies)} | unterschrieben: {signed} | "
+          f"Konflikte (parallel erfasst, überschrieben): {conflicts}")
+    print(f"Durchsatz (bestätigt): {signed / acknowledged_seconds * 60:,.0f} Unterschriften/min")
+    print(f"Durchsatz (dauerhaft gespeichert): {signed / durable_seconds * 60:,.0f} Unterschriften/min")
+    print(f"Zeit pro Unterzeichner: p50 {np.percentile(lat_ms, 50):.1f} ms | p95 {np.percentile(lat_ms, 95):.1f} ms | "
+          f"max {lat_ms.max():.1f} ms")
+    print(f"Daten in: {tmp_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_pdf_table.py
+#
+# Misst die Erzeugung der Teilnehmerlisten-PDF (generate_participant_pdf) für 100, 1 000 und 10 000
+# Teilnehmer, davon ein Teil mit Unterschrift und einige mit sehr langen Namen. Zusätzlich wird ein
+# erneuter Aufruf ohne Änderungen gemessen (Treffer im Dokument-Cache).
+# Die Unterschriften liegen in einer temporären SQLite-Datenbank, nicht im signatures/-Ordner.
+#
+# Ausführung aus dem Hauptverzeichnis (Schriften und Logo werden relativ dazu geladen):
+#   python benchmarks/bench_pdf_table.py
+#   python benchmarks/bench_pdf_table.py --sizes 100 1000 --signed-share 0.5
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Laufzeit-Benchmark für die Teilnehmerlisten-PDF")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--signed-share", type=float, default=0.3, help="Anteil Teilnehmer mit Unterschrift")
+    parser.add_argument("--repeats", type=int, default=3)
+    return parser.parse_args()
+
+def make_participants(n: int, rng: np.random.Generator) -> list:
+    countries = ["Germany", "Spain", "Italy", "France", "USA", "India", "China", "Brazil"]
+    types = ["Erasmus (Hochschule München!)", "Other (Hochschule München!)", "Tutor", "Full-time student"]
+    participants = []
+    for i in range(n):
+        name = f"Vorname{i} Nachname{i}"
+        if i % 25 == 0:
+            name = f"Maximiliane Anastasia Ferrer Casamayor de la Fuente-Núñez {i}"
+        participants.append({"Name": name, "Mobile": f"+49151{i:07d}", "Country": countries[rng.integers(len(countries))],
+                             "Type": types[rng.integers(len(types))], "Email": f"person{i}@hm.edu"})
+    return participants
+
+def make_signature_blob(rng: np.random.Generator) -> bytes:
+    from PIL import Image, ImageDraw
+    from modules.signature_codec import encode_signature
+    canvas = Image.new("RGBA", (550, 250), (0, 0, 0, 0))
+    xs = np.linspace(40, 500, 80)
+    phase = rng.uniform(0, 6)
+    ImageDraw.Draw(canvas).line([(x, 150 + 40 * np.sin(x / 30 + phase)) for x in xs], fill=(0, 0, 0, 255), width=3)
+    return encode_signature(np.asarray(canvas))
+
+def main():
+    args = parse_args()
+    tmp_dir = tempfile.mkdtemp(prefix="bench_pdf_")
+    os.environ["SIGNATURE_STORE_BACKEND"] = "sqlite"
+    os.environ["SIGNATURE_DB_PATH"] = os.path.join(tmp_dir, "signatures.sqlite3")
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+    from modules.pdf_generator import clear_pdf_caches, generate_participant_pdf
+    from modules.signature_store import get_signature_store
+
+    rng = np.random.default_rng(0)
+    store = get_signature_store()
+    blobs = [make_signature_blob(rng) for _ in range(16)]
+    for size in args.sizes:
+        event_id = f"bench-{size}"
+        participants = make_participants(size, rng)
+        signed = participants[:int(size * args.signed_share)]
+        store.save_many([(event_id, p["Name"], blobs[i % len(blobs)], None) for i, p in enumerate(signed)])
+        paid = [p["Name"] for p in participants[::2]]
+
+        def generate():
+            start = time.perf_counter()
+            pdf_bytes = generate_participant_pdf(participants, event_name="Welcome Week", event_date="01.10.2026",
+                                                 event_price="5,00", paid_list=paid, event_id=event_id)
+            return time.perf_counter() - start, pdf_bytes
+
+        timings, pdf_bytes = [], b""
+        for _ in range(args.repeats):
+            # Ohne Dokument-Cache messen, sonst wäre jeder weitere Lauf ein Cache-Treffer
+            clear_pdf_caches()
+            seconds, pdf_bytes = generate()
+            timings.append(seconds)
+        unchanged_seconds, _ = generate()
+        print(f"{size:>6} Teilnehmer ({len(signed)} unterschrieben): "
+              f"bester Lauf {min(timings):.2f} s | erster Lauf {timings[0]:.2f} s | "
+              f"unverändert erneut {unchanged_seconds * 1000:.1f} ms | {len(pdf_bytes) / 1024:,.0f} KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_process_dataframe.py
+#
+# Misst Laufzeit und Spitzen-Speicher von process_dataframe_for_display für 1k, 10k und 100k Zeilen.
+# Ausführung aus dem Hauptverzeichnis: python benchmarks/bench_process_dataframe.py
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.sheet_loader import process_raw_dataframe, process_dataframe_for_display
+
+SIZES = [1_000, 10_000, 100_000]
+REPEATS = 5
+
+def make_raw_responses(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """Erzeugt einen rohen DataFrame im Format der Google-Formular-Antworten."""
+    rng = np.random.default_rng(seed)
+    countries = np.array(["Germany", "Spain", "Italy", "France", "USA", "India", "China", "Brazil"])
+    types = np.array(["Erasmus (Hochschule München!)", "Other (Hochschule München!)", "Tutor"])
+    ids = np.arange(n_rows).astype(str)
+    return pd.DataFrame({
+        "Zeitstempel": np.full(n_rows, "01.10.2025 12:00:00", dtype=object),
+        "This event will cost you 5€": np.full(n_rows, "Okay - 5€", dtype=object),
+        "First Name": np.char.add("Vorname", ids).astype(object),
+        "Last Name": np.char.add("Nachname", ids).astype(object),
+        "Country of Origin": countries[rng.integers(0, len(countries), n_rows)].astype(object),
+        "Phone Number": np.char.add("+49151", ids).astype(object),
+        "Do you have a Deutschlandticket for the month the event takes place?": np.full(n_rows, "Yes", dtype=object),
+        "Exchange Type": types[rng.integers(0, len(types), n_rows)].astype(object),
+        "E-Mail-Adresse": np.char.add(np.char.add("person", ids), "@hm.edu").astype(object),
+    })
+
+def legacy_process(input_df: pd.DataFrame) -> pd.DataFrame:
+    """Referenz: die frühere Implementierung (Kopie + astype pro Spalte), zum Vergleich."""
+    final_return_cols = ['Name', 'Mobile', 'Country', 'Type', 'Email']
+    df = input_df.copy()
+    source_to_target_map = {'First Name': 'First Name', 'Last Name': 'Last Name', 'Phone Number': 'Mobile',
+                            'Country of Origin': 'Country', 'Exchange Type': 'Type', 'E-Mail-Adresse': 'Email'}
+    for source_col in source_to_target_map.keys():
+        if source_col in df.columns:
+            df[source_col] = df[source_col].astype(str).fillna('')
+        else:
+            df[source_col] = pd.Series([''] * len(df), dtype=str, index=df.index)
+    df_processed = pd.DataFrame(index=df.index)
+    df_processed['Name'] = (df['First Name'] + " " + df['Last Name']).str.strip()
+    df_processed['Mobile'] = df.get('Phone Number', pd.Series([''] * len(df), dtype=str, index=df.index)).astype(str).fillna('')
+    df_processed['Country'] = df['Country of Origin']
+    df_processed['Type'] = df['Exchange Type']
+    df_processed['Email'] = df['E-Mail-Adresse']
+    return df_processed[final_return_cols]
+
+def measure(func, df: pd.DataFrame) -> tuple[float, float]:
+    """Gibt (beste Laufzeit in ms, Spitzen-Speicher in MB) zurück."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(df)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1_000_000
+
+if __name__ == "__main__":
+    print(f"{'Zeilen':>8} | {'Variante':<22} | {'Zeit (ms)':>10} | {'Peak (MB)':>9} | {'Ergebnis (MB)':>13}")
+    print("-" * 75)
+    for n_rows in SIZES:
+        raw_df = make_raw_responses(n_rows)
+        raw_df.attrs["revision"] = f"bench:{n_rows}"
+        for label, func in [("alt (Referenz)", legacy_process),
+                            ("neu, ungecacht", process_raw_dataframe),
+                            ("neu, Cache-Treffer", process_dataframe_for_display)]:
+            if func is process_dataframe_for_display:
+                func(raw_df)  # Cache aufwärmen
+            elapsed_ms, peak_mb = measure(func, raw_df)
+            result_mb = func(raw_df).memory_usage(deep=True).sum() / 1_000_000
+            print(f"{n_rows:>8} | {label:<22} | {elapsed_ms:>10.2f} | {peak_mb:>9.2f} | {result_mb:>13.2f}")
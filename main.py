@@ -14,10 +14,17 @@ from PIL import Image
 from modules.auth import authenticate_google, get_credentials
 from modules.signature_capture import capture_signature 
 from modules.pdf_generator import generate_participant_pdf 
-from modules.sheet_loader import process_dataframe_for_display 
+from modules.signature_store import event_id_for
+from modules.signature_writer import get_signature_writer
+from modules.signature_sync import sync_signatures_to_drive, restore_signatures_from_drive
+from modules.signature_registry import safe_signature_name
+from modules.sheet_loader import process_dataframe_for_display, ingest_participant_csv, csv_content_hash 
 from modules.qr_generator import generate_custom_qr_code_base64
-from modules.google_sheets_reader import load_participants_from_google_sheet, extract_sheet_id
+from modules.google_sheets_reader import get_participants_cached, reload_participants, get_participant_cache_stats, extract_sheet_id
+from modules.deduplication import deduplicate_participants
+from modules.payment_reconciliation import PAID, load_payment_csv, payments_from_sheet_column, guess_payment_column, reconcile_payments
 from modules.form_creator import create_form_final_version_with_drive_title
+from modules.google_services import clear_service_cache
 from modules.submission_handler import create_submission_zip, upload_zip_to_drive, send_email_notification 
 from modules.report_ai_generator import generate_experience_report_docx 
 
@@ -29,6 +36,12 @@ def local_css(file_name):
     except FileNotFoundError:
         st.warning(f"Warnung: CSS-Datei '{file_name}' nicht gefunden.")
 
+def set_participants_list(df_processed, sheet_url=None):
+    """Übernimmt eine geladene Liste in die Session und baut dabei den Duplikat-Index (gecacht pro Revision)."""
+    st.session_state.participants_df = df_processed
+    st.session_state.participants_sheet_url = sheet_url
+    deduplicate_participants(df_processed)
+
 st.set_page_config(page_title="International Club - Eventtool", page_icon="🎓", layout="wide")
 local_css("style.css")
 load_dotenv()
@@ -51,7 +64,8 @@ if page_param == "sign":
         with st.spinner("Lade Teilnehmerdaten..."):
             try:
                 # Dieser Aufruf MUSS OHNE Credentials funktionieren, d.h. das Sheet muss öffentlich lesbar sein.
-                df_raw = load_participants_from_google_sheet(sheet_url, credentials=None)
+                # Prozessweit gecacht und inkrementell: alle Kiosk-Sessions teilen sich einen Request.
+                df_raw = get_participants_cached(sheet_url, credentials=None)
                 if not df_raw.empty:
                     df_processed = process_dataframe_for_display(df_raw)
                     capture_signature(df_processed)
@@ -72,10 +86,25 @@ if not creds:
 # --- HAUPTANWENDUNG (Wird nur angezeigt, wenn der Nutzer angemeldet ist) ---
 # ==============================================================================
 
+# --- TEILNEHMERLISTE: LOKALER SNAPSHOT + ABGLEICH IM HINTERGRUND ---
+# Ist in dieser Session ein Sheet geladen, liefert der prozessweite Cache (pro Konto) bei jedem
+# Rerun den aktuellen Stand, der im Hintergrund synchronisiert wird.
+if 'participants_sheet_url' not in st.session_state:
+    st.session_state.participants_sheet_url = None
+if st.session_state.participants_sheet_url:
+    try:
+        synced_df = get_participants_cached(st.session_state.participants_sheet_url, credentials=creds)
+        if not synced_df.empty and synced_df.attrs.get("revision") != st.session_state.participants_df.attrs.get("revision"):
+            set_participants_list(process_dataframe_for_display(synced_df), st.session_state.participants_sheet_url)
+    except Exception as e:
+        print(f"WARNUNG (main): Abgleich der Teilnehmerliste fehlgeschlagen: {e}")
+
 # --- Sidebar ---
 st.sidebar.image(os.path.join("data", "I-CLUB_LOGO_Sidebar.png"), use_container_width=True)
 st.sidebar.success("✅ Angemeldet")
 if st.sidebar.button("Abmelden"):
+    # Nur die Clients dieses Kontos verwerfen, andere Sessions bleiben angemeldet
+    clear_service_cache(creds)
     if 'google_credentials' in st.session_state:
         del st.session_state['google_credentials']
     st.query_params.clear()
@@ -190,6 +219,31 @@ elif menu_selection == "✍️ Unterschriften sammeln & QR":
                     except Exception as e: st.error(f"Fehler QR: {e}")
             else: st.warning("Bitte Link zum Google Sheet eingeben!")
 
+        with st.expander("Kiosk-Cache Statistik"):
+            cache_stats = get_participant_cache_stats()
+            st.caption(f"TTL: {cache_stats['ttl_seconds']:.0f} s · Einträge: {cache_stats['entries']}")
+            col_hits, col_stale, col_misses, col_coalesced = st.columns(4)
+            col_hits.metric("Hits", cache_stats["hits"])
+            col_stale.metric("Stale Hits", cache_stats["stale_hits"])
+            col_misses.metric("Misses", cache_stats["misses"])
+            col_coalesced.metric("Zusammengelegt", cache_stats["coalesced"])
+            writer_health = get_signature_writer().health()
+            st.caption(f"Unterschriften-Writer ({writer_health['backend']}): "
+                       f"{writer_health['written']} gespeichert · {writer_health['queued']} in Queue · "
+                       f"{writer_health['failed']} fehlgeschlagen"
+                       + ("" if writer_health["worker_alive"] else " · ⚠️ Writer-Thread gestoppt"))
+            if writer_health["last_error"]:
+                st.warning(f"Letzter Speicherfehler: {writer_health['last_error']}")
+            if "replayed_dead_letters" in st.session_state:
+                st.success(f"{st.session_state.pop('replayed_dead_letters')} Unterschrift(en) nachträglich gespeichert.")
+            # Zählt die Dateien, die aktuell im Dead-Letter-Ordner liegen: nach erfolgreichem Nachspeichern verschwindet der Hinweis
+            if writer_health["dead_letter"]:
+                st.warning(f"{writer_health['dead_letter']} Unterschrift(en) konnten nicht gespeichert werden "
+                           f"und liegen in '{get_signature_writer().dead_letter_dir}'.")
+                if st.button("Abgelegte Unterschriften erneut speichern", key="replay_dead_letters_btn"):
+                    st.session_state.replayed_dead_letters = get_signature_writer().replay_dead_letters()
+                    st.rerun()
+
     with tab_sign_admin_view:
         st.markdown("#### Unterschriften erfassen/verwalten (Admin-Ansicht)")
         st.info("Diese Ansicht ist für Organisatoren gedacht und zeigt das normale App-Layout.")
@@ -204,9 +258,9 @@ elif menu_selection == "✍️ Unterschriften sammeln & QR":
                     if admin_sheet_id:
                         admin_sheet_url = f"https://docs.google.com/spreadsheets/d/{admin_sheet_id}/edit"
                         with st.spinner("Lade Teilnehmer..."):
-                            df_temp = load_participants_from_google_sheet(admin_sheet_url)
+                            df_temp = reload_participants(admin_sheet_url, credentials=creds)
                             if not df_temp.empty:
-                                st.session_state.participants_df = process_dataframe_for_display(df_temp)
+                                set_participants_list(process_dataframe_for_display(df_temp), admin_sheet_url)
                                 st.success("Teilnehmerliste für Admin-Ansicht geladen.")
                                 st.rerun()
                             else: st.error("Konnte keine Daten laden.")
@@ -214,6 +268,29 @@ elif menu_selection == "✍️ Unterschriften sammeln & QR":
                 else: st.warning("Bitte Link eingeben.")
         
         if 'participants_df' in st.session_state and not st.session_state.participants_df.empty:
+            with st.expander("☁️ Unterschriften in Google Drive sichern"):
+                sync_event_id = event_id_for(st.session_state.participants_df)
+                st.caption(f"Event: {sync_event_id} · Nur neue oder geänderte Unterschriften werden hochgeladen.")
+                col_sync, col_restore = st.columns(2)
+                if col_sync.button("In Drive sichern", key="btn_signature_drive_sync"):
+                    try:
+                        get_signature_writer().flush(timeout=10)
+                        with st.spinner("Gleiche Unterschriften mit Google Drive ab..."):
+                            sync_report = sync_signatures_to_drive(
+                                sync_event_id, credentials=creds,
+                                participant_keys={safe_signature_name(name) for name in st.session_state.participants_df["Name"].dropna()})
+                        st.success(f"✅ {sync_report['uploaded']} hochgeladen, {sync_report['unchanged']} unverändert "
+                                   f"({sync_report['requests']} Drive-Requests, {sync_report['seconds']:.1f} s).")
+                    except Exception as e: st.error(f"Fehler beim Drive-Sync: {type(e).__name__} - {e}")
+                if col_restore.button("Aus Drive wiederherstellen", key="btn_signature_drive_restore"):
+                    try:
+                        with st.spinner("Lade Unterschriften aus Google Drive..."):
+                            restore_report = restore_signatures_from_drive(sync_event_id, credentials=creds)
+                        st.success(f"✅ {restore_report['restored']} wiederhergestellt, "
+                                   f"{restore_report['skipped']} bereits vorhanden.")
+                        if restore_report["missing"]:
+                            st.warning(f"{restore_report['missing']} Unterschrift(en) im Drive-Manifest, aber nicht lesbar.")
+                    except Exception as e: st.error(f"Fehler beim Wiederherstellen: {type(e).__name__} - {e}")
             capture_signature(st.session_state.participants_df) 
         else:
             st.info("Bitte Teilnehmerliste laden, um Unterschriften zu erfassen/verwalten.")
@@ -237,9 +314,9 @@ elif menu_selection == "📄 Teilnehmerliste & PDF Management":
             if sheet_link_import:
                 with st.spinner("Lade und verarbeite Daten von Google Sheets..."):
                     try:
-                        temp_df_google = load_participants_from_google_sheet(sheet_link_import) 
+                        temp_df_google = reload_participants(sheet_link_import, credentials=creds) 
                         if not temp_df_google.empty:
-                            st.session_state.participants_df = process_dataframe_for_display(temp_df_google)
+                            set_participants_list(process_dataframe_for_display(temp_df_google), sheet_link_import)
                             st.success("✅ Teilnehmerliste erfolgreich geladen!")
                             st.rerun()
                         else:
@@ -258,11 +335,22 @@ elif menu_selection == "📄 Teilnehmerliste & PDF Management":
         )
         if uploaded_csv_file is not None:
             try:
-                with st.spinner("Verarbeite hochgeladene CSV..."):
-                    df_from_upload = pd.read_csv(uploaded_csv_file, dtype=str).fillna('')
-                    st.session_state.participants_df = process_dataframe_for_display(df_from_upload)
+                csv_bytes = uploaded_csv_file.getvalue()
+                # Das Upload-Widget behält die Datei über Reruns hinweg -> nur neue Inhalte einlesen.
+                if st.session_state.get("ingested_csv_hash") != csv_content_hash(csv_bytes):
+                    with st.spinner("Verarbeite hochgeladene CSV..."):
+                        df_from_upload, csv_stats = ingest_participant_csv(csv_bytes)
+                        set_participants_list(df_from_upload)
+                        st.session_state.ingested_csv_hash = csv_stats["content_hash"]
+                        st.session_state.csv_ingest_stats = csv_stats
+                        st.rerun()
+                else:
+                    csv_stats = st.session_state.get("csv_ingest_stats", {})
                     st.success("✅ Teilnehmerliste erfolgreich aus CSV verarbeitet!")
-                    st.rerun()
+                    if csv_stats:
+                        st.caption(f"{csv_stats['rows']} Zeilen in {csv_stats['seconds']:.2f} s "
+                                   f"({csv_stats['rows_per_second']:,.0f} Zeilen/s)"
+                                   + (" · bereits zuvor eingelesen" if csv_stats.get("cached") else ""))
             except Exception as e:
                 st.error(f"Fehler beim Verarbeiten der CSV: {e}")
 
@@ -277,33 +365,58 @@ elif menu_selection == "📄 Teilnehmerliste & PDF Management":
         st.markdown("---")
         st.subheader("Schritt 2: PDF Teilnehmerliste erstellen")
 
-        df_for_pdf = st.session_state.participants_df.copy()
-        
-        # Duplikatentfernung
-        num_before = len(df_for_pdf)
-        df_for_pdf.drop_duplicates(subset=['Name', 'Email'], keep='first', inplace=True)
-        num_after = len(df_for_pdf)
-        if num_before > num_after:
-            st.info(f"{num_before - num_after} Duplikat(e) entfernt. PDF wird mit {num_after} eindeutigen Teilnehmern erstellt.")
-
-        # === Logik für die "Paid"-Liste ===
-        unpaid_list = [
-            "Ginny Lin", "YunYen Chang", "Matteo Paladini", "Max Theriot", 
-            "Juan Esteban Alvarez Garcia", "Hoang Ha Luong", "Tara Ivers", 
-            "Thomas Knörzer", "Federico  Tovoli", "Mingyu Kim", "Alberto Dávila Rodríguez", 
-            "Julius Krüger", "Lucía Núñez", "Donovan Mougenot", "Tobias Billow", 
-            "Zhibek Abdykalykova", "Anthony Dulon", "Cemre Saltan", "Carolina  Ahrens ", 
-            "süeda barut", "Grace O Connor", "Jordan Benefield", "Anastasiia Burdym", 
-            "Moritz Kraus", "Alexandra Lapunova", "Anika Hochreiter", "Hugo Talens", 
-            "Barbara Borsini", "Jimmy Tan", "Adrià Ferrer Casamayor", "Paula Lorente", "Matteo  Paladini"
-        ]
-        normalized_unpaid_set = {name.strip().lower() for name in unpaid_list}
-        all_participant_names = df_for_pdf['Name'].tolist()
-        paid_list = [
-            name for name in all_participant_names 
-            if name.strip().lower() not in normalized_unpaid_set
-        ]
-        
+        # Duplikatentfernung (normalisierte Name/E-Mail-Schlüssel, gecacht pro Listen-Revision)
+        fuzzy_dedup = st.checkbox("Ähnliche Namen ebenfalls als Duplikate behandeln (unscharfer Abgleich)", key="pdf_fuzzy_dedup")
+        df_for_pdf, num_removed = deduplicate_participants(st.session_state.participants_df, fuzzy=fuzzy_dedup)
+        if num_removed:
+            st.info(f"{num_removed} Duplikat(e) entfernt. PDF wird mit {len(df_for_pdf)} eindeutigen Teilnehmern erstellt.")
+
+        # === "Paid"-Spalte: Abgleich mit Zahlungsdaten, Status pro Zeile (gleichnamige Teilnehmer bleiben getrennt) ===
+        with st.expander("💶 Zahlungsabgleich (Bank-/PayPal-Export oder Spalte der Antworttabelle)", expanded=True):
+            payment_sources = ["Zahlungsdatei (CSV)", "Spalte im Google Sheet", "Keine Zahlungsdaten"]
+            payment_source = st.radio("Quelle der Zahlungen", payment_sources, horizontal=True, key="payment_source")
+            payments_df = None
+            try:
+                if payment_source == payment_sources[0]:
+                    payment_file = st.file_uploader("Bank- oder PayPal-Export", type=["csv"], key="payment_csv_upload")
+                    if payment_file is not None:
+                        payments_df = load_payment_csv(payment_file.getvalue())
+                elif payment_source == payment_sources[1]:
+                    payment_sheet_url = st.session_state.get("participants_sheet_url")
+                    if not payment_sheet_url:
+                        st.info("Nur verfügbar, wenn die Teilnehmerliste aus einem Google Sheet geladen wurde.")
+                    else:
+                        raw_sheet_df = get_participants_cached(payment_sheet_url, credentials=creds)
+                        sheet_columns = [str(col) for col in raw_sheet_df.columns]
+                        guessed_column = guess_payment_column(sheet_columns)
+                        payment_column = st.selectbox("Spalte mit Zahlungsstatus (z.B. 'ja' / 'x')", sheet_columns,
+                                                      index=sheet_columns.index(guessed_column) if guessed_column else 0,
+                                                      key="payment_sheet_column")
+                        payments_df = payments_from_sheet_column(raw_sheet_df, payment_column)
+            except Exception as e:
+                st.error(f"Zahlungsdaten konnten nicht gelesen werden: {type(e).__name__} - {e}")
+
+            if payments_df is not None:
+                reconciliation = reconcile_payments(df_for_pdf, payments_df)
+                df_for_pdf = reconciliation.with_paid_column(df_for_pdf)
+                stats = reconciliation.stats
+                st.caption(f"{stats['payments']} Zahlung(en) · {stats['paid']} von {stats['participants']} Teilnehmern bezahlt"
+                           + (f" · {stats['skipped_rows']} stornierte/ausstehende Zeile(n) ignoriert" if stats['skipped_rows'] else ""))
+                if stats["ambiguous"]:
+                    st.warning(f"{stats['ambiguous']} Teilnehmer mit mehrdeutiger Zahlung (bitte prüfen, nicht als bezahlt markiert):")
+                    st.dataframe(reconciliation.ambiguous_payments)
+                if stats["unmatched_payments"]:
+                    st.info(f"{stats['unmatched_payments']} Zahlung(en) ohne passenden Teilnehmer:")
+                    st.dataframe(reconciliation.unmatched_payments)
+                if stats["multiple_payments"]:
+                    st.info(f"{stats['multiple_payments']} Teilnehmer haben mehr als einmal bezahlt.")
+                st.dataframe(reconciliation.participants[reconciliation.participants["payment_status"] != PAID])
+            else:
+                # Kein stiller Wechsel: ohne Zahlungsdaten bleibt die Spalte "Paid" für alle leer
+                st.warning("Keine Zahlungsdaten geladen: In der PDF wird niemand als bezahlt markiert."
+                           + ("" if payment_source == payment_sources[2]
+                              else " Bitte Zahlungsdaten hochladen bzw. auswählen oder 'Keine Zahlungsdaten' wählen."))
+
         # UI für PDF-Details
         col_pdf1, col_pdf2 = st.columns(2)
         with col_pdf1:
@@ -316,48 +429,34 @@ elif menu_selection == "📄 Teilnehmerliste & PDF Management":
             
         if st.button("PDF generieren", key="btn_create_pdf_with_paid_logic"):
             try:
+                # Im Hintergrund eingereihte Unterschriften zuerst schreiben, damit sie in der PDF landen
+                if not get_signature_writer().flush(timeout=10):
+                    st.warning("Einige Unterschriften werden noch gespeichert und fehlen evtl. in der PDF.")
                 participants_list_for_pdf = df_for_pdf.to_dict(orient="records")
-                pdf_filename = os.path.join("output", f"Teilnehmerliste_{pd.Timestamp.now().strftime('%Y%m%d%H%M')}.pdf")
+                pdf_filename = f"Teilnehmerliste_{pd.Timestamp.now().strftime('%Y%m%d%H%M')}.pdf"
                 
-                generate_participant_pdf(
+                # PDF entsteht im Arbeitsspeicher und geht direkt an den Download-Button (kein output/-Umweg)
+                pdf_bytes = generate_participant_pdf(
                     participants=participants_list_for_pdf, 
-                    filename=pdf_filename, 
                     event_name=pdf_event_name,
                     event_date=pdf_event_date, 
                     event_tutors=pdf_tutors, 
                     event_price=pdf_price,
-                    paid_list=paid_list 
+                    event_id=event_id_for(df_for_pdf)
                 )
-                st.success(f"✅ PDF '{os.path.basename(pdf_filename)}' erstellt!")
-                with open(pdf_filename, "rb") as fp:
-                    st.download_button("Download PDF", fp, os.path.basename(pdf_filename), "application/pdf")
+                st.success(f"✅ PDF '{pdf_filename}' erstellt!")
+                st.download_button("Download PDF", pdf_bytes, pdf_filename, "application/pdf")
             except Exception as e:
                 st.error(f"PDF Fehler: {type(e).__name__} - {e}")
     else:
         st.info("Die Teilnehmerliste ist leer. Bitte lade zuerst eine Liste.")
 
-        df_for_pdf_display = st.session_state.participants_df.copy()
-        
         # --- DUPLIKATENTFERNUNG FÜR DIE ANZEIGE UND PDF ---
-        num_before_dedup = len(df_for_pdf_display)
-        if 'Name' in df_for_pdf_display.columns and 'Email' in df_for_pdf_display.columns:
-            print(f"DEBUG (PDF): Entferne Duplikate basierend auf Name und Email. Vorher: {num_before_dedup} Zeilen")
-            df_for_pdf_display.drop_duplicates(subset=['Name', 'Email'], keep='first', inplace=True)
-            num_after_dedup = len(df_for_pdf_display)
-            if num_before_dedup > num_after_dedup:
-                 st.info(f"{num_before_dedup - num_after_dedup} Duplikat(e) entfernt. Finale PDF mit {num_after_dedup} eindeutigen Teilnehmern (basierend auf Name & Email).")
-            else:
-                st.info(f"Keine Duplikate (basierend auf Name & Email) gefunden. PDF mit {num_after_dedup} Teilnehmern.")
-            print(f"DEBUG (PDF): Nach Duplikatentfernung (Name & Email): {num_after_dedup} Zeilen")
-        elif 'Name' in df_for_pdf_display.columns: # Fallback, falls 'Email' nicht da ist
-            print(f"WARNUNG (PDF): Email-Spalte nicht im DataFrame. Duplikate nur nach Name entfernt (potenziell ungenau).")
-            df_for_pdf_display.drop_duplicates(subset=['Name'], keep='first', inplace=True)
-            num_after_dedup = len(df_for_pdf_display)
-            if num_before_dedup > num_after_dedup:
-                st.info(f"{num_before_dedup - num_after_dedup} Duplikat(e) (nur nach Name) entfernt. Finale PDF mit {num_after_dedup} Teilnehmern.")
-            else:
-                 st.info(f"Keine Duplikate (nur nach Name) gefunden. PDF mit {num_after_dedup} Teilnehmern.")
-            print(f"DEBUG (PDF): Nach Duplikatentfernung (nur Name): {num_after_dedup} Zeilen")
+        df_for_pdf_display, num_removed_dedup = deduplicate_participants(st.session_state.participants_df)
+        if num_removed_dedup:
+            st.info(f"{num_removed_dedup} Duplikat(e) entfernt. Finale PDF mit {len(df_for_pdf_display)} eindeutigen Teilnehmern (basierend auf Name & Email).")
+        else:
+            st.info(f"Keine Duplikate (basierend auf Name & Email) gefunden. PDF mit {len(df_for_pdf_display)} Teilnehmern.")
 
         st.info(f"PDF wird für {len(df_for_pdf_display)} eindeutige(n) Teilnehmer erstellt.")
         
@@ -381,18 +480,19 @@ elif menu_selection == "📄 Teilnehmerliste & PDF Management":
 
         if st.button("PDF erstellen mit eindeutigen Teilnehmern", key="btn_create_pdf_dedup_v1"):
             try:
+                get_signature_writer().flush(timeout=10)
                 participants_list = df_for_pdf_display.to_dict(orient="records")
                 
                 event_prefix = "".join(filter(str.isalnum, pdf_event_name or "Event"))
-                pdf_filename = os.path.join("output", f"Teilnehmerliste_{event_prefix}_{pd.Timestamp.now().strftime('%Y%m%d%H%M')}.pdf")
+                pdf_filename = f"Teilnehmerliste_{event_prefix}_{pd.Timestamp.now().strftime('%Y%m%d%H%M')}.pdf"
                 
-                generate_participant_pdf(
-                    participants_list, filename=pdf_filename, event_name=pdf_event_name,
-                    event_date=pdf_event_date, event_tutors=pdf_event_tutors, event_price=pdf_event_price
+                pdf_bytes = generate_participant_pdf(
+                    participants_list, event_name=pdf_event_name,
+                    event_date=pdf_event_date, event_tutors=pdf_event_tutors, event_price=pdf_event_price,
+                    event_id=event_id_for(df_for_pdf_display)
                 )
                 st.success(f"✅ PDF: '{pdf_filename}' erstellt!");
-                with open(pdf_filename, "rb") as fp_pdf:
-                    st.download_button("Download PDF", fp_pdf, os.path.basename(pdf_filename), "application/pdf", key="dl_pdf_dedup_v1")
+                st.download_button("Download PDF", pdf_bytes, pdf_filename, "application/pdf", key="dl_pdf_dedup_v1")
             except Exception as e: 
                 st.error(f"PDF Fehler: {type(e).__name__} - {e}")
                 print(f"FEHLER (PDF Erstellung): {e}")
@@ -0,0 +1,131 @@
+# modules/deduplication.py
+
+import difflib
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+
+from modules.sheet_loader import revision_cache_key
+
+# Mindest-Ähnlichkeit der normalisierten Namen für die unscharfe Duplikaterkennung
+FUZZY_NAME_THRESHOLD = 0.9
+# Länge des Namenspräfixes für das Blocking
+NAME_PREFIX_BLOCK_LENGTH = 3
+# Größere Blöcke (z.B. alle @hm.edu-Adressen) werden übersprungen, damit der Aufwand
+# nahezu linear bleibt; solche Fälle decken die Namenspräfix-Blöcke ab.
+FUZZY_MAX_BLOCK_SIZE = 200
+DEDUP_CACHE_MAX_ENTRIES = 32
+
+_dedup_cache = OrderedDict()
+_dedup_cache_lock = threading.Lock()
+
+def normalize_key(value) -> str:
+    """NFKC, casefold und zusammengefasster Leerraum: 'Matteo  Paladini ' -> 'matteo paladini'."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return " ".join(unicodedata.normalize("NFKC", str(value)).casefold().split())
+
+def normalized_key_series(series: pd.Series) -> pd.Series:
+    """Vektorisierte Variante von normalize_key für eine ganze Spalte."""
+    return (series.astype(object).fillna("").astype(str)
+            .str.normalize("NFKC").str.casefold()
+            .str.replace(r"\s+", " ", regex=True).str.strip())
+
+def _participant_keys(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    name_key = normalized_key_series(df["Name"]) if "Name" in df.columns else pd.Series("", index=df.index)
+    # Fallback, falls 'Email' nicht da ist: nur nach Name (potenziell ungenau)
+    email_key = normalized_key_series(df["Email"]) if "Email" in df.columns else pd.Series("", index=df.index)
+    return name_key, email_key
+
+def _similar(a: str, b: str, threshold: float) -> bool:
+    matcher = difflib.SequenceMatcher(None, a, b)
+    return matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+def _fuzzy_duplicates(names: list, emails: list, is_duplicate: list, threshold: float) -> list:
+    """
+    Markiert zusätzliche Duplikate, verglichen wird nur innerhalb von Blöcken
+    (gleiche E-Mail-Domain oder gleiches Namenspräfix). Zwei Einträge gelten als gleich,
+    wenn die Namen ähnlich genug sind und die E-Mails übereinstimmen oder eine fehlt.
+    """
+    blocks = defaultdict(list)
+    for pos, (name, email) in enumerate(zip(names, emails)):
+        if is_duplicate[pos]:
+            continue
+        if "@" in email:
+            blocks[("domain", email.rsplit("@", 1)[1])].append(pos)
+        if name:
+            blocks[("prefix", name[:NAME_PREFIX_BLOCK_LENGTH])].append(pos)
+
+    for positions in blocks.values():
+        if len(positions) < 2 or len(positions) > FUZZY_MAX_BLOCK_SIZE:
+            continue
+        for i, pos_a in enumerate(positions):
+            if is_duplicate[pos_a]:
+                continue
+            for pos_b in positions[i + 1:]:
+                if is_duplicate[pos_b]:
+                    continue
+                email_a, email_b = emails[pos_a], emails[pos_b]
+                if (email_a == email_b or not email_a or not email_b) and \
+                   _similar(names[pos_a], names[pos_b], threshold):
+                    is_duplicate[pos_b] = True
+    return is_duplicate
+
+def deduplicate_participants(df: pd.DataFrame, fuzzy: bool = False,
+                             threshold: float = FUZZY_NAME_THRESHOLD) -> tuple[pd.DataFrame, int]:
+    """
+    Entfernt Duplikate anhand normalisierter Schlüssel aus Name und E-Mail (Hash-Index,
+    der erste Eintrag bleibt erhalten). Mit fuzzy=True werden zusätzlich ähnliche Namen
+    innerhalb von Blöcken zusammengeführt.
+    Das Ergebnis wird pro Listen-Revision (sheet_loader.revision_cache_key) gecacht und darf nicht
+    verändert werden. Gibt (eindeutige Teilnehmer, Anzahl entfernter Duplikate) zurück.
+    """
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return df, 0
+
+    revision_key = revision_cache_key(df)
+    cache_key = (revision_key, fuzzy, threshold)
+    if revision_key is not None:
+        with _dedup_cache_lock:
+            cached = _dedup_cache.get(cache_key)
+            if cached is not None:
+                _dedup_cache.move_to_end(cache_key)
+                return cached
+
+    name_key, email_key = _participant_keys(df)
+    is_duplicate = pd.DataFrame({"name": name_key, "email": email_key}).duplicated(keep="first")
+    if fuzzy:
+        is_duplicate = pd.Series(
+            _fuzzy_duplicates(name_key.tolist(), email_key.tolist(), is_duplicate.tolist(), threshold),
+            index=df.index)
+
+    df_unique = df[~is_duplicate.to_numpy()]
+    df_unique.attrs = dict(df.attrs)
+    result = (df_unique, int(is_duplicate.sum()))
+
+    if revision_key is not None:
+        with _dedup_cache_lock:
+            _dedup_cache[cache_key] = result
+            while len(_dedup_cache) > DEDUP_CACHE_MAX_ENTRIES:
+                _dedup_cache.popitem(last=False)
+    return result
+
+def find_repeat_participants(combined_df: pd.DataFrame, min_events: int = 2) -> pd.DataFrame:
+    """
+    Findet Personen, die sich für mehrere Events angemeldet haben (Eingabe: kombinierter
+    DataFrame mit Spalte 'event', z.B. aus load_participants_from_sheets).
+    Gibt Name, Email, Anzahl und Liste der Events zurück.
+    """
+    if combined_df.empty or "event" not in combined_df.columns:
+        return pd.DataFrame(columns=["Name", "Email", "event_count", "events"])
+    name_key, email_key = _participant_keys(combined_df)
+    keyed = combined_df.assign(_name_key=name_key, _email_key=email_key)
+    if "Email" not in keyed.columns:
+        keyed["Email"] = ""
+    grouped = keyed.groupby(["_name_key", "_email_key"], sort=False).agg(
+        Name=("Name", "first"), Email=("Email", "first"),
+        event_count=("event", "nunique"), events=("event", lambda events: sorted(set(events))))
+    repeat = grouped[grouped["event_count"] >= min_events]
+    return repeat.sort_values("event_count", ascending=False).reset_index(drop=True)
@@ -1,11 +1,12 @@
 # modules/form_creator.py
 
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 import os 
 import streamlit as st
 from google.oauth2.credentials import Credentials
 
+from modules.google_services import get_service
+
 SERVICE_ACCOUNT_FILE = "service_account.json" 
 GOOGLE_DRIVE_FOLDER_ID = "1r5KpH6eV41ZfaaLqGDaB4mg52h-FC5H0"
 CLIENT_SECRETS_FILE = "client_secrets.json"
@@ -25,8 +26,8 @@ def create_form_final_version_with_drive_title(
     if not event_price_for_form_question: raise ValueError("Preis für die Formularfrage ist erforderlich.")
     if not form_description_text: raise ValueError("Formularbeschreibung ist erforderlich.")
     
-    form_service = build('forms', 'v1', credentials=credentials)
-    drive_service = build('drive', 'v3', credentials=credentials)
+    form_service = get_service('forms', 'v1', credentials=credentials)
+    drive_service = get_service('drive', 'v3', credentials=credentials)
 
     form_id = None
     edit_url = None
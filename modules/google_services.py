@@ -0,0 +1,151 @@
+# modules/google_services.py
+
+import os
+import json
+import queue
+import hashlib
+import threading
+
+import google.auth
+import google_auth_httplib2
+from google.auth.exceptions import DefaultCredentialsError
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import build_http
+
+DISCOVERY_CACHE_DIR = os.path.join(".cache", "discovery")
+DISCOVERY_URL_TEMPLATE = "https://www.googleapis.com/discovery/v1/apis/{name}/{version}/rest"
+# Maximale Anzahl ungenutzter Keep-Alive-Verbindungen im Pool
+HTTP_POOL_MAX_IDLE = 10
+
+class _HttpPool:
+    """
+    Thread-sicherer Ersatz für ein einzelnes httplib2.Http-Objekt.
+    httplib2.Http ist nicht thread-sicher, hält aber Keep-Alive-Verbindungen offen.
+    Jeder Request leiht sich deshalb ein freies Http-Objekt aus dem Pool und gibt es
+    danach zurück, sodass Verbindungen zwischen Requests und Sessions wiederverwendet werden.
+    """
+
+    def __init__(self, max_idle: int = HTTP_POOL_MAX_IDLE):
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def request(self, *args, **kwargs):
+        try:
+            http = self._idle.get_nowait()
+        except queue.Empty:
+            http = build_http()
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            try:
+                self._idle.put_nowait(http)
+            except queue.Full:
+                http.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_http_pool = _HttpPool()
+_discovery_docs = {}
+_services = {}
+_lock = threading.Lock()
+
+def _credentials_key(credentials) -> str | None:
+    """
+    Stabiler Schlüssel pro Konto, damit neu erzeugte Credential-Objekte denselben Client treffen.
+    Credentials ohne erkennbare Identität liefern None und werden nicht gecacht: eine
+    Objekt-ID könnte nach der Garbage Collection für ein anderes Konto wiederverwendet werden.
+    """
+    if credentials is None:
+        return "anonymous"
+    identity = (getattr(credentials, "refresh_token", None) or getattr(credentials, "service_account_email", None)
+                or getattr(credentials, "token", None))
+    if not identity:
+        return None
+    raw_key = f"{type(credentials).__name__}|{getattr(credentials, 'client_id', '')}|{identity}"
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+def get_discovery_document(name: str, version: str) -> dict:
+    """
+    Gibt das geparste Discovery-Dokument zurück.
+    Reihenfolge: Arbeitsspeicher -> Datei-Cache (.cache/discovery) -> mitgelieferte
+    statische Dokumente von google-api-python-client -> Download.
+    """
+    key = (name, version)
+    if key in _discovery_docs:
+        return _discovery_docs[key]
+
+    cache_path = os.path.join(DISCOVERY_CACHE_DIR, f"{name}.{version}.json")
+    content = None
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            content = f.read()
+    else:
+        content = discovery_cache.get_static_doc(name, version)
+        if not content:
+            _, body = _http_pool.request(DISCOVERY_URL_TEMPLATE.format(name=name, version=version))
+            content = body.decode("utf-8")
+        try:
+            os.makedirs(DISCOVERY_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"WARNUNG (google_services): Discovery-Dokument konnte nicht gecacht werden: {e}")
+
+    document = json.loads(content)
+    _discovery_docs[key] = document
+    return document
+
+def _authorized_http(credentials, document: dict):
+    if credentials is None:
+        # Wie googleapiclient.discovery.build: Application Default Credentials versuchen,
+        # sonst unauthentifiziert (z.B. für öffentlich lesbare Sheets im Kiosk-Modus).
+        scopes = list(document.get("auth", {}).get("oauth2", {}).get("scopes", {}).keys())
+        try:
+            credentials, _ = google.auth.default(scopes=scopes or None)
+        except DefaultCredentialsError:
+            return _http_pool
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=_http_pool)
+
+def get_service(name: str, version: str, credentials=None):
+    """
+    Ersatz für googleapiclient.discovery.build(name, version, credentials=...).
+    Der Client wird pro API und Konto nur einmal gebaut und danach wiederverwendet;
+    alle Clients teilen sich einen Pool von Keep-Alive-HTTP-Verbindungen.
+    """
+    credentials_key = _credentials_key(credentials)
+    if credentials_key is None:
+        document = get_discovery_document(name, version)
+        return build_from_document(document, http=_authorized_http(credentials, document))
+    key = (name, version, credentials_key)
+    with _lock:
+        service = _services.get(key)
+        if service is None:
+            document = get_discovery_document(name, version)
+            service = build_from_document(document, http=_authorized_http(credentials, document))
+            _services[key] = service
+    return service
+
+def clear_service_cache(credentials=None):
+    """
+    Verwirft die gebauten Clients eines Kontos (z.B. nach dem Abmelden); die Clients anderer
+    Sessions und der gemeinsame Verbindungspool bleiben erhalten. Ohne credentials wird alles
+    verworfen und der Pool geschlossen.
+    """
+    if credentials is None:
+        with _lock:
+            _services.clear()
+        _http_pool.close()
+        return
+    credentials_key = _credentials_key(credentials)
+    if credentials_key is None:
+        return
+    with _lock:
+        for key in [key for key in _services if key[2] == credentials_key]:
+            del _services[key]
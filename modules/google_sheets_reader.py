@@ -3,8 +3,50 @@
 import pandas as pd
 import re
 import os
+import time
+import json
+import hashlib
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from googleapiclient.discovery import build
+
+from googleapiclient.errors import HttpError
+
+from modules.google_services import get_service, _credentials_key
+from modules.participant_cache import SingleFlightCache
+from modules.sheet_loader import process_dataframe_for_display, FINAL_COLUMNS
+from modules.snapshot_store import load_latest_snapshot, save_snapshot_in_background
+
+# Anzahl der zuletzt bekannten Zeilen, die bei einem Delta-Abruf erneut mitgeladen
+# und per Hash verglichen werden. Stimmen sie nicht mehr überein, wurden davor Zeilen
+# eingefügt oder gelöscht und es wird vollständig neu geladen.
+DELTA_OVERLAP_ROWS = 3
+# Spätestens nach dieser Zeit wird trotzdem vollständig neu geladen, damit auch
+# nachträgliche Änderungen an älteren Zeilen (z.B. korrigierte Namen) ankommen.
+FULL_RELOAD_INTERVAL_SECONDS = 600
+# Letzte Spalte für offene Bereiche wie 'Tab'!A42:ZZ
+LAST_COLUMN = "ZZ"
+
+# Mehrere Sheets gleichzeitig laden (Semester-Auswertung)
+MULTI_SHEET_MAX_WORKERS = 8
+MULTI_SHEET_RETRIES = 3
+MULTI_SHEET_BACKOFF_SECONDS = 1.0
+RETRYABLE_HTTP_STATUS = {429, 500, 502, 503, 504}
+
+# Zustand des inkrementellen Loaders pro (Konto, sheet_id) (prozessweit, für alle Sessions).
+# Das Konto gehört zum Schlüssel, damit ein anonymer Aufruf nie Daten sieht, die mit
+# den Credentials eines Organisators geladen wurden.
+_sheet_states = {}
+_sheet_locks = {}
+_sheet_states_lock = threading.Lock()
+# Titel des ersten Tabs pro sheet_id, für die Lebensdauer des Prozesses gemerkt.
+_sheet_titles = {}
+
+# Prozessweiter Cache für den Kiosk-Modus, Schlüssel ist (Konto, sheet_id).
+_participant_cache = SingleFlightCache(name="participant_cache")
+# Zuletzt als Snapshot gespeicherte Revision pro (Konto, sheet_id)
+_snapshot_revisions = {}
 
 def extract_sheet_id(sheet_url: str) -> str | None:
     """Extrahiert die Spreadsheet-ID aus einer Google Sheets URL."""
@@ -13,6 +55,85 @@ def extract_sheet_id(sheet_url: str) -> str | None:
     match = re.search(r"/spreadsheets/d/([a-zA-Z0-9-_]+)", sheet_url)
     return match.group(1) if match else None
 
+def _build_sheets_service(credentials=None):
+    # Verwendet die übergebenen OAuth2-Credentials; ohne Credentials (Kiosk-Modus)
+    # muss das Sheet öffentlich lesbar sein. Der Client wird pro Konto wiederverwendet.
+    return get_service('sheets', 'v4', credentials=credentials)
+
+def _api_error(sheet_id: str, e: Exception) -> ConnectionError:
+    # Gib eine verständlichere Fehlermeldung aus
+    if "service_account.json" in str(e):
+        return ConnectionError(f"Fehler bei der Authentifizierung: Das Modul 'google_sheets_reader' scheint eine veraltete Service-Account-Logik zu verwenden.")
+    return ConnectionError(f"Fehler beim API-Zugriff auf Google Sheet ID '{sheet_id}': {e}")
+
+def _quote_sheet_title(title: str) -> str:
+    """Setzt einen Tab-Titel für die A1-Notation in Hochkommas (z.B. 'Form Responses 1')."""
+    return "'" + title.replace("'", "''") + "'"
+
+def _parse_sheet_title(a1_range: str) -> str | None:
+    """Liest den Tab-Titel aus einem zurückgegebenen Bereich wie 'Form Responses 1'!A1:ZZ120."""
+    if "!" not in a1_range:
+        return None
+    title = a1_range.rsplit("!", 1)[0]
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title
+
+def _fetch_rows_from(sheets_service, sheet_id: str, start_row: int = 1) -> list:
+    """
+    Lädt alle Zeilen des ersten Tabs ab der (1-basierten) Zeile start_row in genau einem Request.
+    Ist der Tab-Titel noch unbekannt, wird ein Bereich ohne Titel angefragt (bezieht sich laut
+    Sheets-API auf den ersten sichtbaren Tab) und der Titel aus der Antwort für die
+    Lebensdauer des Prozesses gemerkt.
+    """
+    sheet_title = _sheet_titles.get(sheet_id)
+    a1_range = f"A{start_row}:{LAST_COLUMN}"
+    try:
+        result = sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=sheet_id,
+            ranges=[f"{_quote_sheet_title(sheet_title)}!{a1_range}" if sheet_title else a1_range],
+            fields="valueRanges(range,values)"
+        ).execute()
+    except HttpError as e:
+        # Tab wurde umbenannt -> gemerkten Titel verwerfen und einmal ohne Titel versuchen
+        if sheet_title and e.resp.status == 400:
+            _sheet_titles.pop(sheet_id, None)
+            return _fetch_rows_from(sheets_service, sheet_id, start_row)
+        raise
+
+    value_ranges = result.get('valueRanges', [])
+    if not value_ranges:
+        return []
+    if not sheet_title:
+        parsed_title = _parse_sheet_title(value_ranges[0].get('range', ''))
+        if parsed_title:
+            _sheet_titles[sheet_id] = parsed_title
+    return value_ranges[0].get('values', [])
+
+def _rows_hash(rows: list) -> str:
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _rows_to_dataframe(header: list, rows: list) -> pd.DataFrame:
+    # Fülle fehlende Spalten in Datenzeilen mit leeren Strings, um Längenkonflikte zu vermeiden
+    num_columns = len(header)
+    rows = [row + [''] * (num_columns - len(row)) for row in rows]
+    return pd.DataFrame(rows, columns=header)
+
+def _values_to_dataframe(values: list) -> pd.DataFrame:
+    if not values or len(values) < 1:
+        return pd.DataFrame()
+    return _rows_to_dataframe(values[0], values[1:])
+
+def _tag_revision(df: pd.DataFrame, sheet_id: str, revision: str) -> pd.DataFrame:
+    """
+    Hängt sheet_id und Revision als DataFrame.attrs an. Nachgelagerte Caches
+    (z.B. process_dataframe_for_display) verwenden die Revision als günstigen Schlüssel
+    statt den gesamten Inhalt zu hashen.
+    """
+    df.attrs["sheet_id"] = sheet_id
+    df.attrs["revision"] = f"{sheet_id}:{revision}"
+    return df
+
 #@st.cache_data(ttl=300)
 def load_participants_from_google_sheet(sheet_url: str, credentials=None) -> pd.DataFrame:
     """
@@ -27,43 +148,225 @@ def load_participants_from_google_sheet(sheet_url: str, credentials=None) -> pd.
         raise ValueError(f"Ungültige Google Sheet URL: {sheet_url}")
 
     try:
-        # Verwende die übergebenen OAuth2-Credentials
-        if credentials:
-            sheets_service = build('sheets', 'v4', credentials=credentials)
-        else:
-            # Fallback für den Kiosk-Modus (erfordert öffentlich lesbares Sheet oder API Key)
-            # Für ein öffentliches Sheet wird kein API-Key benötigt, wir übergeben None.
-            sheets_service = build('sheets', 'v4')
-
-        metadata = sheets_service.spreadsheets().get(spreadsheetId=sheet_id).execute()
-        
-        if not metadata.get('sheets'):
-            return pd.DataFrame() # Leeres Sheet, kein Fehler
-            
-        first_sheet_title = metadata['sheets'][0]['properties']['title']
-        
-        result = sheets_service.spreadsheets().values().get(
-            spreadsheetId=sheet_id,
-            range=first_sheet_title
-        ).execute()
-
+        sheets_service = _build_sheets_service(credentials)
+        values = _fetch_rows_from(sheets_service, sheet_id)
     except Exception as e:
-        # Gib eine verständlichere Fehlermeldung aus
-        if "service_account.json" in str(e):
-             raise ConnectionError(f"Fehler bei der Authentifizierung: Das Modul 'google_sheets_reader' scheint eine veraltete Service-Account-Logik zu verwenden.")
-        raise ConnectionError(f"Fehler beim API-Zugriff auf Google Sheet ID '{sheet_id}': {e}") from e
+        raise _api_error(sheet_id, e) from e
 
-    values = result.get('values', [])
-    if not values or len(values) < 1:
-        return pd.DataFrame()
-
-    header = values[0]
-    # Fülle fehlende Spalten in Datenzeilen mit leeren Strings, um Längenkonflikte zu vermeiden
-    num_columns = len(header)
-    rows = [row + [''] * (num_columns - len(row)) for row in values[1:]]
-    
-    df = pd.DataFrame(rows, columns=header)
-    
     # Der Rest der Logik (Spaltenauswahl, Speichern) ist nicht mehr nötig,
     # da process_dataframe_for_display das übernimmt. Wir geben den rohen DF zurück.
-    return df
\ No newline at end of file
+    return _tag_revision(_values_to_dataframe(values), sheet_id, _rows_hash(values)[:16])
+
+def _get_sheet_lock(state_key: tuple) -> threading.Lock:
+    with _sheet_states_lock:
+        return _sheet_locks.setdefault(state_key, threading.Lock())
+
+def _full_reload(sheets_service, sheet_id: str, state_key: tuple | None = None) -> dict:
+    values = _fetch_rows_from(sheets_service, sheet_id)
+    header = values[0] if values else []
+    rows = values[1:]
+    tail_rows = rows[-DELTA_OVERLAP_ROWS:] if rows else []
+    revision = _rows_hash(values)[:16]
+    state = {
+        "header": header,
+        "row_count": len(rows),
+        "tail_hash": _rows_hash(tail_rows),
+        "tail_rows": tail_rows,
+        "revision": revision,
+        "df": _tag_revision(_values_to_dataframe(values), sheet_id, revision),
+        "last_full_reload": time.monotonic(),
+    }
+    if state_key is not None:
+        with _sheet_states_lock:
+            _sheet_states[state_key] = state
+    return state
+
+def _apply_delta(sheets_service, sheet_id: str, state: dict) -> dict | None:
+    """
+    Lädt nur die neuen Zeilen (plus einen kleinen Überlappungsbereich) nach.
+    Gibt None zurück, wenn sich frühere Zeilen geändert haben und ein voller Reload nötig ist.
+    """
+    overlap = len(state["tail_rows"])
+    # +1 für die Kopfzeile, +1 weil die A1-Notation 1-basiert ist
+    start_row = state["row_count"] - overlap + 2
+    fetched = _fetch_rows_from(sheets_service, sheet_id, start_row)
+
+    if len(fetched) < overlap or _rows_hash(fetched[:overlap]) != state["tail_hash"]:
+        return None
+    new_rows = fetched[overlap:]
+    if not new_rows:
+        return state
+    # Längere Zeilen als die Kopfzeile bedeuten eine neue Formularfrage -> Kopfzeile neu laden
+    if any(len(row) > len(state["header"]) for row in new_rows):
+        return None
+
+    new_df = _rows_to_dataframe(state["header"], new_rows)
+    # Die Revision wird verkettet (alte Revision + Hash der neuen Zeilen), ohne den ganzen Inhalt neu zu hashen.
+    state["revision"] = hashlib.sha1((state["revision"] + _rows_hash(new_rows)).encode("utf-8")).hexdigest()[:16]
+    combined_df = new_df if state["df"].empty else pd.concat([state["df"], new_df], ignore_index=True)
+    state["df"] = _tag_revision(combined_df, sheet_id, state["revision"])
+    state["row_count"] += len(new_rows)
+    state["tail_rows"] = (state["tail_rows"] + new_rows)[-DELTA_OVERLAP_ROWS:]
+    state["tail_hash"] = _rows_hash(state["tail_rows"])
+    return state
+
+def load_participants_incremental(sheet_url: str, credentials=None) -> pd.DataFrame:
+    """
+    Wie load_participants_from_google_sheet, merkt sich aber pro Konto und sheet_id die Zeilenanzahl
+    und einen Hash der letzten Zeilen. Folgeaufrufe laden nur die neuen Zeilen
+    ('Tab'!A{n+1}:ZZ) nach; vollständig neu geladen wird nur, wenn sich frühere Zeilen
+    geändert haben oder FULL_RELOAD_INTERVAL_SECONDS abgelaufen ist.
+    Der zurückgegebene DataFrame wird zwischen Aufrufen geteilt und darf nicht verändert werden.
+    """
+    if not sheet_url:
+        raise ValueError("Keine Google Sheet URL übergeben.")
+    sheet_id = extract_sheet_id(sheet_url)
+    if not sheet_id:
+        raise ValueError(f"Ungültige Google Sheet URL: {sheet_url}")
+
+    access_key = _credentials_key(credentials)
+    if access_key is None:
+        # Credentials ohne erkennbare Identität: kein gemeinsamer Zustand, immer voll laden
+        try:
+            return _full_reload(_build_sheets_service(credentials), sheet_id)["df"]
+        except Exception as e:
+            raise _api_error(sheet_id, e) from e
+
+    state_key = (access_key, sheet_id)
+    with _get_sheet_lock(state_key):
+        state = _sheet_states.get(state_key)
+        try:
+            sheets_service = _build_sheets_service(credentials)
+            if state is not None and state["header"] and \
+               time.monotonic() - state["last_full_reload"] < FULL_RELOAD_INTERVAL_SECONDS:
+                updated_state = _apply_delta(sheets_service, sheet_id, state)
+                if updated_state is not None:
+                    return updated_state["df"]
+            state = _full_reload(sheets_service, sheet_id, state_key)
+        except Exception as e:
+            raise _api_error(sheet_id, e) from e
+        return state["df"]
+
+def reset_incremental_state(sheet_id: str | None = None):
+    """Verwirft den gemerkten Zustand (für eine sheet_id über alle Konten oder alle), der nächste Aufruf lädt voll."""
+    with _sheet_states_lock:
+        if sheet_id is None:
+            _sheet_states.clear()
+        else:
+            for state_key in [key for key in _sheet_states if key[1] == sheet_id]:
+                del _sheet_states[state_key]
+
+def _load_and_snapshot(sheet_url: str, sheet_id: str, access_key: str, credentials=None) -> pd.DataFrame:
+    df = load_participants_incremental(sheet_url, credentials)
+    revision = df.attrs.get("revision")
+    if revision and _snapshot_revisions.get((access_key, sheet_id)) != revision:
+        _snapshot_revisions[(access_key, sheet_id)] = revision
+        save_snapshot_in_background(sheet_id, revision, df, access_key=access_key)
+    return df
+
+def get_participants_cached(sheet_url: str, credentials=None) -> pd.DataFrame:
+    """
+    Prozessweit gecachte Variante von load_participants_incremental (Schlüssel: Konto + sheet_id).
+    Alle Kiosk-Sessions teilen sich den Cache; gleichzeitige Misses lösen nur einen
+    API-Request aus, abgelaufene Einträge werden ausgeliefert und im Hintergrund erneuert.
+    Ist der Cache leer (z.B. nach einem Neustart), wird sofort der lokale Snapshot desselben
+    Kontos ausgeliefert und im Hintergrund mit dem Sheet abgeglichen. Anonyme Aufrufe sehen
+    so nie Einträge oder Snapshots, die mit den Credentials eines Organisators geladen wurden.
+    """
+    sheet_id = extract_sheet_id(sheet_url)
+    if not sheet_id:
+        raise ValueError(f"Ungültige Google Sheet URL: {sheet_url}")
+    access_key = _credentials_key(credentials)
+    if access_key is None:
+        return load_participants_incremental(sheet_url, credentials)
+    return _participant_cache.get((access_key, sheet_id),
+                                  lambda: _load_and_snapshot(sheet_url, sheet_id, access_key, credentials),
+                                  fallback=lambda: load_latest_snapshot(sheet_id, access_key=access_key))
+
+def reload_participants(sheet_url: str, credentials=None) -> pd.DataFrame:
+    """
+    Lädt sofort neu (inkrementell), ohne auf die TTL zu warten, und aktualisiert dabei
+    den prozessweiten Cache und den lokalen Snapshot. Für explizite "Laden"-Buttons.
+    """
+    sheet_id = extract_sheet_id(sheet_url)
+    if not sheet_id:
+        raise ValueError(f"Ungültige Google Sheet URL: {sheet_url}")
+    access_key = _credentials_key(credentials)
+    if access_key is None:
+        return load_participants_incremental(sheet_url, credentials)
+    df = _load_and_snapshot(sheet_url, sheet_id, access_key, credentials)
+    _participant_cache.put((access_key, sheet_id), df)
+    return df
+
+def get_participant_cache_stats() -> dict:
+    """Hit-/Miss-Zähler des prozessweiten Teilnehmer-Caches."""
+    return _participant_cache.stats()
+
+def _is_retryable(e: Exception) -> bool:
+    """
+    Quota-Fehler (429), Serverfehler und Netzwerkprobleme lohnen einen neuen Versuch, 403/404 nicht.
+    Zu den Netzwerkproblemen zählen auch abgebrochene Verbindungen (ConnectionResetError,
+    ConnectionAbortedError, http.client.RemoteDisconnected), die alle von OSError erben.
+    """
+    cause = e.__cause__ or e
+    if isinstance(cause, HttpError):
+        return cause.resp.status in RETRYABLE_HTTP_STATUS
+    return isinstance(cause, OSError)
+
+def _load_with_backoff(sheet_url: str, credentials, retries: int) -> tuple[pd.DataFrame, int]:
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return load_participants_incremental(sheet_url, credentials), attempt
+        except Exception as e:
+            if attempt > retries or not _is_retryable(e):
+                raise
+            # Exponentielles Backoff mit Jitter, damit parallele Requests nicht gleichzeitig wiederholen
+            time.sleep(MULTI_SHEET_BACKOFF_SECONDS * 2 ** (attempt - 1) * (0.5 + random.random()))
+
+def load_participants_from_sheets(sheet_urls, credentials=None,
+                                  max_workers: int = MULTI_SHEET_MAX_WORKERS,
+                                  retries: int = MULTI_SHEET_RETRIES) -> tuple[pd.DataFrame, list]:
+    """
+    Lädt mehrere Sheets gleichzeitig (begrenzter Thread-Pool, Backoff pro Request).
+    sheet_urls ist eine Liste von URLs oder ein Dict {Event-Name: URL}; ohne Namen wird
+    die sheet_id als Event verwendet.
+    Gibt einen kombinierten, verarbeiteten DataFrame mit zusätzlicher Spalte 'event' und
+    einen Bericht pro Sheet zurück: [{event, sheet_id, rows, seconds, attempts, error}, ...].
+    Fehler einzelner Sheets brechen den Gesamtlauf nicht ab.
+    """
+    if isinstance(sheet_urls, dict):
+        events = list(sheet_urls.items())
+    else:
+        events = [(extract_sheet_id(url) or str(url), url) for url in sheet_urls]
+
+    def _load_one(event_name, sheet_url):
+        start = time.perf_counter()
+        try:
+            df_raw, attempts = _load_with_backoff(sheet_url, credentials, retries)
+            error = None
+        except Exception as e:
+            df_raw, attempts, error = None, None, f"{type(e).__name__}: {e}"
+        return df_raw, {"event": event_name, "sheet_id": extract_sheet_id(sheet_url),
+                        "rows": 0 if df_raw is None else len(df_raw),
+                        "seconds": time.perf_counter() - start, "attempts": attempts, "error": error}
+
+    results = []
+    if events:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(events))),
+                                thread_name_prefix="sheet-loader") as executor:
+            results = list(executor.map(lambda item: _load_one(*item), events))
+
+    frames = []
+    report = []
+    for df_raw, sheet_report in results:
+        report.append(sheet_report)
+        if df_raw is None or df_raw.empty:
+            continue
+        df_event = process_dataframe_for_display(df_raw).assign(event=sheet_report["event"])
+        frames.append(df_event)
+
+    if not frames:
+        return pd.DataFrame(columns=FINAL_COLUMNS + ["event"]), report
+    return pd.concat(frames, ignore_index=True), report
@@ -0,0 +1,90 @@
+# modules/header_resolver.py
+
+import re
+import difflib
+import unicodedata
+from functools import lru_cache
+
+# Kanonische Felder pro Schema mit bekannten Varianten der Spaltenüberschriften.
+# Die Varianten werden genauso normalisiert wie die Überschriften selbst.
+HEADER_SCHEMAS = {
+    "participants": {
+        'First Name': ['First Name', 'Firstname', 'Vorname', 'Given Name'],
+        'Last Name': ['Last Name', 'Lastname', 'Surname', 'Nachname', 'Family Name'],
+        'Phone Number': ['Phone Number', 'Phone', 'Mobile', 'Mobile Number', 'Handynummer', 'Telefonnummer', 'Telefon'],
+        'Country of Origin': ['Country of Origin', 'Country', 'Herkunftsland', 'Nationality'],
+        'Exchange Type': ['Exchange Type', 'Student Type', 'Austauschtyp'],
+        'E-Mail-Adresse': ['E-Mail-Adresse', 'E-Mail', 'Email', 'Email Address', 'E-Mail Address'],
+    },
+    # Zahlungsexporte (PayPal deutsch/englisch, Bank-CSV), siehe modules.payment_reconciliation
+    "payments": {
+        'Name': ['Name', 'Payer Name', 'Zahler', 'Auftraggeber', 'Zahlungspflichtiger', 'Absender',
+                 'Beguenstigter/Zahlungspflichtiger', 'Empfänger/Zahlungspflichtiger', 'Kontoinhaber'],
+        'Email': ['Absender E-Mail-Adresse', 'From Email Address', 'Payer Email', 'E-Mail-Adresse', 'E-Mail', 'Email'],
+        'Amount': ['Brutto', 'Gross', 'Betrag', 'Amount', 'Umsatz'],
+        'Reference': ['Verwendungszweck', 'Betreff', 'Subject', 'Artikelbezeichnung', 'Item Title', 'Reference', 'Referenz'],
+        'Note': ['Hinweis', 'Note', 'Nachricht', 'Message'],
+        'Status': ['Status'],
+    },
+}
+
+# Mindest-Ähnlichkeit (difflib-Ratio) für unscharfe Treffer, z.B. Tippfehler in Überschriften
+FUZZY_THRESHOLD = 0.85
+# Überschriften, die mit einer Variante dieser Mindestlänge beginnen, zählen ebenfalls als Treffer
+# (z.B. "Phone Number (please follow the pattern +49 ...)").
+PREFIX_MIN_LENGTH = 8
+
+def normalize_header(header: str) -> str:
+    """NFKC, casefold, Satzzeichen entfernen und Leerraum zusammenfassen ('Phone Number ' -> 'phone number')."""
+    text = unicodedata.normalize("NFKC", str(header)).casefold()
+    text = re.sub(r"[\W_]+", " ", text)
+    return " ".join(text.split())
+
+def _compact(header: str) -> str:
+    return normalize_header(header).replace(" ", "")
+
+@lru_cache(maxsize=None)
+def _compiled_aliases(schema: str) -> dict:
+    return {field: {_compact(alias) for alias in aliases} for field, aliases in HEADER_SCHEMAS[schema].items()}
+
+def _match_score(compact_header: str, compact_aliases: set) -> float:
+    if compact_header in compact_aliases:
+        return 1.0
+    best = 0.0
+    for alias in compact_aliases:
+        if len(alias) >= PREFIX_MIN_LENGTH and compact_header.startswith(alias):
+            best = max(best, 0.9)
+        else:
+            best = max(best, difflib.SequenceMatcher(None, compact_header, alias).ratio())
+    return best
+
+@lru_cache(maxsize=256)
+def resolve_header_mapping(headers: tuple, schema: str = "participants") -> dict:
+    """
+    Ordnet die Spaltenüberschriften den kanonischen Feldern des Schemas zu und gibt
+    {kanonisches Feld: Spaltenindex} zurück. Das Ergebnis wird pro Überschriften-Tupel
+    gecacht, sodass jeder weitere Load mit derselben Signatur nur noch Indexzugriffe kostet.
+    Jedes Feld und jede Spalte wird höchstens einmal vergeben (beste Übereinstimmung zuerst).
+    """
+    aliases_by_field = _compiled_aliases(schema)
+    candidates = []
+    for col_index, header in enumerate(headers):
+        compact_header = _compact(header)
+        if not compact_header:
+            continue
+        for field, compact_aliases in aliases_by_field.items():
+            score = _match_score(compact_header, compact_aliases)
+            if score >= FUZZY_THRESHOLD:
+                candidates.append((-score, col_index, field))
+
+    mapping = {}
+    used_columns = set()
+    for _, col_index, field in sorted(candidates):
+        if field not in mapping and col_index not in used_columns:
+            mapping[field] = col_index
+            used_columns.add(col_index)
+
+    missing_fields = [field for field in aliases_by_field if field not in mapping]
+    if missing_fields and headers:
+        print(f"INFO (header_resolver): Keine Spalte gefunden für {missing_fields} (Schema '{schema}').")
+    return mapping
@@ -0,0 +1,164 @@
+# modules/name_search.py
+
+import bisect
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+
+from modules.sheet_loader import revision_cache_key
+from modules.signature_registry import safe_signature_name
+
+# Anzahl Treffer, die die Typeahead-Suche standardmäßig liefert
+SEARCH_RESULT_LIMIT = 8
+# Ab dieser Länge der Eingabe werden zusätzlich Trigramm-Treffer (Tippfehler, Namensmitte) gesucht
+TRIGRAM_MIN_QUERY_LENGTH = 3
+NAME_INDEX_CACHE_MAX_ENTRIES = 16
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def normalize_search_text(value) -> str:
+    """Akzent- und groß/klein-unabhängige Suchform: 'Lucía  Núñez' -> 'lucia nunez'."""
+    decomposed = unicodedata.normalize("NFKD", str(value))
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class NameSearchIndex:
+    """
+    Suchindex über die Namen einer Teilnehmerliste, einmal pro Listen-Revision aufgebaut.
+    - Präfixsuche per bisect über alle Namensbestandteile (Vorname, Nachname, voller Name)
+    - Trigramm-Index für Treffer mitten im Namen und kleine Tippfehler
+    Unterschriebene Namen werden nur als Indexmenge markiert; die alphabetische Reihenfolge
+    bleibt bestehen und muss nie neu sortiert werden.
+    """
+
+    def __init__(self, names):
+        # Namen ohne verwertbare Zeichen können keine Unterschrift erhalten und werden ausgelassen
+        self.names = sorted({str(name) for name in names if pd.notna(name) and safe_signature_name(name)})
+        self._normalized = [normalize_search_text(name) for name in self.names]
+        self._safe_keys = [safe_signature_name(name) for name in self.names]
+        self._positions_by_key = defaultdict(list)
+        for pos, key in enumerate(self._safe_keys):
+            self._positions_by_key[key].append(pos)
+
+        prefix_entries = set()
+        self._trigram_index = defaultdict(set)
+        for pos, normalized in enumerate(self._normalized):
+            prefix_entries.add((normalized, pos))
+            for token in normalized.split(" "):
+                prefix_entries.add((token, pos))
+            for trigram in _trigrams(normalized):
+                self._trigram_index[trigram].add(pos)
+        prefix_entries = sorted(prefix_entries)
+        self._prefix_tokens = [token for token, _ in prefix_entries]
+        self._prefix_positions = [pos for _, pos in prefix_entries]
+
+        self._lock = threading.Lock()
+        self._signed_positions = set()
+        self._signed_keys = frozenset()
+
+    def sync_signed(self, signed_keys):
+        """Übernimmt die Menge der unterschriebenen (normalisierten) Namen; nur Änderungen werden angewendet."""
+        signed_keys = frozenset(signed_keys)
+        with self._lock:
+            if signed_keys == self._signed_keys:
+                return
+            for key in signed_keys - self._signed_keys:
+                self._signed_positions.update(self._positions_by_key.get(key, ()))
+            for key in self._signed_keys - signed_keys:
+                self._signed_positions.difference_update(self._positions_by_key.get(key, ()))
+            self._signed_keys = signed_keys
+
+    def mark_signed(self, name: str):
+        """Markiert einen Namen sofort als unterschrieben (z.B. direkt nach dem Speichern)."""
+        key = safe_signature_name(name)
+        with self._lock:
+            self._signed_positions.update(self._positions_by_key.get(key, ()))
+            self._signed_keys = self._signed_keys | {key}
+
+    def unsigned_names(self) -> list:
+        """Alle Namen ohne Unterschrift in alphabetischer Reihenfolge."""
+        signed = self._signed_positions
+        return [name for pos, name in enumerate(self.names) if pos not in signed]
+
+    def search(self, query: str, limit: int = SEARCH_RESULT_LIMIT, include_signed: bool = False) -> list:
+        """
+        Liefert bis zu limit Namen: zuerst Präfixtreffer (alphabetisch), danach Trigramm-Treffer
+        nach Anzahl gemeinsamer Trigramme. Leere Eingabe = die ersten offenen Namen.
+        """
+        normalized_query = normalize_search_text(query)
+        signed = set() if include_signed else self._signed_positions
+        if not normalized_query:
+            return [name for pos, name in enumerate(self.names) if pos not in signed][:limit]
+
+        prefix_hits = set()
+        start = bisect.bisect_left(self._prefix_tokens, normalized_query)
+        end = bisect.bisect_left(self._prefix_tokens, normalized_query + "\uffff", lo=start)
+        for i in range(start, end):
+            pos = self._prefix_positions[i]
+            if pos not in signed:
+                prefix_hits.add(pos)
+        results = sorted(prefix_hits)[:limit]
+
+        if len(results) < limit and len(normalized_query) >= TRIGRAM_MIN_QUERY_LENGTH:
+            scores = defaultdict(int)
+            for trigram in _trigrams(normalized_query):
+                for pos in self._trigram_index.get(trigram, ()):
+                    if pos not in signed and pos not in prefix_hits:
+                        scores[pos] += 1
+            min_score = max(1, len(_trigrams(normalized_query)) // 2)
+            ranked = sorted((pos for pos, score in scores.items() if score >= min_score),
+                            key=lambda pos: (-scores[pos], pos))
+            results.extend(ranked[:limit - len(results)])
+        return [self.names[pos] for pos in results]
+
+def _names_cache_key(participants_df: pd.DataFrame):
+    revision_key = revision_cache_key(participants_df)
+    if revision_key is not None:
+        return revision_key
+    names = participants_df["Name"].astype(str).tolist()
+    return ("names", hashlib.sha1("\x1f".join(names).encode("utf-8")).hexdigest())
+
+def get_name_index(participants_df: pd.DataFrame) -> NameSearchIndex:
+    """Suchindex für eine Teilnehmerliste, gecacht pro Listen-Revision (sheet_loader.revision_cache_key)."""
+    if not isinstance(participants_df, pd.DataFrame) or "Name" not in participants_df.columns:
+        return NameSearchIndex([])
+    cache_key = _names_cache_key(participants_df)
+    with _index_cache_lock:
+        index = _index_cache.get(cache_key)
+        if index is not None:
+            _index_cache.move_to_end(cache_key)
+            return index
+    index = NameSearchIndex(participants_df["Name"].dropna().unique())
+    with _index_cache_lock:
+        index = _index_cache.setdefault(cache_key, index)
+        while len(_index_cache) > NAME_INDEX_CACHE_MAX_ENTRIES:
+            _index_cache.popitem(last=False)
+    return index
+
+if __name__ == "__main__":
+    import time
+
+    names = [f"Vorname{i} Nachname{i}" for i in range(5000)] + ["Lucía Núñez", "Adrià Ferrer Casamayor", "süeda barut"]
+    df = pd.DataFrame({"Name": names})
+    df.attrs["revision"] = "demo:1"
+
+    start = time.perf_counter()
+    index = get_name_index(df)
+    print(f"Index für {len(index.names)} Namen aufgebaut in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for query in ["nunez", "Luc", "ferrer", "casamayr", "Sueda", "vorname49"]:
+        start = time.perf_counter()
+        for _ in range(1000):
+            hits = index.search(query)
+        print(f"{query!r:12} -> {hits[:3]} ({(time.perf_counter() - start) * 1000:.1f} µs/Suche)")
+
+    index.mark_signed("Lucía Núñez")
+    print("Nach Unterschrift:", index.search("nunez"), "| offen:", len(index.unsigned_names()))
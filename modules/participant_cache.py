@@ -0,0 +1,127 @@
+# modules/participant_cache.py
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+# Standard-TTL für den prozessweiten Teilnehmer-Cache (überschreibbar per Umgebungsvariable).
+# Bewusst kürzer als die früheren 300 s, damit Last-Minute-Anmeldungen am Eingang schnell
+# auf den Kiosk-Geräten erscheinen; die Revalidierung ist dank Delta-Loader nur ein kleiner Request.
+DEFAULT_TTL_SECONDS = float(os.getenv("PARTICIPANT_CACHE_TTL_SECONDS", "60"))
+
+class SingleFlightCache:
+    """
+    Prozessweiter Cache (gemeinsam für alle Streamlit-Sessions) mit
+    - TTL pro Eintrag,
+    - stale-while-revalidate: abgelaufene Einträge werden sofort ausgeliefert und
+      im Hintergrund neu geladen,
+    - Single-Flight: gleichzeitige Misses für denselben Schlüssel teilen sich einen Request.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, name: str = "cache"):
+        self.ttl_seconds = ttl_seconds
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> {"value", "fetched_at", "refreshing"}
+        self._inflight = {}  # key -> Future
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+                       "refreshes": 0, "fallbacks": 0, "errors": 0}
+
+    def get(self, key, loader, fallback=None):
+        """
+        Gibt den Wert für key zurück; loader() wird nur bei Bedarf (und nur einmal gleichzeitig) aufgerufen.
+        Optional liefert fallback() bei einem Miss einen vorläufigen Wert (z.B. einen lokalen Snapshot);
+        dieser wird sofort ausgeliefert und wie ein abgelaufener Eintrag im Hintergrund erneuert.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.monotonic() - entry["fetched_at"] < self.ttl_seconds:
+                    self._stats["hits"] += 1
+                    return entry["value"]
+                self._stats["stale_hits"] += 1
+                if not entry["refreshing"]:
+                    entry["refreshing"] = True
+                    threading.Thread(target=self._refresh, args=(key, loader),
+                                     name=f"{self.name}-refresh", daemon=True).start()
+                return entry["value"]
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                is_owner = False
+            else:
+                self._stats["misses"] += 1
+                future = Future()
+                self._inflight[key] = future
+                is_owner = True
+
+        if not is_owner:
+            return future.result()
+
+        fallback_value = None
+        if fallback is not None:
+            try:
+                fallback_value = fallback()
+            except Exception as e:
+                print(f"WARNUNG ({self.name}): Fallback für '{key}' fehlgeschlagen: {e}")
+        if fallback_value is not None:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+                self._entries[key] = {"value": fallback_value, "fetched_at": float("-inf"), "refreshing": True}
+                self._inflight.pop(key, None)
+            future.set_result(fallback_value)
+            threading.Thread(target=self._refresh, args=(key, loader),
+                             name=f"{self.name}-refresh", daemon=True).start()
+            return fallback_value
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = {"value": value, "fetched_at": time.monotonic(), "refreshing": False}
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def _refresh(self, key, loader):
+        try:
+            value = loader()
+        except Exception as e:
+            print(f"WARNUNG ({self.name}): Hintergrund-Aktualisierung für '{key}' fehlgeschlagen: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["refreshing"] = False
+            return
+        with self._lock:
+            self._stats["refreshes"] += 1
+            self._entries[key] = {"value": value, "fetched_at": time.monotonic(), "refreshing": False}
+
+    def put(self, key, value):
+        """Legt einen frisch geladenen Wert direkt ab (z.B. nach einem expliziten Neuladen)."""
+        with self._lock:
+            self._entries[key] = {"value": value, "fetched_at": time.monotonic(), "refreshing": False}
+
+    def invalidate(self, key=None):
+        """Entfernt einen Eintrag (oder alle); laufende Requests werden nicht abgebrochen."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """Zähler für Hits/Misses etc. plus Anzahl der Einträge."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["ttl_seconds"] = self.ttl_seconds
+        return stats
@@ -0,0 +1,333 @@
+# modules/payment_reconciliation.py
+
+import io
+import re
+import csv
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+
+from modules.header_resolver import normalize_header, resolve_header_mapping
+from modules.deduplication import normalized_key_series
+from modules.sheet_loader import csv_content_hash, revision_cache_key, process_raw_dataframe
+
+PAYMENT_COLUMNS = ["Name", "Email", "Amount", "Reference", "Status"]
+
+# Status einer Zeile im Abgleichsergebnis
+PAID = "paid"
+UNPAID = "unpaid"
+AMBIGUOUS = "ambiguous"
+# Spalte mit dem Bezahlt-Status pro Zeile, die generate_participant_pdf auswertet
+PAID_COLUMN = "Paid"
+
+# Zuordnung pro Zahlung, stärkster Treffer zuerst; eine Zahlung zählt nur mit ihrem besten Treffertyp
+MATCH_RANKS = {"email": 0, "name": 1, "reference": 2}
+# Namen aus dem Verwendungszweck nur ab dieser Länge suchen (kurze Namen treffen sonst zufällig)
+REFERENCE_NAME_MIN_LENGTH = 6
+# So viele Zeilen vor der Kopfzeile werden übersprungen (Kontoauszüge beginnen oft mit Kontodaten)
+PREAMBLE_MAX_LINES = 15
+# Stornierte, abgelehnte oder noch offene Zahlungen zählen nicht (PayPal-/Bank-Status, normalisiert)
+EXCLUDED_STATUSES = {
+    "ausstehend", "pending", "storniert", "reversed", "refunded", "erstattet", "rückerstattet",
+    "abgelehnt", "denied", "failed", "fehlgeschlagen", "canceled", "cancelled", "vorgemerkt",
+}
+# Bankexporte umschreiben Umlaute (SEPA-Zeichensatz); normalisiert wird auf beiden Seiten gleich
+UMLAUT_TRANSLITERATIONS = {"ä": "ae", "ö": "oe", "ü": "ue"}
+# Werte in einer Zahlungsspalte der Antworttabelle, die "bezahlt" bedeuten (normalisiert)
+SHEET_PAID_VALUES = {"ja", "yes", "y", "x", "paid", "bezahlt", "true", "wahr", "1", "✓", "✔", "✔️", "erhalten", "received"}
+# Überschriften, an denen eine Zahlungsspalte in der Antworttabelle erkannt wird
+SHEET_PAYMENT_COLUMN_HINTS = ("bezahlt", "paid", "payment", "zahlung")
+
+PAYMENT_FILE_CACHE_MAX_ENTRIES = 8
+RECONCILIATION_CACHE_MAX_ENTRIES = 32
+
+_payment_files = OrderedDict()
+_reconciliations = OrderedDict()
+_cache_lock = threading.Lock()
+
+@dataclass(frozen=True)
+class ReconciliationResult:
+    """
+    Ergebnis eines Zahlungsabgleichs (gecacht, nicht verändern).
+    participants: Teilnehmer (gleicher Index) mit payment_status, match, payments, amount
+    unmatched_payments: Zahlungen ohne Teilnehmer; ambiguous_payments: Zahlungen mit mehreren Kandidaten
+    Bezahlt-Status pro Zeile (nicht pro Name: gleichnamige Teilnehmer bleiben getrennt) liefert with_paid_column.
+    """
+    participants: pd.DataFrame
+    unmatched_payments: pd.DataFrame
+    ambiguous_payments: pd.DataFrame
+    stats: dict
+
+    def with_paid_column(self, participants_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Kopie von participants_df (derselbe DataFrame wie beim Abgleich) mit der Spalte PAID_COLUMN
+        (True/False pro Zeile) für generate_participant_pdf.
+        """
+        if not self.participants.index.equals(participants_df.index):
+            raise ValueError("Teilnehmerliste passt nicht zum Zahlungsabgleich (anderer Index).")
+        marked = participants_df.copy()
+        marked[PAID_COLUMN] = (self.participants["payment_status"] == PAID).to_numpy()
+        return marked
+
+def _cache_get(cache: OrderedDict, key):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _cache_put(cache: OrderedDict, key, value, max_entries: int):
+    with _cache_lock:
+        value = cache.setdefault(key, value)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+    return value
+
+def parse_amounts(series: pd.Series) -> pd.Series:
+    """'1.234,56 €', '-5,00', '12.50' -> float (NaN, wenn nicht lesbar). Vektorisiert."""
+    text = series.astype(str).str.replace(r"[^\d,.\-]", "", regex=True)
+    # Dezimalkomma, wenn ein Komma mit 1-2 Nachkommastellen am Ende steht; Punkte sind dann Tausendertrenner
+    comma_decimal = text.str.contains(r",\d{1,2}$", regex=True)
+    text = text.where(~comma_decimal, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    text = text.where(comma_decimal, text.str.replace(",", "", regex=False))
+    return pd.to_numeric(text, errors="coerce")
+
+def _decode(file_bytes: bytes) -> str:
+    # Bank-Exporte sind häufig Windows-1252, PayPal UTF-8 mit BOM
+    try:
+        return file_bytes.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return file_bytes.decode("cp1252", errors="replace")
+
+def _find_header(text: str) -> tuple:
+    """(Zeilennummer, Trennzeichen, Spaltenzuordnung) der ersten Zeile, die wie ein Zahlungs-Header aussieht."""
+    for line_number, line in enumerate(text.splitlines()[:PREAMBLE_MAX_LINES]):
+        delimiter = max(";,\t", key=line.count)
+        fields = next(csv.reader([line], delimiter=delimiter), [])
+        if len(fields) < 2:
+            continue
+        mapping = resolve_header_mapping(tuple(fields), "payments")
+        if ("Name" in mapping or "Email" in mapping) and ("Amount" in mapping or "Reference" in mapping):
+            return line_number, delimiter, mapping
+    raise ValueError("Keine Kopfzeile mit Name/E-Mail und Betrag/Verwendungszweck gefunden.")
+
+def load_payment_csv(file_bytes: bytes) -> pd.DataFrame:
+    """
+    Liest einen Bank- oder PayPal-Export einmal pro Inhalt ein (Schlüssel: Inhalts-Hash).
+    Spalten werden über header_resolver (Schema 'payments') gefunden, Trennzeichen und
+    Vorspann-Zeilen automatisch erkannt. Storno-/Ausstehend-Zeilen und Ausgänge (Betrag <= 0)
+    werden verworfen. Gibt einen DataFrame mit PAYMENT_COLUMNS zurück (attrs['revision'] gesetzt).
+    """
+    content_hash = csv_content_hash(file_bytes)
+    cached = _cache_get(_payment_files, content_hash)
+    if cached is not None:
+        return cached
+
+    text = _decode(file_bytes)
+    header_line, delimiter, mapping = _find_header(text)
+    raw_df = pd.read_csv(io.StringIO(text), sep=delimiter, skiprows=header_line, dtype=str,
+                         keep_default_na=False, usecols=sorted(mapping.values()), skip_blank_lines=True)
+    by_field = {field: raw_df.iloc[:, sorted(mapping.values()).index(col_index)] for field, col_index in mapping.items()}
+    empty_column = pd.Series("", index=raw_df.index, dtype=object)
+
+    reference = by_field.get("Reference", empty_column)
+    if "Note" in by_field:
+        reference = (reference + " " + by_field["Note"]).str.strip()
+    payments_df = pd.DataFrame({
+        "Name": by_field.get("Name", empty_column).str.strip(),
+        "Email": by_field.get("Email", empty_column).str.strip(),
+        "Amount": parse_amounts(by_field["Amount"]) if "Amount" in by_field else float("nan"),
+        "Reference": reference,
+        "Status": by_field.get("Status", empty_column).str.strip(),
+    }, columns=PAYMENT_COLUMNS)
+
+    keep = ~normalized_key_series(payments_df["Status"]).isin(EXCLUDED_STATUSES)
+    keep &= ~(payments_df["Amount"] <= 0)
+    payments_df = payments_df[keep].reset_index(drop=True)
+    payments_df.attrs["revision"] = f"payments:{content_hash[:16]}"
+    payments_df.attrs["skipped_rows"] = int((~keep).sum())
+    return _cache_put(_payment_files, content_hash, payments_df, PAYMENT_FILE_CACHE_MAX_ENTRIES)
+
+def guess_payment_column(columns) -> str | None:
+    """Erste Spalte der Antworttabelle, deren Überschrift nach Zahlungsstatus aussieht (z.B. 'Bezahlt?')."""
+    for column in columns:
+        normalized = normalize_header(column)
+        if any(hint in normalized for hint in SHEET_PAYMENT_COLUMN_HINTS):
+            return column
+    return None
+
+def payments_from_sheet_column(raw_df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    Zahlungen aus einer Spalte der Formularantworten (z.B. 'Bezahlt' mit 'ja'/'x').
+    Name und E-Mail kommen aus denselben Zeilen, die Zuordnung ist damit eindeutig.
+    """
+    processed = process_raw_dataframe(raw_df)
+    marked = normalized_key_series(raw_df[column]).isin(SHEET_PAID_VALUES).to_numpy()
+    payments_df = pd.DataFrame({
+        "Name": processed["Name"].astype(str).to_numpy()[marked],
+        "Email": processed["Email"].astype(str).to_numpy()[marked],
+        "Amount": float("nan"),
+        "Reference": "",
+        "Status": "",
+    }, columns=PAYMENT_COLUMNS)
+    payments_df.attrs["revision"] = f"sheet:{raw_df.attrs.get('revision') or _frame_hash(raw_df)}:{column}"
+    return payments_df
+
+def _frame_hash(df: pd.DataFrame) -> str:
+    return hashlib.sha1(pd.util.hash_pandas_object(df.astype(str), index=True).values.tobytes()).hexdigest()[:16]
+
+def _participants_cache_key(df: pd.DataFrame) -> tuple:
+    """Listen-Revision plus Form und Index (unterscheidet z.B. unscharf/nicht unscharf deduplizierte Varianten)."""
+    return revision_cache_key(df) or ("content", _frame_hash(df[[c for c in ("Name", "Email") if c in df.columns]]))
+
+def _keys(df: pd.DataFrame, column: str) -> pd.Series:
+    """
+    normalize_key ohne Akzente und mit umschriebenen Umlauten, wie in SEPA-Bankexporten
+    ('Lucía Núñez' -> 'lucia nunez', 'Jörg Müller' -> 'joerg mueller').
+    """
+    if column not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    keys = normalized_key_series(df[column])
+    for umlaut, transliteration in UMLAUT_TRANSLITERATIONS.items():
+        keys = keys.str.replace(umlaut, transliteration, regex=False)
+    return (keys.str.normalize("NFKD")
+            .str.replace("[\u0300-\u036f]", "", regex=True).str.normalize("NFC"))
+
+def _name_keys(df: pd.DataFrame) -> pd.Series:
+    """Namensschlüssel unabhängig von der Reihenfolge ('MUSTERMANN, MAX' == 'Max Mustermann')."""
+    return _keys(df, "Name").str.replace(",", " ", regex=False).map(lambda name: " ".join(sorted(name.split())))
+
+def _reference_candidates(references: pd.Series, participant_keys: pd.DataFrame) -> pd.DataFrame:
+    """Teilnehmernamen, die im Verwendungszweck vorkommen (ein kompiliertes Muster für alle Namen)."""
+    names = participant_keys.loc[participant_keys["reference_key"].str.len() >= REFERENCE_NAME_MIN_LENGTH, "reference_key"]
+    names = sorted(set(names), key=len, reverse=True)
+    if not names or references.empty:
+        return pd.DataFrame(columns=["payment", "reference_key"])
+    pattern = r"(?<!\w)(" + "|".join(map(re.escape, names)) + r")(?!\w)"
+    found = references.str.findall(pattern).explode().dropna()
+    return pd.DataFrame({"payment": found.index, "reference_key": found.to_numpy()}).drop_duplicates()
+
+def reconcile_payments(participants_df: pd.DataFrame, payments_df: pd.DataFrame) -> ReconciliationResult:
+    """
+    Ordnet Zahlungen Teilnehmern zu: Hash-Joins über normalisierte E-Mail, dann normalisierten
+    Namen, zuletzt über Namen im Verwendungszweck. Pro Zahlung zählt nur der stärkste Treffertyp;
+    passt sie damit zu mehreren Teilnehmern (z.B. zwei gleichnamige Personen), wird sie als
+    mehrdeutig markiert und niemandem gutgeschrieben.
+    Gecacht pro (Listen-Revision, Zahlungsdatei); das Ergebnis darf nicht verändert werden.
+    """
+    cache_key = (_participants_cache_key(participants_df), payments_df.attrs.get("revision") or _frame_hash(payments_df),
+                 len(payments_df))
+    cached = _cache_get(_reconciliations, cache_key)
+    if cached is not None:
+        return cached
+
+    participant_keys = pd.DataFrame({
+        "participant": range(len(participants_df)),
+        "name_key": _name_keys(participants_df).to_numpy(),
+        "email_key": _keys(participants_df, "Email").to_numpy(),
+        "reference_key": _keys(participants_df, "Name").to_numpy(),
+    })
+    payment_keys = pd.DataFrame({
+        "payment": range(len(payments_df)),
+        "name_key": _name_keys(payments_df).to_numpy(),
+        "email_key": _keys(payments_df, "Email").to_numpy(),
+    })
+
+    candidates = []
+    for key, match in (("email_key", "email"), ("name_key", "name")):
+        joined = payment_keys.loc[payment_keys[key] != "", ["payment", key]].merge(
+            participant_keys.loc[participant_keys[key] != "", ["participant", key]], on=key)
+        candidates.append(joined[["payment", "participant"]].assign(match=match))
+    # Verwendungszweck nur für Zahlungen ohne direkten Treffer durchsuchen
+    matched_payments = set(pd.concat(candidates)["payment"])
+    open_references = _keys(payments_df, "Reference")
+    open_references.index = payment_keys["payment"]
+    open_references = open_references[~open_references.index.isin(matched_payments) & (open_references != "")]
+    by_reference = _reference_candidates(open_references, participant_keys).merge(
+        participant_keys[["participant", "reference_key"]], on="reference_key")
+    candidates.append(by_reference[["payment", "participant"]].assign(match="reference"))
+
+    candidates = (pd.concat(candidates, ignore_index=True).drop_duplicates(["payment", "participant"])
+                  .astype({"payment": int, "participant": int}))
+    candidates["rank"] = candidates["match"].map(MATCH_RANKS)
+    candidates = candidates[candidates["rank"] == candidates.groupby("payment")["rank"].transform("min")]
+    candidate_count = candidates.groupby("payment")["participant"].transform("nunique")
+    confirmed = candidates[candidate_count == 1]
+    ambiguous = candidates[candidate_count > 1]
+
+    amounts = payments_df["Amount"].to_numpy() if "Amount" in payments_df.columns else None
+    confirmed = confirmed.assign(amount=amounts[confirmed["payment"].to_numpy()] if amounts is not None else float("nan"))
+    per_participant = confirmed.groupby("participant").agg(
+        payments=("payment", "nunique"), amount=("amount", "sum"), rank=("rank", "min"))
+
+    status = pd.Series(UNPAID, index=range(len(participants_df)), dtype=object)
+    status[ambiguous["participant"].unique()] = AMBIGUOUS
+    status[per_participant.index] = PAID
+    match_names = {rank: match for match, rank in MATCH_RANKS.items()}
+    result_df = pd.DataFrame({
+        "Name": participants_df["Name"].to_numpy() if "Name" in participants_df.columns else "",
+        "Email": participants_df["Email"].to_numpy() if "Email" in participants_df.columns else "",
+        "payment_status": status.to_numpy(),
+        "match": per_participant["rank"].map(match_names).reindex(status.index).fillna("").to_numpy(),
+        "payments": per_participant["payments"].reindex(status.index).fillna(0).astype(int).to_numpy(),
+        "amount": per_participant["amount"].reindex(status.index).to_numpy(),
+    }, index=participants_df.index)
+
+    unmatched = payments_df[~payment_keys["payment"].isin(candidates["payment"]).to_numpy()]
+    # Kandidaten mit E-Mail anzeigen, gleichnamige Teilnehmer wären sonst nicht zu unterscheiden
+    labels = result_df["Name"].astype(str).to_numpy()
+    emails = result_df["Email"].astype(str).to_numpy()
+    labels = [f"{name} <{email}>" if email else name for name, email in zip(labels, emails)]
+    ambiguous_payments = payments_df.iloc[sorted(ambiguous["payment"].unique())].assign(
+        candidates=ambiguous.groupby("payment")["participant"].apply(
+            lambda positions: ", ".join(labels[pos] for pos in sorted(positions))).to_numpy())
+
+    result = ReconciliationResult(
+        participants=result_df,
+        unmatched_payments=unmatched,
+        ambiguous_payments=ambiguous_payments,
+        stats={
+            "participants": len(participants_df),
+            "payments": len(payments_df),
+            "paid": int((status == PAID).sum()),
+            "ambiguous": int((status == AMBIGUOUS).sum()),
+            "unmatched_payments": len(unmatched),
+            "multiple_payments": int((per_participant["payments"] > 1).sum()),
+            "skipped_rows": payments_df.attrs.get("skipped_rows", 0),
+        },
+    )
+    return _cache_put(_reconciliations, cache_key, result, RECONCILIATION_CACHE_MAX_ENTRIES)
+
+if __name__ == "__main__":
+    import time
+
+    test_participants = pd.DataFrame({
+        "Name": ["Max Mustermann", "Erika Musterfrau", "Lucía Núñez", "Anna Schmidt", "Anna Schmidt", "Tom Lee"],
+        "Email": ["max@test.de", "erika@test.de", "lucia@test.es", "anna1@test.de", "anna2@test.de", "tom@test.com"],
+    })
+    test_participants.attrs["revision"] = "test:1"
+    paypal_csv = (
+        '"Datum","Name","Status","Brutto","Absender E-Mail-Adresse","Artikelbezeichnung","Hinweis"\n'
+        '"01.10.2026","M. Mustermann","Abgeschlossen","5,00","MAX@test.de ","Welcome Week",""\n'
+        '"01.10.2026","NUNEZ, Lucia","Abgeschlossen","5,00","other@mail.com","",""\n'
+        '"02.10.2026","Anna Schmidt","Abgeschlossen","5,00","anna@private.de","",""\n'
+        '"02.10.2026","Papa Musterfrau","Abgeschlossen","5,00","papa@test.de","","für Erika Musterfrau"\n'
+        '"03.10.2026","Unbekannt","Abgeschlossen","5,00","x@y.z","",""\n'
+        '"03.10.2026","Tom Lee","Storniert","5,00","tom@test.com","",""\n'
+    ).encode("utf-8")
+
+    start = time.perf_counter()
+    payments = load_payment_csv(paypal_csv)
+    result = reconcile_payments(test_participants, payments)
+    print(f"Abgleich in {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(result.participants)
+    print(result.with_paid_column(test_participants)[["Name", "Email", PAID_COLUMN]])
+    print("Statistik:", result.stats)
+    print("Mehrdeutig:\n", result.ambiguous_payments[["Name", "candidates"]])
+    print("Ohne Zuordnung:\n", result.unmatched_payments[["Name", "Email"]])
+    start = time.perf_counter()
+    assert reconcile_payments(test_participants, load_payment_csv(paypal_csv)) is result
+    print(f"Erneut (Cache): {(time.perf_counter() - start) * 1000:.2f} ms")
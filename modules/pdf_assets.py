@@ -0,0 +1,153 @@
+# modules/pdf_assets.py
+
+import io
+import os
+import threading
+from datetime import datetime, timezone
+from collections import defaultdict
+
+import fpdf
+from fontTools import ttLib
+from fpdf import FPDF
+from PIL import Image
+
+try:
+    from fpdf.fonts import SubsetMap, TTFFont
+except ImportError:  # andere fpdf2-Version: add_cached_font fällt auf pdf.add_font zurück
+    SubsetMap = TTFFont = None
+
+# Auflösung, mit der das Logo für seine Zielbreite vorskaliert wird
+LOGO_RENDER_DPI = 300
+# add_cached_font baut TTFFont-Objekte an fpdf2 vorbei zusammen (__slots__, _hbfont, SubsetMap).
+# Getestet mit dieser Version (siehe requirements.txt); jede Version wird zusätzlich beim ersten
+# Gebrauch geprüft (_cached_font_matches_add_font), bei Abweichung gilt das öffentliche add_font.
+TESTED_FPDF_VERSION = "2.8.9"
+_REQUIRED_TTFFONT_SLOTS = {"i", "ttfont", "cw", "missing_glyphs", "biggest_size_pt", "_hbfont", "subset"}
+# Text für die Prüfung: Umlaute, Sonderzeichen und Glyphen außerhalb von Latin-1
+_SELF_CHECK_TEXT = "Grüße ÄÖÜ ß € ✓ 0123456789"
+
+_lock = threading.Lock()
+_font_templates = {}  # (Pfad, mtime, fontkey) -> (TTFFont-Vorlage, Font-Bytes)
+_font_checks = {}     # (Pfad, mtime) -> True, wenn add_cached_font dieselbe PDF erzeugt wie add_font
+_logo_images = {}     # (Pfad, mtime, Breite in mm) -> vorskaliertes PIL-Bild
+
+def _font_template(font_path: str, fontkey: str, style: str):
+    """Parst eine TTF-Datei einmal pro Prozess (cmap, Breitentabelle, Glyph-IDs, Deskriptor)."""
+    key = (os.path.abspath(font_path), os.path.getmtime(font_path), fontkey)
+    with _lock:
+        cached = _font_templates.get(key)
+    if cached is not None:
+        return cached
+    with open(font_path, "rb") as f:
+        font_bytes = f.read()
+    # Die Vorlage wird nie in ein Dokument eingebettet; das FPDF-Objekt dient nur dem Konstruktor
+    template = TTFFont(FPDF(), font_path, fontkey, style)
+    with _lock:
+        cached = _font_templates.setdefault(key, (template, font_bytes))
+    return cached
+
+def _add_font_from_template(pdf: FPDF, family: str, style: str, font_path: str):
+    style = "".join(sorted(style.upper()))
+    fontkey = f"{family.lower()}{style}"
+    if fontkey in pdf.fonts:
+        return
+    template, font_bytes = _font_template(font_path, fontkey, style)
+
+    font = TTFFont.__new__(TTFFont)
+    for attr in TTFFont.__slots__:
+        if hasattr(template, attr):
+            setattr(font, attr, getattr(template, attr))
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(io.BytesIO(font_bytes), recalcTimestamp=False, lazy=True)
+    font.cw = defaultdict(template.cw.default_factory, template.cw)
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font._hbfont = None
+    font.subset = SubsetMap(font)
+    pdf.fonts[fontkey] = font
+
+def _render_font_sample(font_path: str, cached: bool) -> bytes:
+    pdf = FPDF()
+    pdf.set_creation_date(datetime(2000, 1, 1, tzinfo=timezone.utc))
+    (_add_font_from_template if cached else FPDF.add_font)(pdf, "selfcheck", "", font_path)
+    pdf.add_page()
+    pdf.set_font("selfcheck", size=12)
+    pdf.cell(text=_SELF_CHECK_TEXT)
+    return bytes(pdf.output())
+
+def _cached_font_matches_add_font(font_path: str) -> bool:
+    """
+    Prüft einmal pro Schriftdatei, dass add_cached_font mit der installierten fpdf2-Version
+    byte-identische PDFs (gleiches eingebettetes Subset, gleiche Breiten) wie pdf.add_font erzeugt.
+    """
+    key = (os.path.abspath(font_path), os.path.getmtime(font_path))
+    with _lock:
+        result = _font_checks.get(key)
+    if result is not None:
+        return result
+    if TTFFont is None or not _REQUIRED_TTFFONT_SLOTS <= set(getattr(TTFFont, "__slots__", ())):
+        result = False
+    else:
+        try:
+            result = _render_font_sample(font_path, cached=True) == _render_font_sample(font_path, cached=False)
+        except Exception as e:
+            print(f"WARNUNG (pdf_assets): Prüfung des Schrift-Caches fehlgeschlagen: {type(e).__name__}: {e}")
+            result = False
+    if not result:
+        print(f"WARNUNG (pdf_assets): Schrift-Cache passt nicht zu fpdf2 {fpdf.__version__} "
+              f"(getestet: {TESTED_FPDF_VERSION}), verwende pdf.add_font für '{font_path}'.")
+    with _lock:
+        _font_checks[key] = result
+    return result
+
+def add_cached_font(pdf: FPDF, family: str, style: str, font_path: str):
+    """
+    Ersatz für pdf.add_font(family, style, font_path) ohne erneutes Parsen der Schriftdatei.
+    Geteilt werden nur die unveränderlichen Metriken der Vorlage. Jedes Dokument bekommt ein
+    eigenes fontTools-Objekt (aus den gecachten Bytes) und eine eigene SubsetMap, weil fpdf2
+    beim Speichern genau die im Dokument benutzten Glyphen herausschneidet und dabei das
+    fontTools-Objekt verändert.
+    Da dafür fpdf2-Interna nötig sind, wird beim ersten Gebrauch gegen pdf.add_font verglichen;
+    stimmt das Ergebnis nicht überein, wird immer das öffentliche add_font verwendet.
+    """
+    if _cached_font_matches_add_font(font_path):
+        _add_font_from_template(pdf, family, style, font_path)
+    else:
+        pdf.add_font(family, style, font_path)
+
+def get_logo_image(logo_path: str, width_mm: float) -> Image.Image:
+    """Logo einmal pro Prozess laden und auf die Zielbreite (LOGO_RENDER_DPI) verkleinern."""
+    key = (os.path.abspath(logo_path), os.path.getmtime(logo_path), width_mm)
+    with _lock:
+        image = _logo_images.get(key)
+    if image is not None:
+        return image
+    with Image.open(logo_path) as source:
+        source.load()
+        target_width = max(1, round(width_mm / 25.4 * LOGO_RENDER_DPI))
+        image = source.copy()
+    if image.width > target_width:
+        target_height = max(1, round(image.height * target_width / image.width))
+        image = image.resize((target_width, target_height), Image.LANCZOS)
+    # Farbprofil und sonstige Metadaten nicht in jedes Dokument mitschleppen
+    image.info = {}
+    with _lock:
+        image = _logo_images.setdefault(key, image)
+    return image
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # Selbsttest: eingebettetes Subset muss mit pdf.add_font übereinstimmen (python -m modules.pdf_assets)
+    font_paths = sys.argv[1:] or [os.path.join("fonts", "DejaVuSans.ttf"), os.path.join("fonts", "DejaVuSans-Bold.ttf")]
+    ok = True
+    for path in font_paths:
+        matches = _cached_font_matches_add_font(path)
+        ok = ok and matches
+        start = time.perf_counter()
+        for _ in range(20):
+            _render_font_sample(path, cached=matches)
+        print(f"{path}: {'OK' if matches else 'ABWEICHUNG'} (fpdf2 {fpdf.__version__}), "
+              f"{(time.perf_counter() - start) / 20 * 1000:.1f} ms pro Dokument")
+    sys.exit(0 if ok else 1)
@@ -1,7 +1,18 @@
 from fpdf import FPDF
 import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 import pandas as pd
 
+from modules.signature_registry import safe_signature_name
+from modules.signature_store import DEFAULT_EVENT_ID, get_signature_store
+from modules.signature_image_cache import signature_cell_image
+from modules.pdf_assets import add_cached_font, get_logo_image
+from modules.pdf_table import TableColumn, TableLayout, cell_ops, draw_ops, fit_text, wrapped_lines
+
 def sanitize_string_for_pdf(text: str, font_encoding: str = 'latin-1') -> str:
     """
     Entfernt oder ersetzt Zeichen in einem String, die von einer bestimmten
@@ -19,6 +30,7 @@ COL_WIDTHS = {
     "present": 14, "absent": 12,
 }
 ROW_HEIGHT_PARTICIPANT = 8 
+TABLE_HEADER_HEIGHT = 7
 DEFAULT_FONT_SIZE_TABLE = 7 
 DEFAULT_FONT_SIZE_HEADER_DETAILS = 10
 DEFAULT_FONT_SIZE_TITLE = 16
@@ -26,12 +38,75 @@ DEFAULT_FONT_SIZE_INFOTEXT = 7
 PARTICIPANTS_PER_PAGE = 15 
 FONT_NAME = "DejaVu"  # Standard-Schriftart für FPDF
 FALLBACK_FONT_NAME = "Arial"
+COL_HEADERS = {
+    "nr": "Nr.", "name": "Name", "mobile": "Mobile", "country": "Country", "erasmus": "ERASMUS",
+    "other_exch": "Other Exch.", "tutor": "Tutor", "signature": "Signature", "paid": "Paid",
+    "present": "Present", "absent": "Absent",
+}
+# Spaltenlayout der Teilnehmertabelle; Namen werden bei Überlänge verkleinert, alles andere gekürzt
+PARTICIPANT_COLUMNS = [TableColumn(key, COL_HEADERS[key], width, shrink=(key == "name"))
+                       for key, width in COL_WIDTHS.items()]
+
+# Bei Änderungen am Tabellen-/Seitenlayout erhöhen, damit gecachte Dokumente verfallen
+PDF_LAYOUT_VERSION = 2
+# Zuletzt erzeugte Dokumente (nur im Arbeitsspeicher: die PDFs enthalten Namen und Telefonnummern)
+PDF_DOCUMENT_CACHE_MAX_ENTRIES = 8
+
+_document_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"document_hits": 0}
+
+def _content_hash(value) -> str:
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
+
+def _cache_get(cache: OrderedDict, key, stat_key: str):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            _cache_stats[stat_key] += 1
+        return value
+
+def _cache_put(cache: OrderedDict, key, value, max_entries: int):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+
+def clear_pdf_caches():
+    with _cache_lock:
+        _document_cache.clear()
+
+def get_pdf_cache_stats() -> dict:
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["documents"] = len(_document_cache)
+    return stats
+
+@lru_cache(maxsize=256)
+def participant_type_flags(p_type_upper: str) -> tuple:
+    """(ERASMUS, Other Exch., Tutor)-Kreuze für einen Teilnehmertyp; pro Typ nur einmal berechnet."""
+    is_erasmus = "X" if "ERASMUS" in p_type_upper else ""
+    is_other_exchange = "X" if "OTHER" in p_type_upper or "FULL-TIME" in p_type_upper or "INTERNATIONAL STUDENT" in p_type_upper else ""
+    is_tutor = "X" if "TUTOR" in p_type_upper else ""
+    if "ERASMUS" in p_type_upper and ("OTHER" in p_type_upper or "FULL-TIME" in p_type_upper):
+        is_erasmus = ""
+    return is_erasmus, is_other_exchange, is_tutor
 
 class TeilnehmerlistePDF(FPDF):
 
     # Konstruktor
-    def __init__(self, event_name=None, event_date=None, event_tutors=None, event_price=None):
+    def __init__(self, event_name=None, event_date=None, event_tutors=None, event_price=None,
+                 event_id=DEFAULT_EVENT_ID, signature_store=None, signature_stamps=None):
         super().__init__('L', 'mm', 'A4')
+        self.event_id = event_id
+        self.signature_store = signature_store or get_signature_store()
+        # Einmal pro Dokument abfragen, wer unterschrieben hat; pro Zeile nur noch ein Dict-Lookup
+        if signature_stamps is None:
+            signature_stamps = self.signature_store.signature_stamps(event_id)
+        self.signature_stamps = signature_stamps
+        self.signed_keys = signature_stamps.keys()
         self.event_name_val = str(event_name) if event_name else "" 
         self.event_date_val = str(event_date) if event_date else ""
         self.event_tutors_val = str(event_tutors) if event_tutors else ""
@@ -45,8 +120,9 @@ class TeilnehmerlistePDF(FPDF):
         font_loaded = False
         try:
             if os.path.exists(font_path_regular) and os.path.exists(font_path_bold):
-                self.add_font(FONT_NAME, '', font_path_regular, uni=True)
-                self.add_font(FONT_NAME, 'B', font_path_bold, uni=True) 
+                # Schriften werden einmal pro Prozess geparst; pro Dokument wird nur das Subset erzeugt
+                add_cached_font(self, FONT_NAME, '', font_path_regular)
+                add_cached_font(self, FONT_NAME, 'B', font_path_bold)
                 self.current_font_family = FONT_NAME
                 font_loaded = True
         except RuntimeError as e: print(f"WARNUNG (PDF): Konnte Schriftart nicht laden: {e}.")
@@ -56,128 +132,190 @@ class TeilnehmerlistePDF(FPDF):
             self.current_font_family = FALLBACK_FONT_NAME
         
         self.set_font(self.current_font_family, '', 10)
+        self.table_layout = TableLayout(PARTICIPANT_COLUMNS, self.page_margin, ROW_HEIGHT_PARTICIPANT, DEFAULT_FONT_SIZE_TABLE)
         self.set_auto_page_break(auto=True, margin=self.page_margin + 5) 
         self.alias_nb_pages() 
         self.current_y_after_header_block = 0
+        # Kopf, Tabellenkopf und Fußzeile sind auf jeder Seite gleich: einmal pro Dokument eingepasst
+        # und gemessen (siehe _build_header_ops), danach nur noch per draw_ops abgespielt
+        self._header_ops = None
+        self._header_bottom = 0
+        self._table_header_ops = None
+        self._footer_ops = None
 
     # Header-Methode.
     def header(self):
         prev_font_family = self.font_family
         prev_font_style = self.font_style
-        prev_font_size = self.font_size
+        prev_font_size = self.font_size_pt
 
+        if self._header_ops is None:
+            self._header_ops = self._build_header_ops()
+        draw_ops(self, self._header_ops)
+        self.current_y_after_header_block = self._header_bottom
+        self.add_table_header()
+        
+        self.set_font(prev_font_family, prev_font_style, prev_font_size)
+
+    def _build_header_ops(self) -> list:
+        """
+        Logo, Titel, Eventdaten und Infotext des Seitenkopfs als Zeichenoperationen (gleiche Positionen
+        wie die früheren cell()-Aufrufe). Setzt _header_bottom auf die y-Position unter dem Infotext.
+        """
+        ops = []
         data_dir = "data"; logo_file = "I-CLUB_LOGO.png"; logo_path = os.path.join(data_dir, logo_file)
         logo_x = self.page_margin; logo_y = self.page_margin - 2; logo_w = 25 
+        logo_placeholder = None
         if os.path.exists(logo_path):
-            try: self.image(logo_path, logo_x, logo_y, logo_w)
-            except Exception:
-                self.set_xy(logo_x, logo_y); self.set_font(self.current_font_family, 'B', 8); self.cell(logo_w, 10, '[Logo Fehler]', 0, 0, 'C')
+            # Vorskaliertes Logo aus dem Prozess-Cache statt der 2835x2835-Originaldatei
+            try: ops.append(("image", get_logo_image(logo_path, logo_w), logo_x, logo_y, logo_w))
+            except Exception: logo_placeholder = '[Logo Fehler]'
         else: 
-            self.set_xy(logo_x, logo_y); self.set_font(self.current_font_family, 'B', 8); self.cell(logo_w, 10, '[Logo fehlt]', 0, 0, 'C')
+            logo_placeholder = '[Logo fehlt]'
+        if logo_placeholder:
+            self.set_font(self.current_font_family, 'B', 8); ops.append(("font", self.current_font_family, 'B', 8))
+            ops += cell_ops(self, logo_x, logo_y, logo_w, 10, logo_placeholder, align='C')
         
-        self.set_font(self.current_font_family, 'B', DEFAULT_FONT_SIZE_TITLE); self.set_y(logo_y) 
-        self.cell(0, 10, 'Participant List / Teilnehmerliste', 0, 1, 'C') 
+        self.set_font(self.current_font_family, 'B', DEFAULT_FONT_SIZE_TITLE)
+        ops.append(("font", self.current_font_family, 'B', DEFAULT_FONT_SIZE_TITLE))
+        ops += cell_ops(self, self.l_margin, logo_y, 0, 10, 'Participant List / Teilnehmerliste', align='C')
         
         self.set_font(self.current_font_family, '', DEFAULT_FONT_SIZE_HEADER_DETAILS)
-        current_y_after_title = self.get_y(); event_details_x_start = logo_x + logo_w + 5 
+        ops.append(("font", self.current_font_family, '', DEFAULT_FONT_SIZE_HEADER_DETAILS))
+        current_y_after_title = logo_y + 10; event_details_x_start = logo_x + logo_w + 5 
         
         header_field_height = 7; label_width = 20 
         event_name_value_width = 100; date_value_width = 70; tutors_value_width = 100
         price_label_w = 15; price_value_w = 25 
-
-        self.set_xy(event_details_x_start, current_y_after_title)
-        self.cell(label_width, header_field_height, 'Event:', 0, 0, 'L') 
-        self.cell(event_name_value_width, header_field_height, self.event_name_val, 'B', 0, 'L') 
-        self.set_x(self.w - self.page_margin - price_value_w - price_label_w) 
-        self.cell(price_label_w, header_field_height, 'Price:', 0, 0, 'R') 
-        self.cell(price_value_w, header_field_height, self.event_price_val, 'B', 1, 'L') 
-
-        self.set_x(event_details_x_start) 
-        self.cell(label_width, header_field_height, 'Date:', 0, 0, 'L')
-        self.cell(date_value_width, header_field_height, self.event_date_val, 'B', 1, 'L') 
-
-        self.set_x(event_details_x_start)
-        self.cell(label_width, header_field_height, 'Tutors:', 0, 0, 'L')
-        self.cell(tutors_value_width, header_field_height, self.event_tutors_val, 'B', 1, 'L') 
-        self.ln(3) 
+        # Überlange Werte (z.B. alle Tutoren als Standard) auf die Feldbreite kürzen statt über die Seite laufen zu lassen
+        def header_value(text, width):
+            return fit_text(self, text, width, DEFAULT_FONT_SIZE_HEADER_DETAILS, min_size=DEFAULT_FONT_SIZE_HEADER_DETAILS)[0]
+
+        value_x = event_details_x_start + label_width
+        price_label_x = self.w - self.page_margin - price_value_w - price_label_w
+        y = current_y_after_title
+        ops += cell_ops(self, event_details_x_start, y, label_width, header_field_height, 'Event:')
+        ops += cell_ops(self, value_x, y, event_name_value_width, header_field_height, header_value(self.event_name_val, event_name_value_width), 'B')
+        ops += cell_ops(self, price_label_x, y, price_label_w, header_field_height, 'Price:', align='R')
+        ops += cell_ops(self, price_label_x + price_label_w, y, price_value_w, header_field_height, header_value(self.event_price_val, price_value_w), 'B')
+        y += header_field_height
+
+        ops += cell_ops(self, event_details_x_start, y, label_width, header_field_height, 'Date:')
+        ops += cell_ops(self, value_x, y, date_value_width, header_field_height, header_value(self.event_date_val, date_value_width), 'B')
+        y += header_field_height
+
+        ops += cell_ops(self, event_details_x_start, y, label_width, header_field_height, 'Tutors:')
+        ops += cell_ops(self, value_x, y, tutors_value_width, header_field_height, header_value(self.event_tutors_val, tutors_value_width), 'B')
+        y += header_field_height + 3
 
         self.set_font(self.current_font_family, '', DEFAULT_FONT_SIZE_INFOTEXT)
+        ops.append(("font", self.current_font_family, '', DEFAULT_FONT_SIZE_INFOTEXT))
         infotext = (
             "People who signed up and paid do not get their money back. You are responsible for selling the ticket yourself.\n\n"
             "With your signature you confirm that you approve of the International Club publishing fotos and videos of you or with you on them on social media and tag you.\n"
             "If you do not agree, let one of the organizers know and we will note it on this list. The International Club commits on its part to use the fotos and videos purely "
             "for marketing purposes that do not violate a person's privacy and dignity."
         )
-        self.set_x(self.page_margin); self.multi_cell(0, 3.5, infotext, 0, 'L'); self.ln(2) 
-        self.current_y_after_header_block = self.get_y()
-        self.add_table_header()
-        
-        self.set_font(prev_font_family, prev_font_style, prev_font_size)
+        info_width = self.w - 2 * self.page_margin
+        for info_line in wrapped_lines(self, infotext, info_width):
+            ops += cell_ops(self, self.page_margin, y, info_width, 3.5, info_line)
+            y += 3.5
+        self._header_bottom = y + 2
+        return ops
 
     # Footer-Methode.
     def footer(self):
-        self.set_y(-(self.page_margin + 5))
-        self.set_font(self.current_font_family, '', 10)
-        self.cell(0, 10, 'Unterschrift organisierender Tutor: ___________________________', 0, 0, 'L')
+        footer_y = self.h - (self.page_margin + 5)
+        if self._footer_ops is None:
+            self.set_font(self.current_font_family, '', 10)
+            self._footer_ops = [("font", self.current_font_family, '', 10)]
+            self._footer_ops += cell_ops(self, self.l_margin, footer_y, 0, 10, 'Unterschrift organisierender Tutor: ___________________________')
+        draw_ops(self, self._footer_ops)
+        # Seitenzahl weiter über cell(): nur dort ersetzt fpdf2 den Platzhalter {nb} durch die Seitenanzahl
+        self.set_xy(self.w - self.r_margin, footer_y)
         self.set_font(self.current_font_family, '', 8)
         self.cell(0, 10, f'Seite {self.page_no()}/{{nb}}', 0, 0, 'R') 
 
     # Tabellen-Methode:
     def add_table_header(self):
-        self.set_y(self.current_y_after_header_block) 
-        self.set_x(self.page_margin)
-        self.set_font(self.current_font_family, 'B', DEFAULT_FONT_SIZE_TABLE + 1) 
-        self.set_fill_color(220, 220, 220); self.set_line_width(0.2)
-        headers = ["Nr.", "Name", "Mobile", "Country", "ERASMUS", "Other Exch.", "Tutor", "Signature", "Paid", "Present", "Absent"]
-        col_keys = ["nr", "name", "mobile", "country", "erasmus", "other_exch", "tutor", "signature", "paid", "present", "absent"]
-        for i, header_text in enumerate(headers): 
-            self.cell(COL_WIDTHS[col_keys[i]], 7, header_text, 1, 0, 'C', fill=True)
-        self.ln()
+        if self._table_header_ops is None:
+            self.set_font(self.current_font_family, 'B', DEFAULT_FONT_SIZE_TABLE + 1)
+            ops = [("font", self.current_font_family, 'B', DEFAULT_FONT_SIZE_TABLE + 1),
+                   ("fill", 220, 220, 220), ("line_width", 0.2)]
+            x = self.page_margin
+            for column in PARTICIPANT_COLUMNS:
+                ops += cell_ops(self, x, 0, column.width, TABLE_HEADER_HEIGHT, column.header, 1, 'C', fill=True)
+                x += column.width
+            self._table_header_ops = ops
+        draw_ops(self, self._table_header_ops, dy=self.current_y_after_header_block)
+        self.set_xy(self.page_margin, self.current_y_after_header_block + TABLE_HEADER_HEIGHT)
 
     # Teilnehmerzeile zur PDF hinzufügen.   
     def add_participant_row(self, idx, name, mobile, country, p_type, is_paid=False):
-        self.set_x(self.page_margin)
         self.set_font(self.current_font_family, '', DEFAULT_FONT_SIZE_TABLE)
         self.set_line_width(0.2)
-        
+        fitted, images = self.prepare_participant_row(idx, name, mobile, country, p_type, is_paid)
+        self.table_layout.render_row(self, self.get_y(), fitted, images)
+
+    def rows_fitting_on_page(self) -> int:
+        """Wie viele Teilnehmerzeilen ab der aktuellen Position noch auf die Seite passen (gleiche Regel wie beim Zeichnen)."""
+        y = self.get_y(); limit = self.h - self.b_margin - ROW_HEIGHT_PARTICIPANT * 2; count = 0
+        while y <= limit:
+            y += ROW_HEIGHT_PARTICIPANT; count += 1
+        return count
+
+    def add_participant_page(self, fitted_rows: list, images_rows: list):
+        """Zeichnet die vorbereiteten Zeilen einer Seite (siehe prepare_participant_rows) in einem Durchgang."""
+        self.set_font(self.current_font_family, '', DEFAULT_FONT_SIZE_TABLE)
+        self.set_line_width(0.2)
+        self.table_layout.render_rows(self, self.get_y(), fitted_rows, images_rows)
+
+    def prepare_participant_rows(self, rows: list) -> tuple:
+        """
+        Bereitet alle Zeilen einer Gruppe einmal pro Dokument vor. rows sind (Nr., Name, Mobile, Country,
+        Type, bezahlt, Unterschrifts-Marke)-Tupel; eingepasst wird spaltenweise (TableLayout.fit_columns).
+        Gibt (eingepasste Zeilen, Unterschriftsbilder pro Zeile) zurück.
+        """
+        self.set_font(self.current_font_family, '', DEFAULT_FONT_SIZE_TABLE)
+        values_rows, images_rows = [], []
+        for row in rows:
+            values, images = self.participant_row_values(*row[:6])
+            values_rows.append(values)
+            images_rows.append(images)
+        return self.table_layout.fit_columns(self, values_rows), images_rows
+
+    def prepare_participant_row(self, idx, name, mobile, country, p_type, is_paid=False) -> tuple:
+        """Eingepasste Zellen und Unterschriftsbild einer Zeile, unabhängig vom konkreten Dokument."""
+        values, images = self.participant_row_values(idx, name, mobile, country, p_type, is_paid)
+        return self.table_layout.fit_row(self, values), images
+
+    def participant_row_values(self, idx, name, mobile, country, p_type, is_paid=False) -> tuple:
+        """Zellwerte (Spaltenschlüssel -> Text) und Unterschriftsbild einer Zeile, noch nicht eingepasst."""
         encoding_to_use = 'latin-1' if self.current_font_family == FALLBACK_FONT_NAME else 'utf-8'
 
-        name_str = sanitize_string_for_pdf(str(name if pd.notna(name) else ""), encoding_to_use)
-        mobile_str = sanitize_string_for_pdf(str(mobile if pd.notna(mobile) else ""), encoding_to_use)
-        country_str = sanitize_string_for_pdf(str(country if pd.notna(country) else ""), encoding_to_use)
-        p_type_str_upper = str(p_type if pd.notna(p_type) else "").upper()
-        
-        is_erasmus = "X" if "ERASMUS" in p_type_str_upper else ""
-        is_other_exchange = "X" if "OTHER" in p_type_str_upper or "FULL-TIME" in p_type_str_upper or "INTERNATIONAL STUDENT" in p_type_str_upper else ""
-        is_tutor = "X" if "TUTOR" in p_type_str_upper else ""
-        if "ERASMUS" in p_type_str_upper and ("OTHER" in p_type_str_upper or "FULL-TIME" in p_type_str_upper): 
-            is_erasmus = ""
-
-        safe_name_for_file = "".join(x for x in name_str if x.isalnum() or x in " _-").strip().replace(" ", "_")
-        signature_path = os.path.join("signatures", f"{safe_name_for_file}.png")
-        has_signature = os.path.exists(signature_path)
-        
-        present_val = ""
-        absent_val = ""
-        
-        paid_val = "✔️" if is_paid else ""
-        
-        row_data_map = {"nr": str(idx), "name": name_str, "mobile": mobile_str, "country": country_str, "erasmus": is_erasmus, "other_exch": is_other_exchange, "tutor": is_tutor, "signature": "", "paid": paid_val, "present": present_val, "absent": absent_val}
-        col_keys = list(COL_WIDTHS.keys())
-        
-        for key in col_keys:
-            width = COL_WIDTHS[key]; text_val = row_data_map[key] 
-            current_x_cell = self.get_x(); current_y_cell = self.get_y()
-            if key == "signature" and has_signature:
-                self.cell(width, ROW_HEIGHT_PARTICIPANT, '', 1, 0, 'C') 
-                try: 
-                    self.image(signature_path, x=current_x_cell + 1, y=current_y_cell + 1, w=width - 2, h=ROW_HEIGHT_PARTICIPANT - 2)
-                except Exception:
-                    pass 
-            else:
-                self.multi_cell(width, ROW_HEIGHT_PARTICIPANT, text_val, 1, 'C', fill=False)
-                self.set_xy(current_x_cell + width, current_y_cell)
-        self.ln(ROW_HEIGHT_PARTICIPANT)
+        raw_name = str(name if pd.notna(name) else "")
+        is_erasmus, is_other_exchange, is_tutor = participant_type_flags(str(p_type if pd.notna(p_type) else "").upper())
+
+        signature_blob = None
+        if safe_signature_name(raw_name) in self.signed_keys:
+            signature_blob = self.signature_store.load(self.event_id, raw_name)
+        images = None
+        if signature_blob is not None:
+            try:
+                # In Zellgröße vorskaliert (1 Bit, über PDF-Läufe gecacht) statt das volle Canvas-Bild einzubetten
+                images = {"signature": signature_cell_image(signature_blob, COL_WIDTHS["signature"] - 2, ROW_HEIGHT_PARTICIPANT - 2)}
+            except Exception:
+                pass
+
+        row_data_map = {
+            "nr": str(idx),
+            "name": sanitize_string_for_pdf(raw_name, encoding_to_use),
+            "mobile": sanitize_string_for_pdf(str(mobile if pd.notna(mobile) else ""), encoding_to_use),
+            "country": sanitize_string_for_pdf(str(country if pd.notna(country) else ""), encoding_to_use),
+            "erasmus": is_erasmus, "other_exch": is_other_exchange, "tutor": is_tutor,
+            "paid": "✔" if is_paid else "",
+        }
+        return row_data_map, images
 
 # ENDE DER KLASSE
 
@@ -188,16 +326,21 @@ class TeilnehmerlistePDF(FPDF):
 # Ersetzen Sie die komplette Funktion am Ende Ihrer Datei
 # Ersetzen Sie diese komplette Funktion in Ihrer pdf_generator.py
 
-def generate_participant_pdf(participants: list, filename="output/Teilnehmerliste.pdf",
+def generate_participant_pdf(participants: list, filename: str | None = None,
                              event_name=None, event_date=None, event_tutors=None, event_price=None,
-                             paid_list: list = None):
+                             paid_list: list = None, event_id: str = DEFAULT_EVENT_ID,
+                             output_buffer=None) -> bytes:
     """
     Erzeugt eine PDF-Teilnehmerliste mit korrekten Seitenumbrüchen.
-    Kreuzt 'Paid' an für Teilnehmer in der 'paid_list'.
+    Kreuzt 'Paid' an, wenn der Teilnehmer-Eintrag ein 'Paid'-Feld hat (pro Zeile, z.B. aus
+    ReconciliationResult.with_paid_column), sonst für Teilnehmer, deren Name in 'paid_list' steht.
     Trennt 'Nothing of the above' sauber auf eine neue Seite.
+    Unterschriften werden für event_id aus dem konfigurierten SignatureStore gelesen.
+    Die PDF entsteht im Arbeitsspeicher und wird als bytes zurückgegeben; zusätzlich wird sie
+    in output_buffer (z.B. io.BytesIO) geschrieben bzw. unter filename gespeichert, falls angegeben.
+    Hat sich seit dem letzten Aufruf nichts geändert (Teilnehmer, Bezahlt-Status, Unterschriften,
+    Kopfdaten), wird das zuletzt erzeugte Dokument zurückgegeben.
     """
-    os.makedirs("output", exist_ok=True)
-
     if paid_list is None:
         paid_list = []
     # Normalisiert die Namen in der "paid_list" für einen robusten Abgleich
@@ -223,37 +366,75 @@ def generate_participant_pdf(participants: list, filename="output/Teilnehmerlist
         tutor_names_list = [p.get("Name", "") for p in participants if str(p.get("Type", "")).upper() == "TUTOR"]
         final_tutors_string = ", ".join(filter(None, tutor_names_list)) if tutor_names_list else ""
 
+    # Zeilen beider Gruppen samt Bezahlt-Status und Unterschrifts-Marke: daraus ergeben sich
+    # der Schlüssel für den Dokument-Cache
+    signature_store = get_signature_store()
+    signature_stamps = signature_store.signature_stamps(event_id)
+
+    def participant_rows(participant_list):
+        rows = []
+        for i, person_dict in enumerate(participant_list, start=1):
+            name = person_dict.get("Name", "")
+            if "Paid" in person_dict:
+                paid_value = person_dict["Paid"]
+                has_paid = bool(paid_value) if pd.notna(paid_value) else False
+            else:
+                has_paid = str(name).strip().lower() in normalized_paid_set
+            signature_stamp = signature_stamps.get(safe_signature_name(str(name if pd.notna(name) else "")))
+            rows.append((i, name, person_dict.get("Mobile", ""), person_dict.get("Country", ""),
+                         person_dict.get("Type", ""), has_paid, signature_stamp))
+        return rows
+
+    regular_rows = participant_rows(regular_participants)
+    special_rows = participant_rows(special_participants)
+    document_key = _content_hash((PDF_LAYOUT_VERSION, event_name, event_date, final_tutors_string, event_price,
+                                  event_id, regular_rows, special_rows))
+    pdf_bytes = _cache_get(_document_cache, document_key, "document_hits")
+    if pdf_bytes is None:
+        pdf_bytes = _render_participant_pdf(regular_rows, special_rows, event_name, event_date,
+                                            final_tutors_string, event_price, event_id,
+                                            signature_store, signature_stamps)
+        _cache_put(_document_cache, document_key, pdf_bytes, PDF_DOCUMENT_CACHE_MAX_ENTRIES)
+
+    if output_buffer is not None:
+        output_buffer.write(pdf_bytes)
+    if filename:
+        try:
+            _write_file_atomic(filename, pdf_bytes)
+        except OSError as e:
+            raise RuntimeError(f"Fehler beim Speichern der PDF '{filename}': {e}") from e
+    return pdf_bytes
+
+def _render_participant_pdf(regular_rows, special_rows, event_name, event_date, event_tutors, event_price,
+                            event_id, signature_store, signature_stamps) -> bytes:
+    """Baut das Dokument seitenweise auf; die Zeilen jeder Gruppe werden vorher einmal vorbereitet."""
     pdf = TeilnehmerlistePDF(event_name=event_name, event_date=event_date,
-                             event_tutors=final_tutors_string, event_price=event_price)
-    
+                             event_tutors=event_tutors, event_price=event_price,
+                             event_id=event_id, signature_store=signature_store,
+                             signature_stamps=signature_stamps)
+
     # --- HILFSFUNKTION FÜR KORREKTES HINZUFÜGEN VON TEILNEHMERGRUPPEN ---
-    def add_participant_group_to_pdf(participant_list, start_index=1):
-        for i, person_dict in enumerate(participant_list):
-            # PRÜFUNG FÜR SEITENUMBRUCH:
-            # Passt noch eine weitere Zeile auf die Seite, bevor wir den unteren Rand erreichen?
-            # pdf.h = Seitenhöhe, pdf.b_margin = unterer Rand.
-            if pdf.get_y() > (pdf.h - pdf.b_margin - ROW_HEIGHT_PARTICIPANT * 2):
-                 pdf.add_page() # FPDF fügt automatisch einen neuen Header hinzu.
-            
-            # Daten aus dem Dictionary extrahieren
-            name = person_dict.get("Name", "")
-            mobile = person_dict.get("Mobile", "")
-            country = person_dict.get("Country", "")
-            p_type = person_dict.get("Type", "")
-            
-            # Prüfen, ob der Teilnehmer bezahlt hat
-            has_paid = name.strip().lower() in normalized_paid_set
-            
-            # Teilnehmerzeile mit korrekter fortlaufender Nummerierung hinzufügen
-            pdf.add_participant_row(start_index + i, name, mobile, country, p_type, is_paid=has_paid)
+    def add_participant_group_to_pdf(rows):
+        fitted_rows, images_rows = pdf.prepare_participant_rows(rows)
+        position = 0
+        while position < len(rows):
+            # PRÜFUNG FÜR SEITENUMBRUCH: so viele Zeilen, wie vor dem unteren Rand noch passen
+            capacity = pdf.rows_fitting_on_page()
+            if capacity == 0:
+                pdf.add_page() # FPDF fügt automatisch einen neuen Header hinzu.
+                continue
+            pdf.add_participant_page(fitted_rows[position:position + capacity], images_rows[position:position + capacity])
+            position += capacity
+            if position < len(rows):
+                pdf.add_page()
 
     # --- HAUPTLOGIK FÜR DIE PDF-ERSTELLUNG ---
     pdf.add_page() # Erste Seite explizit starten
     
-    if regular_participants:
-        add_participant_group_to_pdf(regular_participants, start_index=1)
+    if regular_rows:
+        add_participant_group_to_pdf(regular_rows)
 
-    if special_participants:
+    if special_rows:
         pdf.add_page() # Neue Seite für die spezielle Gruppe erzwingen
         
         # Titel für die spezielle Gruppe hinzufügen
@@ -266,12 +447,25 @@ def generate_participant_pdf(participants: list, filename="output/Teilnehmerlist
         pdf.add_table_header() # Den Tabellenkopf manuell neu zeichnen
         
         # Die spezielle Gruppe mit Nummerierung ab 1 hinzufügen
-        add_participant_group_to_pdf(special_participants, start_index=1)
+        add_participant_group_to_pdf(special_rows)
+
+    return bytes(pdf.output())
 
+def _write_file_atomic(filename: str, content: bytes):
+    """Schreibt über eine temporäre Datei + os.replace, damit nie eine halbe PDF sichtbar ist."""
+    target_dir = os.path.dirname(filename) or "."
+    os.makedirs(target_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, prefix=".tmp-", suffix=".pdf")
     try:
-        pdf.output(filename, 'F')
-    except Exception as e:
-        raise RuntimeError(f"Fehler beim Speichern der PDF '{filename}': {e}") from e
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
 
 if __name__ == "__main__":
     print("Starte Testlauf für modules/pdf_generator.py...")
@@ -0,0 +1,213 @@
+# modules/pdf_table.py
+
+import threading
+from dataclasses import dataclass
+
+from fpdf import FPDF
+
+# Innenabstand links/rechts in einer Tabellenzelle (mm)
+CELL_PADDING_MM = 1.0
+# Lange Namen werden bis zu dieser Schriftgröße verkleinert, erst danach mit "…" gekürzt
+MIN_FONT_SIZE = 4.5
+FONT_SIZE_STEP = 0.5
+ELLIPSIS = "…"
+TEXT_WIDTH_CACHE_MAX_ENTRIES = 50_000
+# fpdf2 setzt die Grundlinie in cell() auf y + h/2 + 0.3 * Schriftgröße; die Tabelle macht es genauso
+BASELINE_FACTOR = 0.3
+
+_text_widths = {}
+_text_widths_lock = threading.Lock()
+_wrapped_lines = {}
+
+def text_width(pdf: FPDF, text: str, size: float) -> float:
+    """
+    Breite von text in mm bei Schriftgröße size in der aktuellen Schriftfamilie/-stil.
+    Prozessweit gecacht: Schriftmetriken sind dank pdf_assets für alle Dokumente identisch.
+    """
+    key = (pdf.font_family, pdf.font_style, size, text)
+    width = _text_widths.get(key)
+    if width is None:
+        previous_size = pdf.font_size_pt
+        if previous_size != size:
+            pdf.set_font_size(size)
+        width = pdf.get_string_width(text)
+        if previous_size != size:
+            pdf.set_font_size(previous_size)
+        with _text_widths_lock:
+            if len(_text_widths) >= TEXT_WIDTH_CACHE_MAX_ENTRIES:
+                _text_widths.clear()
+            _text_widths[key] = width
+    return width
+
+def fit_text(pdf: FPDF, text: str, width_mm: float, size: float, min_size: float = MIN_FONT_SIZE) -> tuple:
+    """
+    Passt text in eine Zelle der Breite width_mm ein: erst Schrift verkleinern (bis min_size),
+    danach mit "…" kürzen. Gibt (Text, Schriftgröße, Textbreite) zurück.
+    """
+    available = width_mm - 2 * CELL_PADDING_MM
+    width = text_width(pdf, text, size)
+    if width <= available or not text:
+        return text, size, width
+    # Breite skaliert linear mit der Schriftgröße
+    shrunk = int(size * available / width / FONT_SIZE_STEP) * FONT_SIZE_STEP
+    if shrunk >= min_size:
+        return text, shrunk, text_width(pdf, text, shrunk)
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if text_width(pdf, text[:mid].rstrip() + ELLIPSIS, min_size) <= available:
+            lo = mid
+        else:
+            hi = mid - 1
+    truncated = text[:lo].rstrip() + ELLIPSIS
+    return truncated, min_size, text_width(pdf, truncated, min_size)
+
+def wrapped_lines(pdf: FPDF, text: str, width_mm: float) -> list:
+    """Zeilenumbruch eines Fließtexts (z.B. Infotext im Seitenkopf), einmal pro Text/Schrift/Breite berechnet."""
+    key = (pdf.font_family, pdf.font_style, pdf.font_size_pt, width_mm, text)
+    lines = _wrapped_lines.get(key)
+    if lines is None:
+        lines = pdf.multi_cell(width_mm, 1, text, dry_run=True, output="LINES")
+        _wrapped_lines[key] = lines
+    return lines
+
+def cell_ops(pdf: FPDF, x: float, y: float, w: float, h: float, text: str = "", border=0,
+             align: str = "L", fill: bool = False) -> list:
+    """
+    Zeichenoperationen, die dasselbe ergeben wie pdf.cell(w, h, text, border, align=align, fill=fill)
+    an Position (x, y): Rahmen bzw. Unterstrich, Text mit Innenabstand c_margin und gleicher Grundlinie.
+    Gemessen wird einmal mit der aktuellen Schrift; abgespielt werden die Operationen mit draw_ops
+    auf beliebig vielen Seiten, ohne das Text-Layout von cell() jedes Mal zu durchlaufen.
+    """
+    if w == 0:
+        w = pdf.w - pdf.r_margin - x
+    ops = []
+    if border == 1 or fill:
+        ops.append(("rect", x, y, w, h, ("DF" if border == 1 else "F") if fill else "D"))
+    elif border == "B":
+        ops.append(("line", x, y + h, x + w, y + h))
+    if text:
+        width = text_width(pdf, text, pdf.font_size_pt)
+        if align == "C":
+            dx = (w - width) / 2
+        elif align == "R":
+            dx = w - pdf.c_margin - width
+        else:
+            dx = pdf.c_margin
+        ops.append(("text", x + dx, y + h / 2 + BASELINE_FACTOR * pdf.font_size, text))
+    return ops
+
+def draw_ops(pdf: FPDF, ops: list, dy: float = 0.0):
+    """Spielt vorab berechnete Zeichenoperationen (cell_ops, Schrift-/Farbwechsel, Bilder) um dy verschoben ab."""
+    for op in ops:
+        kind = op[0]
+        if kind == "text":
+            pdf.text(op[1], op[2] + dy, op[3])
+        elif kind == "line":
+            pdf.line(op[1], op[2] + dy, op[3], op[4] + dy)
+        elif kind == "rect":
+            pdf.rect(op[1], op[2] + dy, op[3], op[4], style=op[5])
+        elif kind == "font":
+            pdf.set_font(op[1], op[2], op[3])
+        elif kind == "fill":
+            pdf.set_fill_color(*op[1:])
+        elif kind == "line_width":
+            pdf.set_line_width(op[1])
+        elif kind == "image":
+            pdf.image(op[1], x=op[2], y=op[3] + dy, w=op[4])
+
+@dataclass(frozen=True)
+class TableColumn:
+    key: str
+    header: str
+    width: float
+    shrink: bool = False  # lange Werte verkleinern statt nur zu kürzen (z.B. Namen)
+
+class TableLayout:
+    """
+    Vorberechnetes Spaltenlayout einer Tabelle (x-Positionen, Zeilenhöhe, Schrift).
+    fit_columns passt alle Werte spaltenweise ein (jeder verschiedene Wert einer Spalte nur einmal),
+    render_rows zeichnet einen Block von Zeilen: Texte per pdf.text an vorab gemessener Position,
+    Bilder an festen Zellkoordinaten und das Gitter als durchgehende Linien statt einem Rechteck pro Zelle.
+    """
+
+    def __init__(self, columns: list, x: float, row_height: float, font_size: float):
+        self.columns = columns
+        self.row_height = row_height
+        self.font_size = font_size
+        self.x_positions = []
+        current_x = x
+        for column in columns:
+            self.x_positions.append(current_x)
+            current_x += column.width
+        self.total_width = current_x - x
+
+    def fit_row(self, pdf: FPDF, values: dict) -> list:
+        """Eingepasste (Text, Schriftgröße, Breite) pro Spalte; kann vorab (z.B. beim Cachen) berechnet werden."""
+        fitted = []
+        for column in self.columns:
+            text = values.get(column.key, "")
+            if not text:
+                fitted.append(None)
+            elif column.shrink:
+                fitted.append(fit_text(pdf, text, column.width, self.font_size))
+            else:
+                fitted.append(fit_text(pdf, text, column.width, self.font_size, min_size=self.font_size))
+        return fitted
+
+    def fit_columns(self, pdf: FPDF, rows: list) -> list:
+        """
+        Wie fit_row für alle Zeilen (Liste von Dicts), aber spaltenweise: jeder verschiedene Wert
+        einer Spalte (Länder, Typen, Kreuze, ...) wird nur einmal eingepasst.
+        """
+        columns_fitted = []
+        for column in self.columns:
+            min_size = MIN_FONT_SIZE if column.shrink else self.font_size
+            fitted_values = {}
+            fitted_column = []
+            for values in rows:
+                text = values.get(column.key, "")
+                if not text:
+                    fitted_column.append(None)
+                    continue
+                cell = fitted_values.get(text)
+                if cell is None:
+                    cell = fitted_values[text] = fit_text(pdf, text, column.width, self.font_size, min_size=min_size)
+                fitted_column.append(cell)
+            columns_fitted.append(fitted_column)
+        return [list(row) for row in zip(*columns_fitted)] if rows else []
+
+    def render_rows(self, pdf: FPDF, y: float, fitted_rows: list, images_rows: list | None = None) -> float:
+        """Zeichnet Zeilen ab y (Texte, Bilder, danach das Gitter) und gibt die y-Position darunter zurück."""
+        row_height = self.row_height
+        baseline_offset = row_height / 2
+        row_y = y
+        for row_index, fitted in enumerate(fitted_rows):
+            for column, x, cell in zip(self.columns, self.x_positions, fitted):
+                if cell is not None:
+                    text, size, width = cell
+                    if size != pdf.font_size_pt:
+                        pdf.set_font_size(size)
+                    pdf.text(x + (column.width - width) / 2, row_y + baseline_offset + BASELINE_FACTOR * pdf.font_size, text)
+            images = images_rows[row_index] if images_rows else None
+            if images:
+                for column, x in zip(self.columns, self.x_positions):
+                    image = images.get(column.key)
+                    if image is not None:
+                        pdf.image(image, x=x + 1, y=row_y + 1, w=column.width - 2, h=row_height - 2)
+            row_y += row_height
+        if pdf.font_size_pt != self.font_size:
+            pdf.set_font_size(self.font_size)
+        if fitted_rows:
+            # Gitter: eine Linie pro Zeilengrenze und pro Spaltengrenze (deckungsgleich mit den Zellrahmen)
+            left, right = self.x_positions[0], self.x_positions[0] + self.total_width
+            for boundary in range(len(fitted_rows) + 1):
+                line_y = y + boundary * row_height
+                pdf.line(left, line_y, right, line_y)
+            for x in self.x_positions + [right]:
+                pdf.line(x, y, x, row_y)
+        pdf.set_xy(self.x_positions[0], row_y)
+        return row_y
+
+    def render_row(self, pdf: FPDF, y: float, fitted: list, images: dict | None = None):
+        self.render_rows(pdf, y, [fitted], [images])
@@ -3,6 +3,36 @@
 import pandas as pd
 import streamlit as st 
 import os
+import io
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from modules.header_resolver import resolve_header_mapping
+
+FINAL_COLUMNS = ['Name', 'Mobile', 'Country', 'Type', 'Email']
+
+# Kanonische Felder der Google-Formular-Antworten -> Zielspalten.
+# Welche tatsächliche Spalte zu einem Feld gehört, bestimmt modules.header_resolver.
+SOURCE_TO_TARGET_MAP = {
+    'First Name': 'First Name',
+    'Last Name': 'Last Name',
+    'Phone Number': 'Mobile',
+    'Country of Origin': 'Country',
+    'Exchange Type': 'Type',
+    'E-Mail-Adresse': 'Email'
+}
+
+# Spalten mit wenigen unterschiedlichen Werten werden als Kategorie gespeichert (spart Speicher).
+CATEGORICAL_COLUMNS = ['Country', 'Type']
+
+# Zeilen pro Chunk beim Einlesen hochgeladener CSV-Dateien
+CSV_CHUNK_SIZE = 50_000
+# Anzahl bereits eingelesener CSV-Dateien, die prozessweit (Schlüssel: Inhalts-Hash) behalten werden
+CSV_CACHE_MAX_ENTRIES = 8
+_ingested_csvs = OrderedDict()
+_ingested_csvs_lock = threading.Lock()
 
 @st.cache_data 
 
@@ -13,7 +43,7 @@ def load_participants_from_csv(filepath: str = os.path.join("data", "teilnehmer.
     Wirft FileNotFoundError, wenn die Datei nicht existiert.
     Gibt einen leeren DataFrame zurück, wenn die Datei leer ist oder ein Lesefehler auftritt.
     """
-    final_expected_cols_after_processing = ['Name', 'Mobile', 'Country', 'Type', 'Email'] 
+    final_expected_cols_after_processing = FINAL_COLUMNS
 
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"Datei '{filepath}' nicht gefunden.")
@@ -27,54 +57,150 @@ def load_participants_from_csv(filepath: str = os.path.join("data", "teilnehmer.
         raise IOError(f"Fehler beim Lesen der CSV-Datei '{filepath}': {e}") from e
     
     df = df.fillna('') 
-    df_processed = process_dataframe_for_display(df.copy()) 
+    df_processed = _process_dataframe(df) 
     return df_processed
 
-@st.cache_data 
+def revision_cache_key(df: pd.DataFrame):
+    """
+    Cache-Schlüssel aus der vom Loader gesetzten Revision (df.attrs['revision']) oder None.
+    pandas kopiert attrs auch auf Ausschnitte und Kopien (z.B. df.iloc[:1]); deshalb gehören
+    Form, Spalten und ein Hash des Index dazu, damit ein Ausschnitt nie das Ergebnis der
+    ganzen Liste trifft.
+    """
+    revision = df.attrs.get("revision")
+    if not revision:
+        return None
+    index_hash = hashlib.sha1(pd.util.hash_pandas_object(df.index).values.tobytes()).hexdigest()[:16]
+    return ("revision", revision, df.shape, tuple(map(str, df.columns)), index_hash)
+
+def _dataframe_cache_key(df: pd.DataFrame):
+    """
+    Günstiger Cache-Schlüssel für st.cache_data: die vom Loader gesetzte Revision
+    (siehe revision_cache_key). Nur DataFrames ohne Revision werden inhaltlich gehasht.
+    """
+    revision_key = revision_cache_key(df)
+    if revision_key is not None:
+        return revision_key
+    return ("content", tuple(map(str, df.columns)), pd.util.hash_pandas_object(df, index=True).values.tobytes())
+
+def _source_column(input_df: pd.DataFrame, header_mapping: dict, source_col: str) -> pd.Series | None:
+    col_index = header_mapping.get(source_col)
+    if col_index is None:
+        return None
+    return input_df.iloc[:, col_index].fillna('').astype(str)
+
+def _process_dataframe(input_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ungecachte Verarbeitung: fasst nur die benötigten Quellspalten an (keine Kopie des
+    gesamten DataFrames) und baut das Ergebnis in einem vektorisierten Durchlauf.
+    Die Quellspalten werden über resolve_header_mapping gefunden (auch Varianten wie 'Phone Number ').
+    """
+    if not isinstance(input_df, pd.DataFrame):
+        raise TypeError("Eingabe muss ein Pandas DataFrame sein.")
+
+    if input_df.empty:
+        return pd.DataFrame(columns=FINAL_COLUMNS)
+
+    header_mapping = resolve_header_mapping(tuple(map(str, input_df.columns)))
+    columns = {SOURCE_TO_TARGET_MAP[source_col]: _source_column(input_df, header_mapping, source_col)
+               for source_col in SOURCE_TO_TARGET_MAP}
+    empty_column = pd.Series('', index=input_df.index, dtype=object)
+
+    first_name, last_name = columns.pop('First Name'), columns.pop('Last Name')
+    if first_name is not None and last_name is not None:
+        name = (first_name + " " + last_name).str.strip()
+    elif first_name is not None or last_name is not None:
+        name = (first_name if first_name is not None else last_name).str.strip()
+    else:
+        name = empty_column
+
+    data = {'Name': name}
+    for target_col in FINAL_COLUMNS[1:]:
+        column = columns.get(target_col)
+        if column is None:
+            column = empty_column
+        data[target_col] = column.astype('category') if target_col in CATEGORICAL_COLUMNS else column
+
+    df_processed = pd.DataFrame(data, index=input_df.index, columns=FINAL_COLUMNS)
+    df_processed.attrs = dict(input_df.attrs)
+    return df_processed
+
+@st.cache_data(hash_funcs={pd.DataFrame: _dataframe_cache_key}, max_entries=64)
 def process_dataframe_for_display(input_df: pd.DataFrame) -> pd.DataFrame:
     """
     Nimmt einen rohen DataFrame, kombiniert Namen, wählt relevante Spalten aus, 
     benennt sie um und stellt sicher, dass die finalen Spalten 
     ['Name', 'Mobile', 'Country', 'Type', 'Email'] existieren.
+    'Country' und 'Type' sind kategorische Spalten. Gecacht wird über die Revision
+    des Loaders (siehe _dataframe_cache_key), nicht über einen Hash des Inhalts.
     """
-    final_return_cols = ['Name', 'Mobile', 'Country', 'Type', 'Email'] 
+    return _process_dataframe(input_df)
 
-    if not isinstance(input_df, pd.DataFrame):
-        raise TypeError("Eingabe muss ein Pandas DataFrame sein.")
+def process_raw_dataframe(input_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ungecachte Variante von process_dataframe_for_display, z.B. für Rohdaten, die nur einmal
+    verarbeitet werden (Zahlungsspalte der Antworttabelle) oder ohne Streamlit-Cache gemessen werden.
+    """
+    return _process_dataframe(input_df)
 
-    if input_df.empty:
-        return pd.DataFrame(columns=final_return_cols)
 
-    df = input_df.copy() 
-    
-    source_to_target_map = {
-        'First Name': 'First Name', 
-        'Last Name': 'Last Name',   
-        'Phone Number': 'Mobile', 
-        'Country of Origin': 'Country',
-        'Exchange Type': 'Type',
-        'E-Mail-Adresse': 'Email'  
-    }
+def csv_content_hash(file_bytes: bytes) -> str:
+    """SHA-256 über den Dateiinhalt; identische Uploads ergeben denselben Schlüssel."""
+    return hashlib.sha256(file_bytes).hexdigest()
 
-    for source_col in source_to_target_map.keys():
-        if source_col in df.columns:
-            df[source_col] = df[source_col].astype(str).fillna('')
-        else:
-            df[source_col] = pd.Series([''] * len(df), dtype=str, index=df.index)
+def ingest_participant_csv(file_bytes: bytes) -> tuple[pd.DataFrame, dict]:
+    """
+    Liest eine hochgeladene Teilnehmer-CSV genau einmal ein (Schlüssel: Inhalts-Hash).
+    Gelesen wird in Chunks mit festem Schema: nur die benötigten Quellspalten, alle als str.
+    Gibt den verarbeiteten DataFrame und Statistiken (Zeilen, Dauer, Zeilen/s, Chunks) zurück.
+    Wurde derselbe Inhalt bereits eingelesen, wird das Ergebnis ohne erneutes Parsen geliefert.
+    """
+    content_hash = csv_content_hash(file_bytes)
+    with _ingested_csvs_lock:
+        cached = _ingested_csvs.get(content_hash)
+        if cached is not None:
+            _ingested_csvs.move_to_end(content_hash)
+            df_cached, stats_cached = cached
+            return df_cached, {**stats_cached, "cached": True}
 
-    df_processed = pd.DataFrame(index=df.index)
-    df_processed['Name'] = (df['First Name'] + " " + df['Last Name']).str.strip()
-    
-    df_processed['Mobile'] = df.get('Phone Number', df.get('Phone Number', pd.Series([''] * len(df), dtype=str, index=df.index))).astype(str).fillna('') # Handhabt beide Varianten
-    df_processed['Country'] = df['Country of Origin']
-    df_processed['Type'] = df['Exchange Type']
-    df_processed['Email'] = df['E-Mail-Adresse'] 
-    
-    for col in final_return_cols:
-        if col not in df_processed.columns:
-            df_processed[col] = pd.Series([''] * len(df_processed) if not df_processed.empty else [''] * len(df), dtype=str, index=df_processed.index)
-            
-    return df_processed[final_return_cols]
+    start = time.perf_counter()
+    raw_chunks = []
+    try:
+        header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+        header_mapping = resolve_header_mapping(tuple(map(str, header)))
+        reader = pd.read_csv(
+            io.BytesIO(file_bytes),
+            dtype=str,
+            usecols=sorted(header_mapping.values()) or None,
+            keep_default_na=False,
+            chunksize=CSV_CHUNK_SIZE,
+        )
+        for chunk in reader:
+            raw_chunks.append(chunk)
+    except pd.errors.EmptyDataError:
+        print("INFO (sheet_loader): Hochgeladene CSV-Datei ist leer.")
+
+    if raw_chunks:
+        raw_df = pd.concat(raw_chunks, ignore_index=True) if len(raw_chunks) > 1 else raw_chunks[0]
+        raw_df.attrs["revision"] = f"csv:{content_hash[:16]}"
+        df_processed = _process_dataframe(raw_df)
+    else:
+        df_processed = pd.DataFrame(columns=FINAL_COLUMNS)
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "content_hash": content_hash,
+        "rows": len(df_processed),
+        "chunks": len(raw_chunks),
+        "seconds": elapsed,
+        "rows_per_second": len(df_processed) / elapsed if elapsed > 0 else 0.0,
+        "cached": False,
+    }
+    with _ingested_csvs_lock:
+        _ingested_csvs[content_hash] = (df_processed, stats)
+        while len(_ingested_csvs) > CSV_CACHE_MAX_ENTRIES:
+            _ingested_csvs.popitem(last=False)
+    return df_processed, stats
 
 
 if __name__ == "__main__":
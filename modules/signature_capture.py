@@ -1,40 +1,72 @@
 # modules/signature_capture.py
 
 import streamlit as st
-from streamlit_drawable_canvas import st_canvas
 import os
-from PIL import Image 
 import pandas as pd 
-import time 
+import queue
 import shutil 
 
-def get_unsigned_participants(participants_df: pd.DataFrame, signatures_dir: str = "signatures") -> list:
+from modules.signature_registry import safe_signature_name
+from modules.signature_codec import BlankSignatureError, encode_signature, is_blank_signature
+from modules.signature_store import ANY_VERSION, DEFAULT_EVENT_ID, FileSignatureStore, event_id_for, get_signature_store
+from modules.signature_writer import get_signature_writer
+from modules.name_search import SEARCH_RESULT_LIMIT, get_name_index
+
+def get_unsigned_participants(participants_df: pd.DataFrame, signatures_dir: str | None = None) -> list:
     """
     Filtert die Teilnehmerliste und gibt eine sortierte Liste von Namen zurück,
-    für die noch keine Unterschrift im angegebenen signatures_dir existiert.
+    für die noch keine Unterschrift existiert. Ohne signatures_dir wird der konfigurierte
+    SignatureStore (Event = sheet_id der Liste) gefragt, sonst der angegebene PNG-Ordner.
     """
-    unsigned_names = []
     if not isinstance(participants_df, pd.DataFrame) or "Name" not in participants_df.columns:
         return [] 
-        
-    os.makedirs(signatures_dir, exist_ok=True)
-
-    all_names = sorted(list(participants_df["Name"].dropna().unique()))
-    for name in all_names:
-        safe_name_for_check = "".join(x for x in name if x.isalnum() or x in " _-").strip().replace(" ", "_")
-        if not safe_name_for_check: 
-            continue 
-        signature_filename = f"{safe_name_for_check}.png"
-        signature_path = os.path.join(signatures_dir, signature_filename)
-        if not os.path.exists(signature_path):
-            unsigned_names.append(name)
-    return unsigned_names
+
+    if signatures_dir:
+        all_names = sorted(list(participants_df["Name"].dropna().unique()))
+        return FileSignatureStore(signatures_dir).unsigned(DEFAULT_EVENT_ID, all_names)
+    # Sortierte Namensliste kommt aus dem Suchindex der Listen-Revision; aktualisiert wird nur,
+    # wer seit dem letzten Aufruf unterschrieben hat
+    return sync_name_index(participants_df).unsigned_names()
+
+def sync_name_index(participants_df: pd.DataFrame):
+    """Suchindex der Liste mit aktuellem Unterschriftsstand (gespeichert + noch im Writer)."""
+    event_id = event_id_for(participants_df)
+    name_index = get_name_index(participants_df)
+    # Noch im Hintergrund gespeicherte Unterschriften gelten bereits als vorhanden
+    name_index.sync_signed(get_signature_store().signed_keys(event_id) | get_signature_writer().pending_keys(event_id))
+    return name_index
+
+def save_signature(participants_df: pd.DataFrame, name: str, image_data, json_data=None,
+                   stroke_width: float = 3, expected_version: str | None = ANY_VERSION) -> bool:
+    """
+    Speichert die Unterschrift eines Teilnehmers (Speichern-Button im Kiosk).
+    Standardmäßig über den Hintergrund-Writer; ist dessen Queue voll, wird synchron gespeichert.
+    expected_version ist die Version, die beim Öffnen des Canvas vorlag (None = noch keine
+    Unterschrift); weicht sie beim Schreiben ab, wird der Vorgang im Audit als Konflikt vermerkt.
+    Gibt True zurück, wenn im Hintergrund gespeichert wird. Wirft BlankSignatureError bei leerem
+    Canvas, damit eine leere Unterschrift nicht als "unterschrieben" zählt.
+    """
+    if is_blank_signature(image_data):
+        raise BlankSignatureError("Keine Unterschrift auf dem Canvas.")
+    event_id = event_id_for(participants_df)
+    try:
+        get_signature_writer().submit(event_id, name, image_data, json_data,
+                                      stroke_width=stroke_width, expected_version=expected_version)
+        return True
+    except queue.Full:
+        signature_blob = encode_signature(image_data, json_data, stroke_width=stroke_width)
+        get_signature_store().save(event_id, name, signature_blob, expected_version=expected_version)
+        return False
 
 def capture_signature(participants_df: pd.DataFrame):
     """
     Ermöglicht die Erfassung und Speicherung digitaler Unterschriften für Teilnehmer,
     die noch nicht unterschrieben haben.
     """
+    # Erst hier importiert, damit get_unsigned_participants/save_signature auch ohne
+    # Streamlit-Frontend-Komponente nutzbar sind (Benchmarks, Batch-Skripte)
+    from streamlit_drawable_canvas import st_canvas
+
     if not isinstance(participants_df, pd.DataFrame) or participants_df.empty:
         st.warning("Teilnehmerliste ist leer oder ungültig.")
         return
@@ -46,16 +78,27 @@ def capture_signature(participants_df: pd.DataFrame):
         st.session_state[force_redraw_key] = False
     
     if 'signature_just_saved_for' in st.session_state:
+        st.success(f"✅ Unterschrift für {st.session_state.signature_just_saved_for} gespeichert!")
         del st.session_state.signature_just_saved_for
+        st.session_state["signature_capture_search_query"] = ""  # nächste Person startet mit leerer Suche
         st.session_state[force_redraw_key] = False 
 
-    unsigned_names_list = get_unsigned_participants(participants_df)
+    name_index = sync_name_index(participants_df)
+    unsigned_names_list = name_index.unsigned_names()
 
     if not unsigned_names_list and not st.session_state[force_redraw_key]:
         st.success("🎉 Alle Teilnehmer auf der aktuellen Liste haben bereits unterschrieben!")
         st.balloons()
         return
 
+    search_query = st.text_input("Namen suchen:", key="signature_capture_search_query",
+                                 placeholder="Vor- oder Nachname eintippen …")
+    if search_query.strip():
+        unsigned_names_list = name_index.search(search_query, limit=SEARCH_RESULT_LIMIT)
+        if not unsigned_names_list and not st.session_state[force_redraw_key]:
+            st.info("Kein offener Name passt zur Suche.")
+            return
+
     if st.session_state[force_redraw_key] and \
        selection_key in st.session_state and \
        st.session_state[selection_key] not in unsigned_names_list:
@@ -90,16 +133,21 @@ def capture_signature(participants_df: pd.DataFrame):
     if not selected_name: 
         return
 
-    safe_selected_name_check = "".join(x for x in selected_name if x.isalnum() or x in " _-").strip().replace(" ", "_")
-    signature_filename_check = f"{safe_selected_name_check}.png"
-    signature_path_check_for_display = os.path.join("signatures", signature_filename_check)
-    signature_actually_exists = os.path.exists(signature_path_check_for_display)
+    signature_store = get_signature_store()
+    event_id = event_id_for(participants_df)
+    safe_selected_name_check = safe_signature_name(selected_name)
+    signature_writer = get_signature_writer()
+    signature_pending = signature_writer.is_pending(event_id, selected_name)
+    signature_actually_exists = signature_pending or signature_store.has_signature(event_id, selected_name)
 
 
     if signature_actually_exists and not st.session_state[force_redraw_key]:
         st.info(f"✅ {selected_name} hat bereits unterschrieben.")
         try:
-            st.image(signature_path_check_for_display, width=300)
+            if signature_pending:
+                st.caption("Unterschrift wird gerade gespeichert …")
+            else:
+                st.image(signature_store.image_source(event_id, selected_name), width=300)
         except Exception as e:
             st.warning(f"Konnte gespeicherte Unterschrift nicht anzeigen: {e}")
         if st.button(f"Unterschrift für {selected_name} erneut erfassen", key=f"btn_overwrite_{safe_selected_name_check}_module_v3"):
@@ -108,6 +156,13 @@ def capture_signature(participants_df: pd.DataFrame):
             st.rerun() 
     else:
         st.markdown(f"### Unterschrift für: **{selected_name}**")
+        # Stand beim Öffnen des Canvas merken, um parallele Erfassungen auf anderen Kiosks zu erkennen
+        expected_version_key = f"signature_expected_version_{safe_selected_name_check}"
+        if expected_version_key not in st.session_state:
+            st.session_state[expected_version_key] = (
+                None if not signature_actually_exists
+                else signature_store.current_version(event_id, selected_name) if not signature_pending
+                else ANY_VERSION)
         stroke_width = 3
         stroke_color = "#000000"
         bg_color = "#FFFFFF"
@@ -126,30 +181,26 @@ def capture_signature(participants_df: pd.DataFrame):
 
         if canvas_result.image_data is not None:
             if st.button(f"Unterschrift für {selected_name} speichern", key=f"btn_save_{safe_selected_name_check}_module_v3", type="primary", use_container_width=True):
-                signatures_dir_prod = "signatures"
-                os.makedirs(signatures_dir_prod, exist_ok=True)
-                safe_name_for_save = "".join(x for x in selected_name if x.isalnum() or x in " _-").strip().replace(" ", "_")
-                signature_filename = f"{safe_name_for_save}.png"
-                signature_path_prod = os.path.join(signatures_dir_prod, signature_filename)
                 try:
-                    img = Image.fromarray(canvas_result.image_data.astype('uint8'), 'RGBA')
-                    final_img = Image.new("RGB", img.size, (255, 255, 255)) 
-                    if img.mode == 'RGBA': final_img.paste(img, mask=img.split()[3]) 
-                    else: final_img.paste(img)
-                    final_img.save(signature_path_prod, "PNG")
+                    # Kodieren und Schreiben übernimmt der Hintergrund-Writer; der Kiosk ist sofort frei
+                    save_signature(participants_df, selected_name, canvas_result.image_data,
+                                   canvas_result.json_data, stroke_width=stroke_width,
+                                   expected_version=st.session_state.get(expected_version_key, ANY_VERSION))
+                    st.session_state.pop(expected_version_key, None)
 
+                    name_index.mark_signed(selected_name)
                     st.session_state.signature_just_saved_for = selected_name 
                     st.session_state[force_redraw_key] = False 
-                    st.success(f"✅ Unterschrift für {selected_name} gespeichert!")
-                    st.balloons()
-                    time.sleep(2.0) 
                     st.rerun() 
+                except BlankSignatureError:
+                    st.warning("Bitte zuerst im Feld oben unterschreiben.")
                 except Exception as e:
                     st.error(f"Fehler beim Speichern: {e}")
         
         if st.session_state[force_redraw_key]:
              if st.button("Abbrechen (erneut erfassen)", key=f"btn_cancel_overwrite_{safe_selected_name_check}_module_v3"):
                  st.session_state[force_redraw_key] = False
+                 st.session_state.pop(f"signature_expected_version_{safe_selected_name_check}", None)
                  st.rerun()
 
 if __name__ == "__main__":
@@ -183,7 +234,7 @@ if __name__ == "__main__":
     copied_signatures_count = 0
     if os.path.exists(actual_signatures_source_dir):
         for name in names_with_existing_signatures:
-            safe_name = "".join(x for x in name if x.isalnum() or x in " _-").strip().replace(" ", "_")
+            safe_name = safe_signature_name(name)
             source_signature_path = os.path.join(actual_signatures_source_dir, f"{safe_name}.png")
             destination_signature_path = os.path.join(test_signatures_dir_for_inspection, f"{safe_name}.png")
             
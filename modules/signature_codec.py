@@ -0,0 +1,306 @@
+# modules/signature_codec.py
+
+import io
+import os
+import zlib
+import struct
+from array import array
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# "png" = bisheriges Vollbild, "strokes" = Strichdaten aus json_data, "bitmap" = 1-Bit-Bitmap
+SIGNATURE_FORMAT = os.environ.get("SIGNATURE_FORMAT", "png").strip().lower()
+SIGNATURE_FORMATS = ("png", "strokes", "bitmap")
+
+PNG_MAGIC = b"\x89PNG"
+STROKES_MAGIC = b"SIGS1"
+BITMAP_MAGIC = b"SIGB1"
+# Koordinaten werden in 1/COORD_SCALE Canvas-Pixeln gespeichert
+COORD_SCALE = 4
+# Stützpunkte pro quadratischer Bézierkurve beim Rendern
+CURVE_STEPS = 4
+# Auflösung, mit der Unterschriften für die PDF-Zelle gerastert werden
+RENDER_DPI = 200
+# Grauwert, unter dem ein verkleinertes Pixel als Tinte gilt
+INK_THRESHOLD = 192
+MM_PER_INCH = 25.4
+
+# Innenmaß der PDF-Spalte "signature" (COL_WIDTHS['signature'] bzw. ROW_HEIGHT_PARTICIPANT in
+# pdf_generator, jeweils abzüglich 1 mm Rand pro Seite); gespeicherte Unterschriften haben dieses Seitenverhältnis
+SIGNATURE_CELL_MM = (38.0, 6.0)
+# Höhe, auf die zugeschnittene Unterschriften verkleinert werden (Zelle bei RENDER_DPI: ca. 47 px)
+SIGNATURE_TARGET_HEIGHT_PX = 64
+# Weniger Tintenpixel bzw. eine kleinere Ausdehnung gilt als leere Unterschrift (versehentlicher Tipp)
+MIN_INK_PIXELS = 80
+MIN_INK_EXTENT_PX = 20
+INK_PADDING_PX = 4
+
+class BlankSignatureError(ValueError):
+    """Das Canvas enthält keine (ausreichende) Unterschrift."""
+
+def signature_format(blob: bytes) -> str:
+    """Erkennt das Format eines gespeicherten Unterschrift-Blobs."""
+    if blob.startswith(STROKES_MAGIC):
+        return "strokes"
+    if blob.startswith(BITMAP_MAGIC):
+        return "bitmap"
+    return "png"
+
+def _path_points(path_commands) -> list:
+    """Fabric.js-Pfad (M/L/Q-Kommandos) -> Liste von (x, y)-Punkten inkl. Bézier-Kontrollpunkten als Marker."""
+    points = []
+    for command in path_commands:
+        op, coords = command[0], command[1:]
+        if op in ("M", "L") and len(coords) >= 2:
+            points.append((coords[0], coords[1], 0))
+        elif op == "Q" and len(coords) >= 4:
+            points.append((coords[0], coords[1], 1))
+            points.append((coords[2], coords[3], 0))
+    return points
+
+def ink_mask(image_data: np.ndarray) -> np.ndarray:
+    """Bool-Maske der Tintenpixel eines RGBA-Canvas (deckend und dunkel)."""
+    rgba = np.asarray(image_data)
+    return (rgba[..., 3] > 127) & (rgba[..., :3].mean(axis=2) < 128)
+
+def signature_crop_box(image_data: np.ndarray) -> tuple | None:
+    """
+    Ausschnitt (left, top, width, height) um die Tinte, mit etwas Rand und auf das Seitenverhältnis
+    der PDF-Zelle erweitert (kann über das Canvas hinausragen; dort wird weiß aufgefüllt).
+    None bei leerem oder nahezu leerem Canvas.
+    """
+    mask = ink_mask(image_data)
+    if int(mask.sum()) < MIN_INK_PIXELS:
+        return None
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    if max(bottom - top, right - left) < MIN_INK_EXTENT_PX:
+        return None
+    left, top = left - INK_PADDING_PX, top - INK_PADDING_PX
+    width, height = right - left + INK_PADDING_PX, bottom - top + INK_PADDING_PX
+
+    aspect = SIGNATURE_CELL_MM[0] / SIGNATURE_CELL_MM[1]
+    if width / height < aspect:
+        new_width = int(np.ceil(height * aspect))
+        left -= (new_width - width) // 2
+        width = new_width
+    else:
+        new_height = int(np.ceil(width / aspect))
+        top -= (new_height - height) // 2
+        height = new_height
+    return int(left), int(top), int(width), int(height)
+
+def is_blank_signature(image_data) -> bool:
+    """True, wenn das Canvas leer ist oder nur ein paar versehentliche Punkte enthält."""
+    return image_data is None or signature_crop_box(image_data) is None
+
+def _crop(array: np.ndarray, box: tuple, fill) -> np.ndarray:
+    """Schneidet box aus array aus; Bereiche außerhalb werden mit fill aufgefüllt."""
+    left, top, width, height = box
+    out = np.full((height, width) + array.shape[2:], fill, dtype=array.dtype)
+    src_top, src_left = max(top, 0), max(left, 0)
+    src_bottom, src_right = min(top + height, array.shape[0]), min(left + width, array.shape[1])
+    if src_bottom > src_top and src_right > src_left:
+        out[src_top - top:src_bottom - top, src_left - left:src_right - left] = array[src_top:src_bottom, src_left:src_right]
+    return out
+
+def _prepared_grayscale(image_data: np.ndarray, box: tuple) -> Image.Image:
+    """Zugeschnittenes Graustufenbild (Tinte auf Weiß), auf SIGNATURE_TARGET_HEIGHT_PX verkleinert."""
+    rgba = np.asarray(image_data).astype(np.float32)
+    alpha = rgba[..., 3:4] / 255.0
+    gray = (rgba[..., :3].mean(axis=2, keepdims=True) * alpha + 255.0 * (1.0 - alpha))[..., 0]
+    img = Image.fromarray(_crop(gray.round().astype(np.uint8), box, 255), "L")
+    if img.height > SIGNATURE_TARGET_HEIGHT_PX:
+        target_width = max(1, round(img.width * SIGNATURE_TARGET_HEIGHT_PX / img.height))
+        img = img.resize((target_width, SIGNATURE_TARGET_HEIGHT_PX), Image.LANCZOS)
+    return img
+
+def encode_strokes(json_data: dict, width: int, height: int, stroke_width: float,
+                   origin: tuple = (0, 0)) -> bytes | None:
+    """
+    Kodiert die Freihand-Pfade aus canvas_result.json_data kompakt: quantisierte, delta-kodierte
+    Koordinaten (int16) pro Strich, zlib-komprimiert. origin verschiebt die Koordinaten in den
+    zugeschnittenen Ausschnitt. Gibt None zurück, wenn keine Striche vorhanden sind.
+    """
+    strokes = []
+    for obj in (json_data or {}).get("objects", []):
+        if obj.get("type") != "path":
+            continue
+        points = _path_points(obj.get("path") or [])
+        if points:
+            strokes.append(points)
+    if not strokes:
+        return None
+
+    body = io.BytesIO()
+    body.write(struct.pack("<HHHI", width, height, int(round(stroke_width * COORD_SCALE)), len(strokes)))
+    for points in strokes:
+        deltas = array("h")
+        flags = bytearray()
+        prev_x = prev_y = 0
+        for x, y, is_control in points:
+            qx = max(0, min(int(round((x - origin[0]) * COORD_SCALE)), 32767))
+            qy = max(0, min(int(round((y - origin[1]) * COORD_SCALE)), 32767))
+            deltas.append(qx - prev_x); deltas.append(qy - prev_y)
+            flags.append(is_control)
+            prev_x, prev_y = qx, qy
+        body.write(struct.pack("<I", len(points)))
+        body.write(deltas.tobytes())
+        body.write(bytes(flags))
+    return STROKES_MAGIC + zlib.compress(body.getvalue(), 9)
+
+def _decode_strokes(blob: bytes):
+    data = zlib.decompress(blob[len(STROKES_MAGIC):])
+    width, height, stroke_q, stroke_count = struct.unpack_from("<HHHI", data, 0)
+    offset = struct.calcsize("<HHHI")
+    strokes = []
+    for _ in range(stroke_count):
+        (point_count,) = struct.unpack_from("<I", data, offset); offset += 4
+        deltas = array("h"); deltas.frombytes(data[offset:offset + point_count * 4]); offset += point_count * 4
+        flags = data[offset:offset + point_count]; offset += point_count
+        xs = np.cumsum(np.asarray(deltas[0::2], dtype=np.int32)) / COORD_SCALE
+        ys = np.cumsum(np.asarray(deltas[1::2], dtype=np.int32)) / COORD_SCALE
+        strokes.append(list(zip(xs.tolist(), ys.tolist(), flags)))
+    return width, height, stroke_q / COORD_SCALE, strokes
+
+def _flatten_stroke(points) -> list:
+    """Löst Bézier-Kontrollpunkte in Liniensegmente auf."""
+    flat = []
+    i = 0
+    while i < len(points):
+        x, y, is_control = points[i]
+        if is_control and flat and i + 1 < len(points):
+            x0, y0 = flat[-1]
+            x2, y2, _ = points[i + 1]
+            for step in range(1, CURVE_STEPS + 1):
+                t = step / CURVE_STEPS
+                flat.append(((1 - t) ** 2 * x0 + 2 * (1 - t) * t * x + t ** 2 * x2,
+                             (1 - t) ** 2 * y0 + 2 * (1 - t) * t * y + t ** 2 * y2))
+            i += 2
+            continue
+        flat.append((x, y))
+        i += 1
+    return flat
+
+def encode_bitmap(image_data: np.ndarray, box: tuple | None = None) -> bytes:
+    """
+    RGBA-Canvas -> 1-Bit-Bitmap, mit np.packbits gepackt und zlib-komprimiert.
+    Mit box wird vorher zugeschnitten und verkleinert.
+    """
+    if box is None:
+        ink = ink_mask(image_data)
+    else:
+        ink = np.asarray(_prepared_grayscale(image_data, box)) < INK_THRESHOLD
+    height, width = ink.shape
+    return BITMAP_MAGIC + struct.pack("<HH", width, height) + zlib.compress(np.packbits(ink).tobytes(), 9)
+
+def _decode_bitmap(blob: bytes) -> Image.Image:
+    width, height = struct.unpack_from("<HH", blob, len(BITMAP_MAGIC))
+    packed = np.frombuffer(zlib.decompress(blob[len(BITMAP_MAGIC) + 4:]), dtype=np.uint8)
+    ink = np.unpackbits(packed)[:width * height].reshape(height, width).astype(bool)
+    return Image.fromarray(np.where(ink, 0, 255).astype(np.uint8), "L")
+
+def encode_png(image_data: np.ndarray, box: tuple | None = None) -> bytes:
+    """
+    RGBA-Canvas auf weißem Hintergrund als PNG. Mit box als zugeschnittenes, verkleinertes
+    Graustufenbild, sonst (wie bisher) das volle Canvas.
+    """
+    buffer = io.BytesIO()
+    if box is not None:
+        # 4 Graustufen (2 Bit) reichen für die geglätteten Strichkanten und sparen gegenüber 8 Bit viel Platz
+        final_img = _prepared_grayscale(image_data, box).convert("P", palette=Image.ADAPTIVE, colors=4)
+        final_img.save(buffer, "PNG", optimize=True, bits=2)
+    else:
+        img = Image.fromarray(np.asarray(image_data).astype("uint8"), "RGBA")
+        final_img = Image.new("RGB", img.size, (255, 255, 255))
+        final_img.paste(img, mask=img.split()[3])
+        final_img.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+def encode_signature(image_data: np.ndarray, json_data: dict | None = None, stroke_width: float = 3,
+                     fmt: str = SIGNATURE_FORMAT) -> bytes:
+    """
+    Kodiert ein Canvas-Ergebnis im gewünschten Format: auf die Tinte zugeschnitten, auf das
+    Seitenverhältnis der PDF-Zelle gebracht und verkleinert. Fehlen für "strokes" die Strichdaten,
+    wird auf "bitmap" ausgewichen. Wirft BlankSignatureError bei leerem Canvas.
+    """
+    box = signature_crop_box(image_data)
+    if box is None:
+        raise BlankSignatureError("Keine Unterschrift auf dem Canvas.")
+    if fmt == "strokes":
+        left, top, width, height = box
+        blob = encode_strokes(json_data, width, height, stroke_width, origin=(left, top))
+        if blob is not None:
+            return blob
+        fmt = "bitmap"
+    if fmt == "bitmap":
+        return encode_bitmap(image_data, box)
+    return encode_png(image_data, box)
+
+def render_signature(blob: bytes, width_px: int, height_px: int) -> Image.Image:
+    """
+    Rastert eine Unterschrift (beliebiges Format) direkt in der Zielgröße als Graustufenbild.
+    Striche werden in Zielauflösung gezeichnet statt ein Vollbild herunterzuskalieren.
+    """
+    fmt = signature_format(blob)
+    if fmt == "strokes":
+        width, height, stroke_width, strokes = _decode_strokes(blob)
+        scale_x, scale_y = width_px / width, height_px / height
+        line_width = max(1, int(round(stroke_width * min(scale_x, scale_y))))
+        img = Image.new("L", (width_px, height_px), 255)
+        draw = ImageDraw.Draw(img)
+        for points in strokes:
+            flat = [(x * scale_x, y * scale_y) for x, y in _flatten_stroke(points)]
+            if len(flat) == 1:
+                flat = flat * 2
+            draw.line(flat, fill=0, width=line_width, joint="curve")
+        return img
+    if fmt == "bitmap":
+        source = _decode_bitmap(blob)
+    else:
+        source = Image.open(io.BytesIO(blob)).convert("L")
+    # Nach dem Verkleinern wieder auf zwei Tonwerte bringen: komprimiert im PDF deutlich besser
+    return source.resize((width_px, height_px), Image.LANCZOS).point(lambda v: 0 if v < INK_THRESHOLD else 255)
+
+def render_signature_for_cell(blob: bytes, width_mm: float, height_mm: float, dpi: int = RENDER_DPI) -> Image.Image:
+    """Rastert eine Unterschrift für eine PDF-Zelle der Größe width_mm x height_mm."""
+    width_px = max(1, int(round(width_mm / MM_PER_INCH * dpi)))
+    height_px = max(1, int(round(height_mm / MM_PER_INCH * dpi)))
+    return render_signature(blob, width_px, height_px)
+
+def signature_to_png(blob: bytes) -> bytes:
+    """PNG-Darstellung in Originalgröße (z.B. für st.image oder den PNG-Export)."""
+    if signature_format(blob) == "png":
+        return blob
+    if signature_format(blob) == "bitmap":
+        img = _decode_bitmap(blob)
+    else:
+        width, height, _, _ = _decode_strokes(blob)
+        img = render_signature(blob, width, height)
+    buffer = io.BytesIO()
+    img.convert("1").save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+if __name__ == "__main__":
+    # Synthetische Unterschrift: zwei Freihand-Striche auf einem 550x250-Canvas
+    width, height = 550, 250
+    xs = np.linspace(40, 500, 120)
+    path_a = [["M", 40.0, 150.0]] + [["Q", x, 150 + 40 * np.sin(x / 30), x + 2, 150 + 40 * np.sin((x + 2) / 30)] for x in xs]
+    path_b = [["M", 100.0, 200.0]] + [["L", x, 200 - (x - 100) * 0.2] for x in np.linspace(100, 400, 60)]
+    json_data = {"objects": [{"type": "path", "path": path_a}, {"type": "path", "path": path_b}]}
+
+    canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(canvas)
+    for obj in json_data["objects"]:
+        draw.line([(p[-2], p[-1]) for p in obj["path"]], fill=(0, 0, 0, 255), width=3, joint="curve")
+    image_data = np.asarray(canvas)
+
+    print(f"Volles Canvas als PNG: {len(encode_png(image_data))} Bytes | leeres Canvas erkannt: "
+          f"{is_blank_signature(np.zeros_like(image_data))}")
+    for fmt in SIGNATURE_FORMATS:
+        blob = encode_signature(image_data, json_data, stroke_width=3, fmt=fmt)
+        cell = render_signature_for_cell(blob, *SIGNATURE_CELL_MM)
+        cell_png = io.BytesIO(); cell.save(cell_png, "PNG")
+        print(f"{fmt:8s}: gespeichert {len(blob):6d} Bytes | Zellbild {cell.size} {len(cell_png.getvalue()):5d} Bytes")
@@ -0,0 +1,113 @@
+# modules/signature_image_cache.py
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from modules.signature_codec import RENDER_DPI, MM_PER_INCH, render_signature
+from modules.signature_store import signature_version
+
+# Vorskalierte Unterschriften für die PDF-Zellen; Schlüssel ist der Inhalts-Hash der Unterschrift
+SIGNATURE_IMAGE_CACHE_DIR = os.path.join(".cache", "signature_images")
+SIGNATURE_IMAGE_MEMORY_MAX_ENTRIES = 1024
+# Bei Änderungen am Rasterverfahren erhöhen, damit alte Cache-Dateien nicht mehr getroffen werden
+SIGNATURE_IMAGE_CACHE_VERSION = 1
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "rendered": 0}
+
+def _cell_pixels(width_mm: float, height_mm: float, dpi: int) -> tuple:
+    return (max(1, int(round(width_mm / MM_PER_INCH * dpi))),
+            max(1, int(round(height_mm / MM_PER_INCH * dpi))))
+
+def _cache_path(cache_key: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"{cache_key}.png")
+
+def _write_atomic(img: Image.Image, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-", suffix=".png")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, "PNG", optimize=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def signature_cell_image(blob: bytes, width_mm: float, height_mm: float, dpi: int = RENDER_DPI,
+                         cache_dir: str = SIGNATURE_IMAGE_CACHE_DIR) -> Image.Image:
+    """
+    1-Bit-Bild einer Unterschrift in Zellgröße, über PDF-Läufe hinweg gecacht.
+    Reihenfolge: Arbeitsspeicher -> .cache/signature_images -> neu rastern.
+    Da der Schlüssel aus dem Inhalts-Hash gebildet wird, führt eine geänderte Unterschrift
+    automatisch zu einem neuen Eintrag; die alte Datei wird nie mehr getroffen
+    (bei ein paar hundert Byte pro Datei lohnt sich kein Aufräumen).
+    """
+    width_px, height_px = _cell_pixels(width_mm, height_mm, dpi)
+    cache_key = f"{signature_version(blob)}-{width_px}x{height_px}-v{SIGNATURE_IMAGE_CACHE_VERSION}"
+    with _memory_lock:
+        img = _memory_cache.get(cache_key)
+        if img is not None:
+            _memory_cache.move_to_end(cache_key)
+            _stats["memory_hits"] += 1
+            return img
+
+    path = _cache_path(cache_key, cache_dir)
+    img = None
+    if os.path.exists(path):
+        try:
+            with Image.open(path) as cached:
+                img = cached.convert("1")
+            stat_key = "disk_hits"
+        except (OSError, ValueError) as e:
+            print(f"WARNUNG (signature_image_cache): Cache-Datei '{path}' unlesbar, wird neu erzeugt: {e}")
+    if img is None:
+        # Schwarz/weiß genügt für Unterschriften und braucht im PDF nur ein Bit pro Pixel
+        img = render_signature(blob, width_px, height_px).convert("1", dither=Image.Dither.NONE)
+        stat_key = "rendered"
+        try:
+            _write_atomic(img, path)
+        except OSError as e:
+            print(f"WARNUNG (signature_image_cache): Konnte '{path}' nicht schreiben: {e}")
+
+    with _memory_lock:
+        _stats[stat_key] += 1
+        img = _memory_cache.setdefault(cache_key, img)
+        while len(_memory_cache) > SIGNATURE_IMAGE_MEMORY_MAX_ENTRIES:
+            _memory_cache.popitem(last=False)
+    return img
+
+def get_signature_image_cache_stats() -> dict:
+    with _memory_lock:
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory_cache)
+    return stats
+
+if __name__ == "__main__":
+    import time
+    import numpy as np
+    from PIL import ImageDraw
+    from modules.signature_codec import encode_signature
+
+    canvas = Image.new("RGBA", (550, 250), (0, 0, 0, 0))
+    xs = np.linspace(40, 500, 80)
+    ImageDraw.Draw(canvas).line([(x, 150 + 40 * np.sin(x / 30)) for x in xs], fill=(0, 0, 0, 255), width=3)
+    blob = encode_signature(np.asarray(canvas))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label in ("neu gerastert", "Arbeitsspeicher"):
+            start = time.perf_counter()
+            img = signature_cell_image(blob, 38, 6, cache_dir=tmp_dir)
+            print(f"{label}: {(time.perf_counter() - start) * 1000:.2f} ms, {img.mode} {img.size}")
+        _memory_cache.clear()
+        start = time.perf_counter()
+        signature_cell_image(blob, 38, 6, cache_dir=tmp_dir)
+        print(f"Datei-Cache: {(time.perf_counter() - start) * 1000:.2f} ms")
+        print("Statistik:", get_signature_image_cache_stats())
@@ -0,0 +1,130 @@
+# modules/signature_registry.py
+
+import os
+import time
+import threading
+
+SIGNATURES_DIR = "signatures"
+SIGNATURE_EXTENSION = ".png"
+# Kompakte Formate (Strichdaten / 1-Bit-Bitmap, siehe signature_codec)
+COMPACT_SIGNATURE_EXTENSION = ".sig"
+SIGNATURE_EXTENSIONS = (SIGNATURE_EXTENSION, COMPACT_SIGNATURE_EXTENSION)
+# Wie oft höchstens per stat() geprüft wird, ob sich der Ordner geändert hat
+MTIME_CHECK_INTERVAL_SECONDS = 1.0
+# Sicherheitsnetz: spätestens nach dieser Zeit wird der Ordner komplett neu eingelesen
+MANIFEST_MAX_AGE_SECONDS = 60.0
+
+def safe_signature_name(name: str) -> str:
+    """Dateiname (ohne Endung) für die Unterschrift eines Teilnehmers, z.B. 'Max Mustermann' -> 'Max_Mustermann'."""
+    return "".join(x for x in str(name) if x.isalnum() or x in " _-").strip().replace(" ", "_")
+
+class SignatureRegistry:
+    """
+    Manifest aller vorhandenen Unterschriften eines Ordners im Arbeitsspeicher.
+    Der Ordner wird einmal eingelesen und beim Speichern direkt aktualisiert; ob sich der
+    Ordner von außen geändert hat, wird über seine mtime erkannt (höchstens ein stat() pro
+    MTIME_CHECK_INTERVAL_SECONDS). Alle Abfragen sind danach O(1)-Lookups statt eines
+    os.path.exists pro Teilnehmer.
+    """
+
+    def __init__(self, signatures_dir: str = SIGNATURES_DIR):
+        self.signatures_dir = signatures_dir
+        self._lock = threading.Lock()
+        self._extensions = {}  # safe_name -> Dateiendung
+        self._dir_mtime_ns = None
+        self._last_check = float("-inf")
+        self._last_scan = float("-inf")
+
+    def _scan(self, mtime_ns):
+        extensions = {}
+        try:
+            with os.scandir(self.signatures_dir) as entries:
+                for entry in entries:
+                    # Punkt-Dateien sind temporäre Schreibdateien (.tmp-*) oder Verwaltungsdaten
+                    if entry.name.startswith("."):
+                        continue
+                    safe_name, extension = os.path.splitext(entry.name)
+                    if extension in SIGNATURE_EXTENSIONS and entry.is_file():
+                        extensions[safe_name] = extension
+        except FileNotFoundError:
+            pass
+        self._extensions = extensions
+        self._dir_mtime_ns = mtime_ns
+        self._last_scan = time.monotonic()
+
+    def _refresh_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < MTIME_CHECK_INTERVAL_SECONDS:
+            return
+        self._last_check = now
+        try:
+            mtime_ns = os.stat(self.signatures_dir).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns != self._dir_mtime_ns or now - self._last_scan > MANIFEST_MAX_AGE_SECONDS:
+            self._scan(mtime_ns)
+
+    def path_for(self, name: str, extension: str = SIGNATURE_EXTENSION) -> str:
+        """Pfad, unter dem die Unterschrift für name mit der gegebenen Endung gespeichert wird."""
+        return os.path.join(self.signatures_dir, f"{safe_signature_name(name)}{extension}")
+
+    def _extension_of(self, name: str) -> str | None:
+        safe_name = safe_signature_name(name)
+        if not safe_name:
+            return None
+        with self._lock:
+            self._refresh_if_changed()
+            return self._extensions.get(safe_name)
+
+    def has_signature(self, name: str) -> bool:
+        return self._extension_of(name) is not None
+
+    def signature_path(self, name: str) -> str | None:
+        """Pfad zur vorhandenen Unterschrift oder None."""
+        extension = self._extension_of(name)
+        return self.path_for(name, extension) if extension else None
+
+    def unsigned(self, names) -> list:
+        """Filtert names auf alle, für die noch keine Unterschrift existiert (Reihenfolge bleibt erhalten)."""
+        with self._lock:
+            self._refresh_if_changed()
+            signed = self._extensions
+        unsigned_names = []
+        for name in names:
+            safe_name = safe_signature_name(name)
+            if safe_name and safe_name not in signed:
+                unsigned_names.append(name)
+        return unsigned_names
+
+    def signed_keys(self) -> set:
+        """Kopie aller vorhandenen (normalisierten) Namen."""
+        with self._lock:
+            self._refresh_if_changed()
+            return set(self._extensions)
+
+    def mark_saved(self, name: str, extension: str = SIGNATURE_EXTENSION):
+        """Trägt eine gerade gespeicherte Unterschrift ein, ohne den Ordner neu einzulesen."""
+        with self._lock:
+            self._extensions[safe_signature_name(name)] = extension
+            try:
+                self._dir_mtime_ns = os.stat(self.signatures_dir).st_mtime_ns
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self):
+        """Erzwingt ein erneutes Einlesen bei der nächsten Abfrage."""
+        with self._lock:
+            self._dir_mtime_ns = None
+            self._last_check = float("-inf")
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_signature_registry(signatures_dir: str = SIGNATURES_DIR) -> SignatureRegistry:
+    """Prozessweite Registry pro Ordner (gemeinsam für alle Sessions und die PDF-Erstellung)."""
+    key = os.path.abspath(signatures_dir)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = SignatureRegistry(signatures_dir)
+        return registry
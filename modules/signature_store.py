@@ -0,0 +1,462 @@
+# modules/signature_store.py
+
+import io
+import os
+import abc
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import pandas as pd
+
+from modules.signature_registry import (SIGNATURES_DIR, SIGNATURE_EXTENSION, SIGNATURE_EXTENSIONS,
+                                        COMPACT_SIGNATURE_EXTENSION, get_signature_registry, safe_signature_name)
+from modules.signature_codec import signature_format, signature_to_png
+
+# "files" = bisheriger PNG-Ordner, "sqlite" = eine WAL-Datenbank für alle Kiosk-Sessions
+SIGNATURE_STORE_BACKEND = os.environ.get("SIGNATURE_STORE_BACKEND", "files").strip().lower()
+SIGNATURE_DB_PATH = os.environ.get("SIGNATURE_DB_PATH", os.path.join(SIGNATURES_DIR, "signatures.sqlite3"))
+DEFAULT_EVENT_ID = "default"
+# Event, unter dem bestehende PNGs aus SIGNATURES_DIR beim ersten Start mit 'sqlite' übernommen werden
+# (das Datei-Backend kennt keine Events; für ein bestimmtes Sheet dessen sheet_id eintragen)
+SIGNATURE_MIGRATION_EVENT_ID = os.environ.get("SIGNATURE_MIGRATION_EVENT_ID", DEFAULT_EVENT_ID).strip() or DEFAULT_EVENT_ID
+# expected_version beim Speichern: keine Konfliktprüfung
+ANY_VERSION = "*"
+# Unterordner (Datei-Backend) für überschriebene Versionen und das Audit-Log
+AUDIT_DIR_NAME = ".audit"
+AUDIT_LOG_NAME = "audit.jsonl"
+
+def event_id_for(participants_df: pd.DataFrame | None) -> str:
+    """Event-Schlüssel einer Teilnehmerliste: die sheet_id aus den DataFrame.attrs, sonst DEFAULT_EVENT_ID."""
+    if isinstance(participants_df, pd.DataFrame):
+        return participants_df.attrs.get("sheet_id") or DEFAULT_EVENT_ID
+    return DEFAULT_EVENT_ID
+
+def signature_version(blob: bytes | None) -> str | None:
+    """Version einer gespeicherten Unterschrift (Inhalts-Hash) oder None, wenn keine existiert."""
+    return hashlib.sha1(blob).hexdigest()[:16] if blob is not None else None
+
+def _fsync_directory(path: str):
+    """Macht neu angelegte Dateieinträge dauerhaft (auf Plattformen ohne Verzeichnis-fsync ein No-op)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class SignatureStore(abc.ABC):
+    """
+    Schnittstelle für die Ablage von Unterschriften, Schlüssel: Event + Teilnehmername.
+    Gespeichert wird der Blob aus signature_codec (PNG, Strichdaten oder 1-Bit-Bitmap).
+    Teilnehmernamen werden über safe_signature_name normalisiert.
+
+    Speichern ist atomar und "last writer wins": wird eine vorhandene Unterschrift ersetzt,
+    bleibt die alte Version als Audit-Eintrag erhalten. Weicht die aktuelle Version von
+    expected_version ab (z.B. zwei Kiosks haben dieselbe Person parallel erfasst), wird der
+    Eintrag als Konflikt markiert.
+    """
+    backend = ""
+
+    def save(self, event_id: str, name: str, blob: bytes, expected_version: str | None = ANY_VERSION) -> list:
+        return self.save_many([(event_id, name, blob, expected_version)])
+
+    @abc.abstractmethod
+    def save_many(self, items) -> list:
+        """
+        Speichert mehrere (event_id, name, blob, expected_version)-Einträge als einen Schreibvorgang.
+        Gibt die Audit-Einträge der erkannten Konflikte zurück (leere Liste = keine Konflikte).
+        """
+
+    def current_version(self, event_id: str, name: str) -> str | None:
+        """Version der aktuell gespeicherten Unterschrift (für expected_version) oder None."""
+        return signature_version(self.load(event_id, name))
+
+    @abc.abstractmethod
+    def load(self, event_id: str, name: str) -> bytes | None:
+        """Gespeicherter Blob der Unterschrift oder None."""
+
+    @abc.abstractmethod
+    def has_signature(self, event_id: str, name: str) -> bool:
+        """True, wenn für den Teilnehmer im Event eine Unterschrift gespeichert ist."""
+
+    @abc.abstractmethod
+    def signed_keys(self, event_id: str) -> set:
+        """Menge der (normalisierten) Namen, die für das Event unterschrieben haben."""
+
+    def iter_signatures(self, event_id: str):
+        """Liefert (participant_key, blob) für alle Unterschriften des Events."""
+        for participant_key in sorted(self.signed_keys(event_id)):
+            blob = self.load(event_id, participant_key)
+            if blob is not None:
+                yield participant_key, blob
+
+    def signature_stamps(self, event_id: str) -> dict:
+        """
+        participant_key -> Änderungsmarke für alle Unterschriften des Events. Die Marke ändert sich,
+        sobald eine Unterschrift ersetzt wird (z.B. für Caches der PDF-Erzeugung); Backends liefern
+        sie ohne die Blobs zu lesen. Standard: der Inhalts-Hash.
+        """
+        return {participant_key: signature_version(blob) for participant_key, blob in self.iter_signatures(event_id)}
+
+    def image_source(self, event_id: str, name: str):
+        """Quelle für st.image (Pfad oder PNG-BytesIO) oder None."""
+        blob = self.load(event_id, name)
+        return io.BytesIO(signature_to_png(blob)) if blob is not None else None
+
+    def unsigned(self, event_id: str, names) -> list:
+        """Filtert names auf alle ohne Unterschrift (Reihenfolge bleibt erhalten)."""
+        signed = self.signed_keys(event_id)
+        return [name for name in names if safe_signature_name(name) and safe_signature_name(name) not in signed]
+
+    @abc.abstractmethod
+    def export_png_dir(self, event_id: str, target_dir: str) -> int:
+        """Schreibt alle Unterschriften des Events als <Name>.png in target_dir. Gibt die Anzahl zurück."""
+
+class FileSignatureStore(SignatureStore):
+    """Bisheriges Format: ein PNG pro Teilnehmer in einem flachen Ordner (event_id wird ignoriert)."""
+    backend = "files"
+
+    def __init__(self, signatures_dir: str = SIGNATURES_DIR):
+        self.signatures_dir = signatures_dir
+        self.registry = get_signature_registry(signatures_dir)
+        self.audit_dir = os.path.join(signatures_dir, AUDIT_DIR_NAME)
+        # Lesen der alten Version + Ersetzen ist pro Ordner serialisiert (Schutz innerhalb eines Prozesses;
+        # für mehrere Server-Prozesse ist das SQLite-Backend gedacht)
+        self._commit_lock = _directory_lock(signatures_dir)
+
+    def save_many(self, items) -> list:
+        # Alle Dateien schreiben und synchronisieren, danach einmal den Ordner (statt fsync pro Aufruf)
+        os.makedirs(self.signatures_dir, exist_ok=True)
+        conflicts = []
+        with self._commit_lock:
+            for event_id, name, blob, expected_version in items:
+                audit_record = self._commit_file(event_id, name, blob, expected_version)
+                if audit_record and audit_record["conflict"]:
+                    conflicts.append(audit_record)
+        _fsync_directory(self.signatures_dir)
+        return conflicts
+
+    def _existing_path(self, name: str) -> str | None:
+        for extension in SIGNATURE_EXTENSIONS:
+            path = self.registry.path_for(name, extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _commit_file(self, event_id: str, name: str, blob: bytes, expected_version) -> dict | None:
+        extension = SIGNATURE_EXTENSION if signature_format(blob) == "png" else COMPACT_SIGNATURE_EXTENSION
+        target_path = self.registry.path_for(name, extension)
+
+        # In eine temporäre Datei im selben Ordner schreiben und per os.replace atomar veröffentlichen:
+        # Leser sehen immer entweder die alte oder die neue Unterschrift, nie eine halb geschriebene Datei
+        # (Endung .part, damit die Registry sie nie als Unterschrift zählt)
+        fd, tmp_path = tempfile.mkstemp(dir=self.signatures_dir, prefix=".tmp-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            previous_path = self._existing_path(name)
+            audit_record = None
+            if previous_path is not None:
+                audit_record = self._archive_previous(event_id, name, previous_path, blob, expected_version)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        # Eine ältere Unterschrift im anderen Format entfernen, damit pro Person nur eine Datei existiert
+        if previous_path is not None and previous_path != target_path:
+            try:
+                os.remove(previous_path)
+            except FileNotFoundError:
+                pass
+        self.registry.mark_saved(name, extension)
+        return audit_record
+
+    def _archive_previous(self, event_id: str, name: str, previous_path: str, blob: bytes, expected_version) -> dict:
+        """Bewahrt die zu überschreibende Version im Audit-Ordner auf und protokolliert den Vorgang."""
+        with open(previous_path, "rb") as f:
+            previous_blob = f.read()
+        previous_version = signature_version(previous_blob)
+        os.makedirs(self.audit_dir, exist_ok=True)
+        safe_name = safe_signature_name(name)
+        archived_name = f"{safe_name}.{previous_version}{os.path.splitext(previous_path)[1]}"
+        archived_path = os.path.join(self.audit_dir, archived_name)
+        if not os.path.exists(archived_path):
+            try:
+                os.link(previous_path, archived_path)  # Hardlink: keine Kopie nötig
+            except OSError:
+                shutil.copy2(previous_path, archived_path)
+        audit_record = {
+            "event_id": event_id, "participant_key": safe_name, "name": str(name),
+            "replaced_at": time.time(), "previous_saved_at": os.path.getmtime(previous_path),
+            "previous_version": previous_version, "new_version": signature_version(blob),
+            "conflict": expected_version != ANY_VERSION and expected_version != previous_version,
+            "archived_as": archived_name,
+        }
+        with open(os.path.join(self.audit_dir, AUDIT_LOG_NAME), "a", encoding="utf-8") as log:
+            log.write(json.dumps(audit_record, ensure_ascii=False) + "\n")
+        return audit_record
+
+    def load(self, event_id: str, name: str) -> bytes | None:
+        path = self.registry.signature_path(name)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            self.registry.invalidate()
+            return None
+
+    def has_signature(self, event_id: str, name: str) -> bool:
+        return self.registry.has_signature(name)
+
+    def signed_keys(self, event_id: str) -> set:
+        return self.registry.signed_keys()
+
+    def unsigned(self, event_id: str, names) -> list:
+        return self.registry.unsigned(names)
+
+    def signature_stamps(self, event_id: str) -> dict:
+        stamps = {}
+        for participant_key in self.registry.signed_keys():
+            path = self.registry.signature_path(participant_key)
+            try:
+                stat = os.stat(path) if path else None
+            except FileNotFoundError:
+                stat = None
+            if stat is not None:
+                stamps[participant_key] = f"{stat.st_mtime_ns}-{stat.st_size}"
+        return stamps
+
+    def image_source(self, event_id: str, name: str):
+        path = self.registry.signature_path(name)
+        if path is None or path.endswith(SIGNATURE_EXTENSION):
+            return path
+        return super().image_source(event_id, name)
+
+    def export_png_dir(self, event_id: str, target_dir: str) -> int:
+        os.makedirs(target_dir, exist_ok=True)
+        count = 0
+        for safe_name in self.registry.signed_keys():
+            target = os.path.join(target_dir, f"{safe_name}{SIGNATURE_EXTENSION}")
+            if os.path.abspath(target) == os.path.abspath(self.registry.path_for(safe_name)):
+                count += 1
+                continue
+            blob = self.load(event_id, safe_name)
+            if blob is None:
+                continue
+            with open(target, "wb") as dst:
+                dst.write(signature_to_png(blob))
+            count += 1
+        return count
+
+class SQLiteSignatureStore(SignatureStore):
+    """
+    Alle Unterschriften samt Metadaten in einer SQLite-Datenbank im WAL-Modus.
+    Mehrere Kiosk-Sessions (Threads/Prozesse) können gleichzeitig schreiben; Lesen blockiert nicht.
+    "Wer hat unterschrieben" ist eine Abfrage über den Primärschlüssel (event_id, participant_key),
+    unabhängig davon, wie viele Events sich über das Semester ansammeln.
+    """
+    backend = "sqlite"
+
+    def __init__(self, db_path: str = SIGNATURE_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                event_id TEXT NOT NULL,
+                participant_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (event_id, participant_key)
+            ) WITHOUT ROWID""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS signature_audit (
+                event_id TEXT NOT NULL,
+                participant_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                replaced_at REAL NOT NULL,
+                previous_saved_at REAL NOT NULL,
+                previous_version TEXT NOT NULL,
+                new_version TEXT NOT NULL,
+                conflict INTEGER NOT NULL,
+                previous_payload BLOB NOT NULL
+            )""")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Eine Verbindung pro Thread; sqlite3-Verbindungen dürfen nicht zwischen Threads geteilt werden
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save_many(self, items) -> list:
+        # Eine Transaktion = ein Commit/fsync für den ganzen Batch. BEGIN IMMEDIATE nimmt die
+        # Schreibsperre sofort, damit Lesen der alten Version und Ersetzen atomar sind.
+        now = time.time()
+        conflicts = []
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for event_id, name, blob, expected_version in items:
+                participant_key = safe_signature_name(name)
+                previous = conn.execute(
+                    "SELECT saved_at, payload FROM signatures WHERE event_id = ? AND participant_key = ?",
+                    (event_id, participant_key)).fetchone()
+                if previous is not None:
+                    previous_saved_at, previous_payload = previous
+                    previous_version = signature_version(bytes(previous_payload))
+                    conflict = expected_version != ANY_VERSION and expected_version != previous_version
+                    audit_row = (event_id, participant_key, str(name), now, previous_saved_at,
+                                 previous_version, signature_version(blob), int(conflict), previous_payload)
+                    conn.execute("INSERT INTO signature_audit VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", audit_row)
+                    if conflict:
+                        conflicts.append({"event_id": event_id, "participant_key": participant_key, "name": str(name),
+                                          "replaced_at": now, "previous_version": previous_version,
+                                          "new_version": signature_version(blob), "conflict": True})
+                conn.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?, ?)",
+                             (event_id, participant_key, str(name), now, len(blob), sqlite3.Binary(blob)))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return conflicts
+
+    def load(self, event_id: str, name: str) -> bytes | None:
+        row = self._connection().execute(
+            "SELECT payload FROM signatures WHERE event_id = ? AND participant_key = ?",
+            (event_id, safe_signature_name(name))).fetchone()
+        return bytes(row[0]) if row else None
+
+    def has_signature(self, event_id: str, name: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM signatures WHERE event_id = ? AND participant_key = ?",
+            (event_id, safe_signature_name(name))).fetchone()
+        return row is not None
+
+    def signed_keys(self, event_id: str) -> set:
+        rows = self._connection().execute(
+            "SELECT participant_key FROM signatures WHERE event_id = ?", (event_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def signature_stamps(self, event_id: str) -> dict:
+        rows = self._connection().execute(
+            "SELECT participant_key, saved_at, size FROM signatures WHERE event_id = ?", (event_id,)).fetchall()
+        return {participant_key: f"{saved_at!r}-{size}" for participant_key, saved_at, size in rows}
+
+    def iter_signatures(self, event_id: str):
+        rows = self._connection().execute(
+            "SELECT participant_key, payload FROM signatures WHERE event_id = ? ORDER BY participant_key",
+            (event_id,)).fetchall()
+        for participant_key, payload in rows:
+            yield participant_key, bytes(payload)
+
+    def export_png_dir(self, event_id: str, target_dir: str) -> int:
+        os.makedirs(target_dir, exist_ok=True)
+        count = 0
+        for participant_key, payload in self._connection().execute(
+                "SELECT participant_key, payload FROM signatures WHERE event_id = ?", (event_id,)):
+            with open(os.path.join(target_dir, f"{participant_key}{SIGNATURE_EXTENSION}"), "wb") as f:
+                f.write(signature_to_png(bytes(payload)))
+            count += 1
+        return count
+
+    def import_png_dir(self, event_id: str, source_dir: str) -> int:
+        """Übernimmt einen bestehenden Unterschriften-Ordner (z.B. beim Umstieg von 'files' auf 'sqlite')."""
+        rows = []
+        with os.scandir(source_dir) as entries:
+            for entry in entries:
+                key, extension = os.path.splitext(entry.name)
+                if extension in SIGNATURE_EXTENSIONS and not entry.name.startswith(".") and entry.is_file():
+                    with open(entry.path, "rb") as f:
+                        blob = f.read()
+                    rows.append((event_id, key, key.replace("_", " "), entry.stat().st_mtime, len(blob), sqlite3.Binary(blob)))
+        conn = self._connection()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO signatures VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+_directory_locks = {}
+_directory_locks_guard = threading.Lock()
+
+def _directory_lock(path: str) -> threading.Lock:
+    """Gemeinsamer Lock pro Unterschriften-Ordner (mehrere Store-Instanzen auf denselben Ordner)."""
+    key = os.path.abspath(path)
+    with _directory_locks_guard:
+        return _directory_locks.setdefault(key, threading.Lock())
+
+_store = None
+_store_lock = threading.Lock()
+
+def _migrate_png_dir(store: "SQLiteSignatureStore", source_dir: str = SIGNATURES_DIR):
+    """Übernimmt beim Umstieg auf 'sqlite' einmalig den bisherigen PNG-Ordner, solange die Datenbank leer ist."""
+    if not os.path.isdir(source_dir):
+        return
+    if store._connection().execute("SELECT 1 FROM signatures LIMIT 1").fetchone() is not None:
+        return
+    try:
+        count = store.import_png_dir(SIGNATURE_MIGRATION_EVENT_ID, source_dir)
+    except (OSError, sqlite3.Error) as e:
+        print(f"WARNUNG (signature_store): Übernahme der Unterschriften aus '{source_dir}' fehlgeschlagen: {e}")
+        return
+    if count:
+        print(f"INFO (signature_store): {count} Unterschriften aus '{source_dir}' in Event "
+              f"'{SIGNATURE_MIGRATION_EVENT_ID}' übernommen.")
+        if SIGNATURE_MIGRATION_EVENT_ID == DEFAULT_EVENT_ID:
+            # Kiosk und PDF suchen unter der sheet_id des Events, nicht unter "default"
+            print(f"WARNUNG (signature_store): SIGNATURE_MIGRATION_EVENT_ID ist nicht gesetzt, die {count} Unterschriften "
+                  f"liegen unter Event '{DEFAULT_EVENT_ID}' und erscheinen nicht in Kiosk und PDF, die nach der "
+                  f"Sheet-ID suchen. SIGNATURE_MIGRATION_EVENT_ID auf die Sheet-ID setzen oder nachträglich "
+                  f"SQLiteSignatureStore().import_png_dir(\"<sheet_id>\", \"{source_dir}\") aufrufen.")
+
+def get_signature_store() -> SignatureStore:
+    """Prozessweit konfigurierter Store (SIGNATURE_STORE_BACKEND)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SIGNATURE_STORE_BACKEND == "sqlite":
+                _store = SQLiteSignatureStore(SIGNATURE_DB_PATH)
+                _migrate_png_dir(_store)
+            else:
+                if SIGNATURE_STORE_BACKEND != "files":
+                    print(f"WARNUNG (signature_store): Unbekanntes Backend '{SIGNATURE_STORE_BACKEND}', verwende 'files'.")
+                _store = FileSignatureStore(SIGNATURES_DIR)
+            print(f"INFO (signature_store): Unterschriften-Backend: {_store.backend}")
+        return _store
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = SQLiteSignatureStore(os.path.join(tmp_dir, "test.sqlite3"))
+        names = [f"Teilnehmer {i}" for i in range(200)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(lambda n: store.save("event-a", n, b"\x89PNG" + n.encode()), names))
+        print(f"200 parallele Speichervorgänge: {time.perf_counter() - start:.3f}s")
+        print("Unterschrieben:", len(store.signed_keys("event-a")), "| anderes Event:", len(store.signed_keys("event-b")))
+        print("Ohne Unterschrift:", store.unsigned("event-a", names[:3] + ["Neu Hinzugefügt"]))
+        print("Export:", store.export_png_dir("event-a", os.path.join(tmp_dir, "export")), "Dateien")
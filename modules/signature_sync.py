@@ -0,0 +1,321 @@
+# modules/signature_sync.py
+
+import io
+import os
+import json
+import time
+import zipfile
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.http import MediaIoBaseUpload
+
+from modules.auth import get_credentials
+from modules.google_services import get_service
+from modules.signature_codec import signature_format
+from modules.signature_registry import SIGNATURE_EXTENSION, COMPACT_SIGNATURE_EXTENSION
+from modules.signature_store import ANY_VERSION, SignatureStore, get_signature_store, signature_version
+from modules.submission_handler import TARGET_DRIVE_FOLDER_ID
+
+# Drive-Ordner, unter dem pro Event ein Unterordner "Unterschriften_<event_id>" angelegt wird
+SIGNATURE_DRIVE_FOLDER_ID = os.environ.get("SIGNATURE_DRIVE_FOLDER_ID", TARGET_DRIVE_FOLDER_ID)
+EVENT_FOLDER_PREFIX = "Unterschriften_"
+MANIFEST_NAME = "manifest.json"
+BUNDLE_PREFIX = "bundle-"
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Parallele Downloads beim Wiederherstellen
+SYNC_MAX_WORKERS = 4
+# Drive nimmt höchstens 100 Aufrufe pro Batch-Request an
+DRIVE_BATCH_LIMIT = 100
+# Nicht mehr referenzierte Bundles erst nach dieser Zeit in den Papierkorb legen
+# (ein anderer Rechner könnte gerade ein Bundle hochgeladen, das Manifest aber noch nicht geschrieben haben)
+BUNDLE_TRASH_GRACE_SECONDS = 3600
+# So oft wird das Manifest neu gelesen und zusammengeführt, wenn es parallel geändert wurde
+MANIFEST_WRITE_ATTEMPTS = 5
+
+class _DriveClient:
+    """Dünne Hülle um den Drive-v3-Client, die die HTTP-Roundtrips eines Sync-Laufs zählt."""
+
+    def __init__(self, service):
+        self.service = service
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def execute(self, request):
+        with self._lock:
+            self.requests += 1
+        return request.execute()
+
+    def find_folder(self, parent_id: str, folder_name: str) -> str | None:
+        """ID des Unterordners folder_name oder None; legt nichts an."""
+        query = (f"name = '{_escape_query(folder_name)}' and '{_escape_query(parent_id)}' in parents "
+                 f"and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false")
+        found = self.execute(self.service.files().list(q=query, fields="files(id)", pageSize=1))
+        return found["files"][0]["id"] if found.get("files") else None
+
+    def find_or_create_folder(self, parent_id: str, folder_name: str) -> str:
+        folder_id = self.find_folder(parent_id, folder_name)
+        if folder_id:
+            return folder_id
+        created = self.execute(self.service.files().create(
+            body={"name": folder_name, "mimeType": FOLDER_MIME_TYPE, "parents": [parent_id]}, fields="id"))
+        return created["id"]
+
+    def list_folder(self, folder_id: str) -> dict:
+        """Alle Dateien im Ordner als {Name: Metadaten}; eine Seite umfasst bis zu 1000 Dateien."""
+        files, page_token = {}, None
+        while True:
+            response = self.execute(self.service.files().list(
+                q=f"'{_escape_query(folder_id)}' in parents and trashed = false",
+                fields="nextPageToken, files(id, name, md5Checksum, createdTime, appProperties)",
+                pageSize=1000, pageToken=page_token))
+            for item in response.get("files", []):
+                files[item["name"]] = item
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return files
+
+    def find_file(self, folder_id: str, name: str) -> dict | None:
+        """Metadaten (id, md5Checksum) der Datei mit diesem Namen im Ordner oder None."""
+        response = self.execute(self.service.files().list(
+            q=f"name = '{_escape_query(name)}' and '{_escape_query(folder_id)}' in parents and trashed = false",
+            fields="files(id, md5Checksum)", pageSize=1))
+        found = response.get("files", [])
+        return found[0] if found else None
+
+    def download(self, file_id: str) -> bytes:
+        return self.execute(self.service.files().get_media(fileId=file_id))
+
+    def upload(self, data: bytes, name: str, mimetype: str, folder_id: str,
+               file_id: str | None = None, app_properties: dict | None = None) -> str:
+        # resumable=False: Metadaten und Inhalt in einem einzigen multipart-Request
+        media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype, resumable=False)
+        body = {"name": name}
+        if app_properties:
+            body["appProperties"] = app_properties
+        if file_id:
+            request = self.service.files().update(fileId=file_id, body=body, media_body=media, fields="id")
+        else:
+            body["parents"] = [folder_id]
+            request = self.service.files().create(body=body, media_body=media, fields="id")
+        return self.execute(request)["id"]
+
+    def trash_many(self, file_ids: list) -> list:
+        """Legt Dateien gebündelt in den Papierkorb (ein Batch-Request pro 100 Dateien)."""
+        failed = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                failed.append((request_id, f"{type(exception).__name__}: {exception}"))
+
+        for start in range(0, len(file_ids), DRIVE_BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for file_id in file_ids[start:start + DRIVE_BATCH_LIMIT]:
+                batch.add(self.service.files().update(fileId=file_id, body={"trashed": True}, fields="id"),
+                          request_id=file_id)
+            with self._lock:
+                self.requests += 1
+            batch.execute()
+        return failed
+
+def _escape_query(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("'", "\\'")
+
+def _drive_client(credentials) -> _DriveClient:
+    credentials = credentials or get_credentials()
+    if not credentials:
+        raise ValueError("Keine Google-Zugangsdaten vorhanden (token.json bzw. GOOGLE_CREDENTIALS_JSON).")
+    return _DriveClient(get_service("drive", "v3", credentials=credentials))
+
+def _signature_extension(blob: bytes) -> str:
+    return SIGNATURE_EXTENSION if signature_format(blob) == "png" else COMPACT_SIGNATURE_EXTENSION
+
+def _empty_manifest(event_id: str) -> dict:
+    return {"format": 1, "event_id": event_id, "updated_at": None, "signatures": {}}
+
+def _load_manifest(client: _DriveClient, files: dict, event_id: str) -> dict:
+    manifest_file = files.get(MANIFEST_NAME)
+    if manifest_file is None:
+        return _empty_manifest(event_id)
+    try:
+        manifest = json.loads(client.download(manifest_file["id"]).decode("utf-8"))
+        manifest.setdefault("signatures", {})
+        return manifest
+    except (ValueError, UnicodeDecodeError) as e:
+        print(f"WARNUNG (signature_sync): Manifest für '{event_id}' unlesbar ({e}); alle Unterschriften werden neu hochgeladen.")
+        return _empty_manifest(event_id)
+
+def _write_manifest(client: _DriveClient, folder_id: str, event_id: str, manifest_file: dict | None,
+                    manifest: dict, updates: dict) -> dict:
+    """
+    Trägt updates (Teilnehmer -> Version + Bundle) ins Manifest ein und schreibt es nur, wenn es seit dem
+    Lesen unverändert ist (gleiche Datei-ID und md5Checksum). Hat ein anderer Rechner es inzwischen
+    geschrieben, wird es neu gelesen, zusammengeführt und erneut geprüft. Drive kennt keine bedingten
+    Uploads; zwischen Prüfung und Schreiben bleibt daher ein Fenster von einem Request.
+    Gibt das geschriebene Manifest zurück.
+    """
+    for _ in range(MANIFEST_WRITE_ATTEMPTS):
+        current = client.find_file(folder_id, MANIFEST_NAME)
+        read_state = (manifest_file or {}).get("id"), (manifest_file or {}).get("md5Checksum")
+        if ((current or {}).get("id"), (current or {}).get("md5Checksum")) != read_state:
+            print(f"INFO (signature_sync): Manifest für '{event_id}' wurde parallel geändert, führe zusammen.")
+            manifest_file = current
+            manifest = _load_manifest(client, {MANIFEST_NAME: current} if current else {}, event_id)
+            continue
+        manifest["signatures"].update(updates)
+        manifest.update({"format": 1, "event_id": event_id,
+                         "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds")})
+        client.upload(json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"), MANIFEST_NAME,
+                      "application/json", folder_id, file_id=manifest_file["id"] if manifest_file else None)
+        return manifest
+    raise RuntimeError(f"Manifest für '{event_id}' wurde während des Syncs wiederholt geändert; bitte erneut versuchen.")
+
+def _build_bundle(entries: list) -> bytes:
+    """ZIP mit den Blobs aus signature_codec (bereits komprimiert, daher ZIP_STORED)."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as bundle:
+        for participant_key, blob in entries:
+            bundle.writestr(f"{participant_key}{_signature_extension(blob)}", blob)
+    return buffer.getvalue()
+
+def _created_timestamp(file_meta: dict) -> float:
+    try:
+        return datetime.fromisoformat(file_meta["createdTime"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, ValueError):
+        return 0.0
+
+def sync_signatures_to_drive(event_id: str, store: SignatureStore | None = None, credentials=None,
+                             root_folder_id: str = SIGNATURE_DRIVE_FOLDER_ID,
+                             participant_keys: set | None = None) -> dict:
+    """
+    Sichert die Unterschriften eines Events im Drive-Ordner "Unterschriften_<event_id>".
+    Im Ordner liegt ein manifest.json (Teilnehmer -> Version + Bundle). Lokale Unterschriften werden
+    mit dem Manifest verglichen; nur neue oder geänderte landen in einem neuen ZIP-Bundle.
+    Ein Lauf braucht damit unabhängig von der Anzahl Unterschriften nur wenige Requests:
+    Ordner suchen, Ordner auflisten, Manifest laden, Bundle hochladen, Manifest schreiben
+    und ggf. ein Batch-Request für veraltete Bundles.
+    participant_keys (normalisierte Namen, siehe safe_signature_name) beschränkt den Sync auf die
+    Teilnehmer des Events. Für das Datei-Backend ist er Pflicht, da es keine Events kennt und sonst
+    alle Unterschriften des Ordners im Event-Ordner landen würden.
+    Gibt einen Bericht (hochgeladen, unverändert, Requests, Dauer) zurück.
+    """
+    start = time.perf_counter()
+    store = store or get_signature_store()
+    if participant_keys is None and store.backend == "files":
+        raise ValueError("Das Datei-Backend speichert Unterschriften ohne Event; für den Sync pro Event "
+                         "participant_keys (Teilnehmer des Events) übergeben.")
+    local = {participant_key: blob for participant_key, blob in store.iter_signatures(event_id)
+             if participant_keys is None or participant_key in participant_keys}
+    report = {"event_id": event_id, "local": len(local), "uploaded": 0, "unchanged": 0,
+              "bundle": None, "trashed": 0, "requests": 0, "seconds": 0.0}
+    if not local:
+        return report
+
+    client = _drive_client(credentials)
+    folder_id = client.find_or_create_folder(root_folder_id, f"{EVENT_FOLDER_PREFIX}{event_id}")
+    files = client.list_folder(folder_id)
+    manifest = _load_manifest(client, files, event_id)
+    remote = manifest["signatures"]
+
+    changed = [(key, blob) for key, blob in local.items()
+               if remote.get(key, {}).get("version") != signature_version(blob)]
+    report["unchanged"] = len(local) - len(changed)
+
+    if changed:
+        bundle_name = f"{BUNDLE_PREFIX}{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}.zip"
+        client.upload(_build_bundle(changed), bundle_name, "application/zip", folder_id,
+                      app_properties={"event_id": event_id, "signatures": str(len(changed))})
+        updates = {participant_key: {"version": signature_version(blob), "bundle": bundle_name}
+                   for participant_key, blob in changed}
+        # Manifest erst nach erfolgreichem Bundle-Upload schreiben: bricht der Lauf ab, wird beim nächsten Mal neu hochgeladen
+        manifest = _write_manifest(client, folder_id, event_id, files.get(MANIFEST_NAME), manifest, updates)
+        remote = manifest["signatures"]
+        report.update({"uploaded": len(changed), "bundle": bundle_name})
+
+    # Bundles, auf die das Manifest nicht mehr verweist (alle Einträge durch neuere ersetzt)
+    referenced = {entry.get("bundle") for entry in remote.values()}
+    now = time.time()
+    obsolete = [meta["id"] for name, meta in files.items()
+                if name.startswith(BUNDLE_PREFIX) and name not in referenced
+                and now - _created_timestamp(meta) > BUNDLE_TRASH_GRACE_SECONDS]
+    if obsolete:
+        failed = client.trash_many(obsolete)
+        for file_id, error in failed:
+            print(f"WARNUNG (signature_sync): Veraltetes Bundle {file_id} nicht entfernt: {error}")
+        report["trashed"] = len(obsolete) - len(failed)
+
+    report["requests"] = client.requests
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def restore_signatures_from_drive(event_id: str, store: SignatureStore | None = None, credentials=None,
+                                  root_folder_id: str = SIGNATURE_DRIVE_FOLDER_ID,
+                                  max_workers: int = SYNC_MAX_WORKERS) -> dict:
+    """
+    Holt die gesicherten Unterschriften eines Events aus Drive zurück (z.B. nach einem Umzug des Kiosks).
+    Die Bundles werden parallel geladen; lokal bereits vorhandene Unterschriften bleiben unangetastet.
+    Gibt es für das Event noch keinen Drive-Ordner, wird nichts angelegt und 0 wiederhergestellt.
+    """
+    start = time.perf_counter()
+    store = store or get_signature_store()
+    client = _drive_client(credentials)
+    report = {"event_id": event_id, "restored": 0, "skipped": 0, "missing": 0, "requests": 0, "seconds": 0.0}
+
+    folder_id = client.find_folder(root_folder_id, f"{EVENT_FOLDER_PREFIX}{event_id}")
+    if folder_id is None:
+        print(f"INFO (signature_sync): Keine Sicherung für '{event_id}' in Drive gefunden.")
+        report["requests"] = client.requests
+        report["seconds"] = time.perf_counter() - start
+        return report
+    files = client.list_folder(folder_id)
+    remote = _load_manifest(client, files, event_id)["signatures"]
+    signed = store.signed_keys(event_id)
+    wanted = {key: entry for key, entry in remote.items() if key not in signed}
+    report["skipped"] = len(remote) - len(wanted)
+
+    bundle_names = sorted({entry["bundle"] for entry in wanted.values()})
+    available = [name for name in bundle_names if name in files]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        payloads = dict(zip(available, pool.map(lambda name: client.download(files[name]["id"]), available)))
+
+    items = []
+    for participant_key, entry in wanted.items():
+        payload = payloads.get(entry["bundle"])
+        blob = None
+        if payload is not None:
+            with zipfile.ZipFile(io.BytesIO(payload)) as bundle:
+                for extension in (SIGNATURE_EXTENSION, COMPACT_SIGNATURE_EXTENSION):
+                    try:
+                        blob = bundle.read(f"{participant_key}{extension}")
+                        break
+                    except KeyError:
+                        continue
+        if blob is None or signature_version(blob) != entry.get("version"):
+            report["missing"] += 1
+            continue
+        items.append((event_id, participant_key, blob, ANY_VERSION))
+    if items:
+        store.save_many(items)
+    report["restored"] = len(items)
+    report["requests"] = client.requests
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+if __name__ == "__main__":
+    import sys
+
+    from modules.signature_registry import safe_signature_name
+    from modules.signature_store import DEFAULT_EVENT_ID
+
+    event = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_EVENT_ID
+    signature_store = get_signature_store()
+    keys = None
+    if len(sys.argv) > 2:
+        # Weitere Argumente: Namen der Teilnehmer, deren Unterschriften gesichert werden sollen
+        keys = {safe_signature_name(name) for name in sys.argv[2:]}
+    elif signature_store.backend == "files":
+        keys = signature_store.signed_keys(event)
+        print(f"INFO (signature_sync): Datei-Backend ohne Teilnehmernamen, sichere alle {len(keys)} "
+              f"Unterschriften des Ordners nach '{EVENT_FOLDER_PREFIX}{event}'.")
+    print(sync_signatures_to_drive(event, store=signature_store, participant_keys=keys))
@@ -0,0 +1,305 @@
+# modules/signature_writer.py
+
+import io
+import os
+import json
+import time
+import queue
+import base64
+import atexit
+import tempfile
+import threading
+import numpy as np
+
+from modules.signature_registry import SIGNATURES_DIR, safe_signature_name
+from modules.signature_codec import encode_signature
+from modules.signature_store import ANY_VERSION, SignatureStore, get_signature_store
+
+WRITER_QUEUE_SIZE = int(os.environ.get("SIGNATURE_WRITER_QUEUE_SIZE", "256"))
+# Maximal so viele Unterschriften werden in einem Durchgang (eine Transaktion / ein fsync) geschrieben
+WRITER_BATCH_SIZE = 32
+# Kurzes Warten auf weitere Aufträge, um Speichervorgänge mehrerer Kiosks zu bündeln
+WRITER_BATCH_WINDOW_SECONDS = 0.05
+WRITER_RETRIES = 3
+WRITER_RETRY_BASE_DELAY_SECONDS = 0.2
+# Unterschriften, die auch einzeln nicht gespeichert werden konnten, landen hier als JSON-Datei
+# (siehe replay_dead_letters); der Punkt hält den Ordner aus der Unterschriften-Registry heraus.
+DEAD_LETTER_DIR = os.path.join(SIGNATURES_DIR, ".deadletter")
+
+class SignatureWriter:
+    """
+    Speichert Unterschriften in einem Hintergrund-Thread, damit der Kiosk sofort zum nächsten
+    Teilnehmer springen kann. Aufträge liegen in einer begrenzten Queue; bis sie geschrieben sind,
+    gelten sie als "pending" und werden von is_pending/pending_keys als bereits unterschrieben gemeldet
+    (optimistische Bestätigung). Fehlgeschlagene Batches werden mit Backoff wiederholt und danach
+    Eintrag für Eintrag gespeichert, damit ein einzelner fehlerhafter Auftrag nicht den ganzen Batch
+    mitreißt. Was auch einzeln scheitert, wird in dead_letter_dir abgelegt statt verworfen.
+    Vom Store gemeldete Konflikte (parallele Erfassung derselben Person) werden gezählt und protokolliert.
+    """
+
+    def __init__(self, store: SignatureStore, max_queue: int = WRITER_QUEUE_SIZE,
+                 batch_size: int = WRITER_BATCH_SIZE, retries: int = WRITER_RETRIES,
+                 dead_letter_dir: str = DEAD_LETTER_DIR):
+        self.store = store
+        self.batch_size = batch_size
+        self.retries = retries
+        self.dead_letter_dir = dead_letter_dir
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._pending = {}  # (event_id, safe_name) -> Anzahl offener Aufträge
+        self._stats = {"submitted": 0, "written": 0, "batches": 0, "retries": 0, "failed": 0, "conflicts": 0,
+                       "dead_lettered": 0}
+        self._last_error = None
+        self._last_batch_seconds = None
+        self._thread = threading.Thread(target=self._run, name="signature-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, event_id: str, name: str, image_data, json_data=None, stroke_width: float = 3,
+               expected_version: str | None = ANY_VERSION, timeout: float = 0.5):
+        """
+        Reiht eine Unterschrift ein (Kodierung und Schreiben passieren im Hintergrund).
+        expected_version: Version, die der Kiosk beim Öffnen des Canvas gesehen hat (None = noch keine).
+        Wirft queue.Full, wenn die Queue auch nach timeout Sekunden noch voll ist.
+        """
+        key = (event_id, safe_signature_name(name))
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._stats["submitted"] += 1
+        try:
+            self._queue.put((event_id, name, image_data, json_data, stroke_width, expected_version), timeout=timeout)
+        except queue.Full:
+            self._release(key)
+            raise
+
+    def _release(self, key):
+        with self._lock:
+            remaining = self._pending.get(key, 0) - 1
+            if remaining > 0:
+                self._pending[key] = remaining
+            else:
+                self._pending.pop(key, None)
+
+    def is_pending(self, event_id: str, name: str) -> bool:
+        with self._lock:
+            return (event_id, safe_signature_name(name)) in self._pending
+
+    def pending_keys(self, event_id: str) -> set:
+        """Normalisierte Namen, deren Unterschrift eingereiht, aber noch nicht geschrieben ist."""
+        with self._lock:
+            return {safe_name for (pending_event, safe_name) in self._pending if pending_event == event_id}
+
+    def _take_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITER_BATCH_WINDOW_SECONDS
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _save_with_retries(self, items: list, retries: int) -> bool:
+        for attempt in range(retries + 1):
+            try:
+                conflicts = self.store.save_many(items)
+                self._last_error = None
+                for conflict in conflicts:
+                    print(f"WARNUNG (signature_writer): Unterschrift für '{conflict['name']}' wurde parallel "
+                          f"erfasst; neuere Version gespeichert, vorherige im Audit ({conflict['previous_version']}).")
+                with self._lock:
+                    self._stats["conflicts"] += len(conflicts)
+                return True
+            except Exception as e:
+                self._last_error = f"{type(e).__name__}: {e}"
+                if attempt < retries:
+                    with self._lock:
+                        self._stats["retries"] += 1
+                    time.sleep(WRITER_RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+        return False
+
+    def _write_batch(self, batch: list) -> int:
+        """
+        Kodiert und speichert einen Batch, gibt die Anzahl gespeicherter Unterschriften zurück.
+        Scheitert der gemeinsame Schreibvorgang, wird jeder Eintrag einzeln gespeichert;
+        was dann noch scheitert (oder schon nicht kodiert werden kann), geht in den Dead-Letter-Ordner.
+        """
+        items, jobs = [], []
+        for job in batch:
+            event_id, name, image_data, json_data, stroke_width, expected_version = job
+            try:
+                blob = encode_signature(image_data, json_data, stroke_width=stroke_width)
+            except Exception as e:
+                self._last_error = f"{type(e).__name__}: {e}"
+                self._dead_letter(job, None, self._last_error)
+                continue
+            items.append((event_id, name, blob, expected_version))
+            jobs.append(job)
+        if not items:
+            return 0
+        if self._save_with_retries(items, self.retries):
+            return len(items)
+        if len(items) == 1:
+            self._dead_letter(jobs[0], items[0][2], self._last_error)
+            return 0
+
+        print(f"WARNUNG (signature_writer): Batch mit {len(items)} Unterschriften fehlgeschlagen "
+              f"({self._last_error}), speichere einzeln.")
+        written = 0
+        for job, item in zip(jobs, items):
+            if self._save_with_retries([item], 0):
+                written += 1
+            else:
+                self._dead_letter(job, item[2], self._last_error)
+        return written
+
+    def _dead_letter(self, job: tuple, blob: bytes | None, error: str):
+        """Legt einen nicht speicherbaren Auftrag atomar als JSON-Datei ab (mit Blob oder, falls nicht kodierbar, Rohdaten)."""
+        event_id, name, image_data, json_data, stroke_width, expected_version = job
+        record = {"event_id": event_id, "name": name, "expected_version": expected_version,
+                  "stroke_width": stroke_width, "error": error, "failed_at": time.time()}
+        if blob is not None:
+            record["blob"] = base64.b64encode(blob).decode("ascii")
+        else:
+            record["json_data"] = json_data
+            if image_data is not None:
+                buffer = io.BytesIO()
+                np.save(buffer, np.asarray(image_data), allow_pickle=False)
+                record["image_npy"] = base64.b64encode(buffer.getvalue()).decode("ascii")
+        with self._lock:
+            self._stats["dead_lettered"] += 1
+        try:
+            os.makedirs(self.dead_letter_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.dead_letter_dir, prefix=".tmp-", suffix=".part")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(record, f, ensure_ascii=False, default=str)
+                target = os.path.join(self.dead_letter_dir,
+                                      f"{time.time_ns()}-{safe_signature_name(name) or 'unbekannt'}.json")
+                os.replace(tmp_path, target)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            print(f"FEHLER (signature_writer): Unterschrift für '{name}' verloren, Dead-Letter nicht schreibbar: {e}")
+            return
+        print(f"FEHLER (signature_writer): Unterschrift für '{name}' nicht gespeichert ({error}), "
+              f"abgelegt in {target}")
+
+    def _dead_letter_files(self) -> list:
+        """Aktuell abgelegte Dead-Letter-Dateien (ohne halb geschriebene .tmp-Dateien), älteste zuerst."""
+        if not os.path.isdir(self.dead_letter_dir):
+            return []
+        return [file_name for file_name in sorted(os.listdir(self.dead_letter_dir))
+                if not file_name.startswith(".") and file_name.endswith(".json")]
+
+    def replay_dead_letters(self) -> int:
+        """
+        Versucht alle abgelegten Unterschriften erneut zu speichern (z.B. nachdem der Store wieder
+        erreichbar ist) und löscht erfolgreich gespeicherte Dateien. Gibt die Anzahl zurück.
+        """
+        replayed = 0
+        for file_name in self._dead_letter_files():
+            path = os.path.join(self.dead_letter_dir, file_name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    record = json.load(f)
+                if "blob" in record:
+                    blob = base64.b64decode(record["blob"])
+                else:
+                    image_data = None
+                    if record.get("image_npy"):
+                        image_data = np.load(io.BytesIO(base64.b64decode(record["image_npy"])), allow_pickle=False)
+                    blob = encode_signature(image_data, record.get("json_data"), stroke_width=record["stroke_width"])
+                self.store.save_many([(record["event_id"], record["name"], blob, record["expected_version"])])
+            except Exception as e:
+                print(f"WARNUNG (signature_writer): Dead-Letter '{file_name}' weiterhin nicht speicherbar: {e}")
+                continue
+            os.remove(path)
+            replayed += 1
+        return replayed
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            start = time.perf_counter()
+            try:
+                written = self._write_batch(batch)
+            except Exception as e:  # unerwarteter Fehler: nicht den Writer-Thread beenden
+                self._last_error = f"{type(e).__name__}: {e}"
+                print(f"FEHLER (signature_writer): {self._last_error}")
+                written = 0
+            self._last_batch_seconds = time.perf_counter() - start
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["written"] += written
+                self._stats["failed"] += len(batch) - written
+            for event_id, name, *_ in batch:
+                self._release((event_id, safe_signature_name(name)))
+                self._queue.task_done()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wartet, bis alle eingereihten Unterschriften geschrieben sind. False bei Timeout."""
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def health(self) -> dict:
+        """
+        Zustand des Writers für Anzeige/Monitoring. "dead_letter" ist die Zahl der Dateien, die gerade
+        in dead_letter_dir liegen (sinkt nach replay_dead_letters); "dead_lettered" zählt alle Ablagen
+        seit dem Start des Prozesses.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats.update({
+            "queued": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "worker_alive": self._thread.is_alive(),
+            "last_batch_seconds": self._last_batch_seconds,
+            "last_error": self._last_error,
+            "backend": self.store.backend,
+            "dead_letter": len(self._dead_letter_files()),
+        })
+        return stats
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_signature_writer() -> SignatureWriter:
+    """Prozessweiter Writer für den konfigurierten SignatureStore."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SignatureWriter(get_signature_store())
+            atexit.register(_writer.flush, 10)
+        return _writer
+
+if __name__ == "__main__":
+    import tempfile
+    import numpy as np
+    from modules.signature_store import SQLiteSignatureStore
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = SignatureWriter(SQLiteSignatureStore(os.path.join(tmp_dir, "test.sqlite3")))
+        canvas = np.zeros((250, 550, 4), dtype=np.uint8)
+        canvas[120:130, 50:500] = (0, 0, 0, 255)
+
+        submit_times = []
+        for i in range(100):
+            start = time.perf_counter()
+            writer.submit("event-a", f"Teilnehmer {i}", canvas)
+            submit_times.append(time.perf_counter() - start)
+        print(f"submit: max {max(submit_times) * 1000:.2f} ms | pending direkt danach: {len(writer.pending_keys('event-a'))}")
+        print("flush ok:", writer.flush(timeout=30))
+        print("health:", writer.health())
+        print("gespeichert:", len(writer.store.signed_keys("event-a")))
@@ -0,0 +1,115 @@
+# modules/snapshot_store.py
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import pandas as pd
+
+SNAPSHOT_DB_PATH = os.path.join(".cache", "participant_snapshots.sqlite3")
+# Anzahl der Revisionen, die pro Sheet aufbewahrt werden
+SNAPSHOTS_PER_SHEET = 3
+
+_schema_lock = threading.Lock()
+_initialized_paths = set()
+
+def _connect(db_path: str = SNAPSHOT_DB_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=10)
+    with _schema_lock:
+        if db_path not in _initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Alte Tabelle ohne Konto-Schlüssel: Herkunft unbekannt, daher verwerfen
+            conn.execute("DROP TABLE IF EXISTS snapshots")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sheet_snapshots (
+                    access_key TEXT NOT NULL,
+                    sheet_id TEXT NOT NULL,
+                    revision TEXT NOT NULL,
+                    saved_at REAL NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    PRIMARY KEY (access_key, sheet_id, revision)
+                )""")
+            conn.commit()
+            _initialized_paths.add(db_path)
+    return conn
+
+def _encode_dataframe(df: pd.DataFrame) -> bytes:
+    """Spaltenweise Serialisierung (Spaltenname -> Werteliste), zlib-komprimiert."""
+    payload = {
+        "columns": [str(col) for col in df.columns],
+        "data": [df.iloc[:, i].astype(object).where(df.iloc[:, i].notna(), None).tolist() for i in range(df.shape[1])],
+        "categorical": [str(col) for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)],
+    }
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+def _decode_dataframe(blob: bytes) -> pd.DataFrame:
+    payload = json.loads(zlib.decompress(blob).decode("utf-8"))
+    df = pd.DataFrame(dict(zip(range(len(payload["columns"])), payload["data"])))
+    df.columns = payload["columns"]
+    for col in payload.get("categorical", []):
+        df[col] = df[col].astype("category")
+    return df
+
+def save_snapshot(sheet_id: str, revision: str, df: pd.DataFrame, access_key: str,
+                  db_path: str = SNAPSHOT_DB_PATH) -> bool:
+    """
+    Speichert einen geladenen Teilnehmer-DataFrame als Snapshot (Schlüssel: Konto + sheet_id + Revision).
+    access_key ist der Konto-Schlüssel aus google_services._credentials_key ("anonymous" ohne
+    Credentials), damit ein Snapshot nur dem Konto ausgeliefert wird, das ihn geladen hat.
+    Existiert die Revision bereits, passiert nichts. Ältere Revisionen werden bis auf
+    SNAPSHOTS_PER_SHEET gelöscht. Gibt True zurück, wenn ein neuer Snapshot geschrieben wurde.
+    """
+    conn = _connect(db_path)
+    try:
+        exists = conn.execute("SELECT 1 FROM sheet_snapshots WHERE access_key = ? AND sheet_id = ? AND revision = ?",
+                              (access_key, sheet_id, revision)).fetchone()
+        if exists:
+            return False
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO sheet_snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                         (access_key, sheet_id, revision, time.time(), len(df), _encode_dataframe(df)))
+            conn.execute("""
+                DELETE FROM sheet_snapshots WHERE access_key = ? AND sheet_id = ? AND revision NOT IN (
+                    SELECT revision FROM sheet_snapshots WHERE access_key = ? AND sheet_id = ?
+                    ORDER BY saved_at DESC LIMIT ?)""",
+                         (access_key, sheet_id, access_key, sheet_id, SNAPSHOTS_PER_SHEET))
+        return True
+    finally:
+        conn.close()
+
+def save_snapshot_in_background(sheet_id: str, revision: str, df: pd.DataFrame, access_key: str):
+    """Wie save_snapshot, aber ohne den aufrufenden Request zu blockieren."""
+    def _run():
+        try:
+            save_snapshot(sheet_id, revision, df, access_key)
+        except Exception as e:
+            print(f"WARNUNG (snapshot_store): Snapshot für '{sheet_id}' konnte nicht gespeichert werden: {e}")
+    threading.Thread(target=_run, name="snapshot-writer", daemon=True).start()
+
+def load_latest_snapshot(sheet_id: str, access_key: str, db_path: str = SNAPSHOT_DB_PATH) -> pd.DataFrame | None:
+    """
+    Lädt den neuesten Snapshot eines Sheets, den dasselbe Konto (access_key) gespeichert hat,
+    oder None. Snapshots anderer Konten werden nie ausgeliefert. sheet_id, revision und
+    snapshot_saved_at werden wie beim Loader als DataFrame.attrs gesetzt.
+    """
+    if not os.path.exists(db_path):
+        return None
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT revision, saved_at, payload FROM sheet_snapshots "
+                           "WHERE access_key = ? AND sheet_id = ? ORDER BY saved_at DESC LIMIT 1",
+                           (access_key, sheet_id)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    revision, saved_at, payload = row
+    df = _decode_dataframe(payload)
+    df.attrs["sheet_id"] = sheet_id
+    df.attrs["revision"] = revision
+    df.attrs["snapshot_saved_at"] = saved_at
+    return df
@@ -6,7 +6,6 @@ from datetime import datetime
 from io import BytesIO 
 
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload 
 
 import smtplib
@@ -15,6 +14,8 @@ from email.mime.multipart import MIMEMultipart
 
 from fpdf import FPDF 
 
+from modules.google_services import get_service
+
 SERVICE_ACCOUNT_FILE_DRIVE = "service_account.json" 
 SCOPES_DRIVE_UPLOAD = ["https://www.googleapis.com/auth/drive.file"] 
 TARGET_DRIVE_FOLDER_ID = "1dVWzdM35SKt2l967SAFhVEGgMpyI61IW" 
@@ -33,14 +34,15 @@ def create_submission_zip(event_name: str,
                           invoice_files: list, 
                           settlement_form_file,
                           experience_report_content: bytes, 
-                          experience_report_filename: str = "Erfahrungsbericht.docx"
+                          experience_report_filename: str = "Erfahrungsbericht.docx",
+                          output_dir: str = "output"
                           ) -> str | None:
     safe_event_name = "".join(x for x in event_name if x.isalnum() or x in " _-").strip().replace(" ", "_")
     if not safe_event_name: safe_event_name = "Abrechnung"
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     zip_filename_base = f"Abrechnung_{safe_event_name}_{timestamp}.zip"
-    zip_filepath = os.path.join("output", zip_filename_base) 
-    os.makedirs("output", exist_ok=True)
+    zip_filepath = os.path.join(output_dir, zip_filename_base)
+    os.makedirs(output_dir, exist_ok=True)
     try:
         with zipfile.ZipFile(zip_filepath, 'w', zipfile.ZIP_DEFLATED) as zipf:
             if participant_list_file:
@@ -73,7 +75,7 @@ def upload_zip_to_drive(zip_filepath: str, event_name_for_filename: str) -> str
         return None
     try:
         creds = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE_DRIVE, scopes=SCOPES_DRIVE_UPLOAD)
-        service = build('drive', 'v3', credentials=creds)
+        service = get_service('drive', 'v3', credentials=creds)
         drive_filename = os.path.basename(zip_filepath) 
         file_metadata = {'name': drive_filename, 'parents': [TARGET_DRIVE_FOLDER_ID]}
         media = MediaFileUpload(zip_filepath, mimetype='application/zip', resumable=True)